@@ -6,8 +6,8 @@ Submitted 19 April 2020
 import random
 from helper import validate_email_form, validate_email_registered, validate_password_size, \
     validate_name_size, validate_token, generate_hash, generate_token, generate_handle, \
-    is_used, get_user, added_user
-from data import get_data, get_id
+    remove_token, is_used, get_user, count_users, added_user
+from data import get_id, save_change, get_storage
 from error import InputError
 
 def auth_login(email, password):
@@ -54,13 +54,9 @@ def auth_logout(token):
             successfully logged out
     '''	# AccessError: token is not a valid token
     u_id = validate_token(token)
-    user = get_user('u_id', u_id)
-    is_success = False
 
     # remove token from user's tokens list
-    if token in user['tokens']:
-        user['tokens'].remove(token)
-        is_success = token not in user['tokens']
+    is_success = remove_token(u_id, token)
 
     return {
         'is_success': is_success
@@ -88,38 +84,39 @@ def auth_register(email, password, name_first, name_last):
     validate_name_size(name_first)
     validate_name_size(name_last)
 
-    # InputError: email is being used by another user
-    if is_used('email', email):
-        raise InputError(description="Email has already been registered")
-
-    data = get_data()
-
-    # generate user details
-    hashed_password = generate_hash(password)
-    u_id = get_id()['user_id']
-    handle_str = generate_handle(name_first, name_last, u_id)
-    permission_id = 2
-
-    # set permission_id of the first user to owner
-    if not data['users']:
-        permission_id = 1
-
-    user = {
-        'name_first': name_first,
-        'name_last': name_last,
-        'email': email,
-        'password': hashed_password,
-        'u_id': u_id,
-        'handle_str': handle_str,
-        'tokens': [],
-        'channel_membership': [],
-        'channel_ownership' : [],
-        'permission_id': permission_id,
-        'profile_img_url': None
-    }
-
-    added_user()
-    data['users'].append(user)
+    # Hold the storage lock until the user is stored, so the email, user ID and handle are not
+    # taken by another registration in the meantime
+    with get_storage().lock:
+        # InputError: email is being used by another user
+        if is_used('email', email):
+            raise InputError(description="Email has already been registered")
+
+        # generate user details
+        hashed_password = generate_hash(password)
+        u_id = get_id()['user_id']
+        handle_str = generate_handle(name_first, name_last, u_id)
+        permission_id = 2
+
+        # set permission_id of the first user to owner
+        if not count_users():
+            permission_id = 1
+
+        user = {
+            'name_first': name_first,
+            'name_last': name_last,
+            'email': email,
+            'password': hashed_password,
+            'u_id': u_id,
+            'handle_str': handle_str,
+            'tokens': [],
+            'channel_membership': [],
+            'channel_ownership' : [],
+            'permission_id': permission_id,
+            'profile_img_url': None
+        }
+
+        added_user()
+        save_change('users', u_id, user)
 
     # login user
     return auth_login(email, password)
@@ -140,9 +137,11 @@ def auth_passwordreset_request(email):
         return None
 
     # Reset code is generated from user_id and a random 6 digit string
-    user = get_user('email', email)
-    reset_code = str(user['u_id']) + str(random.randint(100000, 999999))
-    user['reset_code'] = reset_code
+    with get_storage().lock:
+        user = get_user('email', email)
+        reset_code = str(user['u_id']) + str(random.randint(100000, 999999))
+        user['reset_code'] = reset_code
+        save_change('users', user['u_id'], user)
 
     return {}
 
@@ -158,21 +157,15 @@ def auth_passwordreset_reset(reset_code, new_password):
     Returns:
         (dict): empty dictionary
     '''
-    user = False
-    for i in get_data()['users']:
-        try:
-            reset_code = i['reset_code']
-            if reset_code == reset_code:
-                user = i
-                break
-        except KeyError as e:
-            pass
-
-    if not user:
-        raise InputError(description='Invalid reset code')
-
-    validate_password_size(new_password)
-
-    user['password'] = generate_hash(new_password)
+    with get_storage().lock:
+        user = get_user('reset_code', reset_code) if reset_code is not None else False
+        if not user:
+            raise InputError(description='Invalid reset code')
+
+        validate_password_size(new_password)
+
+        user['password'] = generate_hash(new_password)
+        del user['reset_code']
+        save_change('users', user['u_id'], user)
 
     return {}
@@ -5,9 +5,10 @@ Submitted 19 April 2020
 '''
 from helper import validate_token, validate_channel, validate_member, validate_user, \
     validate_start, validate_public_channel, validate_permission, \
-    get_channel, get_channel_members, get_channel_owners, get_user, get_channel_messages, \
+    get_channel, get_user, get_channel_page, get_channel_range, get_member_profile, \
     existing_owner, add_member, set_react_state
-from data import get_data
+from data import save_change, get_storage, PAGE_SIZE
+from error import InputError
 
 def channel_invite(token, channel_id, u_id):
     '''
@@ -61,57 +62,102 @@ def channel_details(token, channel_id):
 
     return {
         'name': channel['name'],
-        'all_members': channel['all_members'],
-        'owner_members': channel['owner_members']
+        'all_members': [get_member_profile(i) for i in channel['all_members']],
+        'owner_members': [get_member_profile(i) for i in channel['owner_members']]
     }
 
-def channel_messages(token, channel_id, start):
+def channel_messages(token, channel_id, start=0, before=None, after=None, limit=None):
     '''
-    Returns up to 50 messages of the specified channel from a start index.
+    Returns a page of up to limit messages of the specified channel, newest first, from a start
+    index counted back from the newest message, or from a message ID cursor. A cursor stays in
+    place while messages are sent and removed.
 
     Parameters:
         token (str): user's authorisation key
         channel_id (str): channel ID
         start (int): the index of the first message to be returned
+        before (str or None): message ID cursor, returns the messages sent before it
+        after (str or None): message ID cursor, returns the messages sent after it
+        limit (str or None): the most messages to return, no more than PAGE_SIZE, which is
+            the default
 
     Returns:
         (dict of str: list, str: int): dictionary containing the relevant messages (list of
-            str) and the start and end message indices (int)
+            str), the start and end message indices (int) and the message ID to pass as the
+            same cursor for the next page (int), with end and next -1 if there are no more
+            messages
     '''
     # Convert input into appropriate type
     channel_id = int(channel_id)
+    start = int(start)
+    before = int(before) if before is not None else None
+    after = int(after) if after is not None else None
+    limit = int(limit) if limit is not None else PAGE_SIZE
 
     # Check for errors
     u_id = validate_token(token)
     validate_channel(channel_id)
     validate_member(u_id, channel_id)
     validate_start(channel_id, start)
+    if before is not None and after is not None:
+        raise InputError(description="Only one of before and after can be given")
+    if limit <= 0:
+        raise InputError(description="Limit must be positive")
+    if limit > PAGE_SIZE:
+        raise InputError(description=f"Limit must be at most {PAGE_SIZE}")
+
+    # Get the page of messages, newest first
+    messages, more = get_channel_page(channel_id, limit, start, before, after)
+    end = start + limit if more else -1
+
+    # The next page continues from the oldest message, or the newest when paging forwards
+    cursor = -1
+    if more and messages:
+        cursor = messages[0].message_id if after is not None else messages[-1].message_id
 
     # Set state of message reacts
-    set_react_state(u_id)
-
-    # Get channel messages
-    messages = get_channel_messages(channel_id)
-
-    # Store the first 50 messages from the start in a list
-    returned_messages = []
-    end = start + 50
-
-    i = 0
-    while i <= 50:
-        try:
-            returned_messages.append(messages[i])
-        except IndexError:
-            end = -1
-            break
-        i += 1
+    returned_messages = set_react_state(u_id, messages)
 
     return {
         'messages': returned_messages,
         'start': start,
-        'end': end
+        'end': end,
+        'next': cursor
     }
 
+def channel_messages_range(token, channel_id, time_start=None, time_end=None):
+    '''
+    Returns every message of the specified channel sent between two times, inclusive, oldest
+    first. The window is found by binary search on the time messages were sent, so only the
+    messages in it are read, and each is only converted to a dictionary as the result is read,
+    so the window can be streamed to the client.
+
+    Parameters:
+        token (str): user's authorisation key
+        channel_id (str): channel ID
+        time_start (str or None): unix timestamp, None from the first message
+        time_end (str or None): unix timestamp, None to the last message
+
+    Returns:
+        (dict of str: iterator): dictionary containing the messages in the window (iterator of
+            dict)
+    '''
+    # Convert input into appropriate type
+    channel_id = int(channel_id)
+    time_start = int(time_start) if time_start is not None else None
+    time_end = int(time_end) if time_end is not None else None
+
+    # Check for errors
+    u_id = validate_token(token)
+    validate_channel(channel_id)
+    validate_member(u_id, channel_id)
+    if time_start is not None and time_end is not None and time_start > time_end:
+        raise InputError(description="Start time must not be after end time")
+
+    messages = get_channel_range(channel_id, time_start, time_end)
+
+    return {'messages': (message.to_dict(u_id) for message in messages)}
+
 def channel_leave(token, channel_id):
     '''
     Removes a user from the specified channel.
@@ -132,14 +178,18 @@ def channel_leave(token, channel_id):
     validate_member(u_id, channel_id)
 
     # Remove user from channel members
-    members = get_channel_members(channel_id)
-    member = next(i for i in members if i['u_id'] == u_id)
-    members.remove(member)
+    save_change('all_members', (channel_id, u_id), None)
 
     # Remove user for channel owners, if applicable
-    owners = get_channel_owners(channel_id)
-    owner = next(i for i in owners if i['u_id'] == u_id)
-    owners.remove(owner)
+    save_change('owner_members', (channel_id, u_id), None)
+
+    # Remove channel from user's channels
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
+        for channels in (user['channel_membership'], user['channel_ownership']):
+            if channel_id in channels:
+                channels.remove(channel_id)
+        save_change('users', u_id, user)
 
     return {}
 
@@ -191,21 +241,15 @@ def channel_addowner(token, channel_id, u_id):
     existing_owner(u_id, channel_id)
     validate_permission(auth_u_id, channel_id)
 
-    user = get_user('u_id', u_id)
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
 
-    # Add member to owners of channel
-    get_channel_owners(channel_id).append({
-        'u_id': user['u_id'],
-        'name_first': user['name_first'],
-        'name_last': user['name_last'],
-        'profile_img_url': user['profile_img_url'],
-    })
+        # Update user data
+        user['channel_ownership'].append(channel_id)
 
-    # Update user data
-    user['channel_ownership'].append({
-        'channel_id': channel_id,
-        'name': get_data()['channels'][channel_id]['name']
-    })
+        # Add member to owners of channel
+        save_change('owner_members', (channel_id, u_id), u_id)
+        save_change('users', u_id, user)
 
     return {}
 
@@ -230,14 +274,12 @@ def channel_removeowner(token, channel_id, u_id):
     validate_user(u_id)
     validate_permission(auth_u_id, channel_id)
 
-    # Remove user from list of owners
-    owners = get_channel_owners(channel_id)
-    user = next(i for i in owners if i['u_id'] == u_id)
-    owners.remove(user)
-
     # Remove channel from user's channel_ownership
-    user = get_user('u_id', u_id)
-    channel = next(i for i in user['channel_ownership'] if i['channel_id'] == channel_id)
-    user['channel_ownership'].remove(channel)
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
+        user['channel_ownership'].remove(channel_id)
+
+        save_change('owner_members', (channel_id, u_id), None)
+        save_change('users', u_id, user)
 
     return {}
@@ -7,12 +7,15 @@ from datetime import datetime
 import pytest
 from error import AccessError, InputError
 from channel import channel_addowner, channel_details, channel_invite, channel_join, \
-    channel_leave, channel_messages, channel_removeowner
+    channel_leave, channel_messages, channel_messages_range, channel_removeowner
 from auth import auth_register
 from channels import channels_create
 from helper import get_user, get_channel_members, get_channel_owners
-from message import message_send
-from other import workplace_reset
+from message import message_send, message_remove
+from user import user_profile_setname
+from other import workplace_reset, search
+from data import save_change, PAGE_SIZE
+from records import Message, new_message_id
 
 INVALID = 1024
 
@@ -38,13 +41,8 @@ def test_channel_invite_valid():
     assert channel_invite(user1['token'], private['channel_id'], user2['u_id']) == {}
 
     # Check data structure
-    assert get_channel_members(public['channel_id']) == [
-        {'u_id': 1, 'name_first': 'Aang', 'name_last': 'Airbender', 'profile_img_url': None},
-        {'u_id': 2, 'name_first': 'Katara', 'name_last': 'Waterbender', 'profile_img_url': None}
-    ]
-    assert get_channel_owners(public['channel_id']) == [
-        {'u_id': 1, 'name_first': 'Aang', 'name_last': 'Airbender', 'profile_img_url': None}
-    ]
+    assert get_channel_members(public['channel_id']) == [1, 2]
+    assert get_channel_owners(public['channel_id']) == [1]
 
 def test_channel_invite_invalid():
     '''
@@ -147,6 +145,21 @@ def test_channel_details_valid():
         ],
     }
 
+def test_channel_details_profile_updated():
+    '''
+    Tests channel_details shows members' current profiles after they are changed.
+    '''
+    # Reset all data and register user
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+
+    user_profile_setname(user1['token'], 'Avatar', 'Aang')
+
+    details = channel_details(user1['token'], public['channel_id'])
+    assert details['all_members'][0]['name_first'] == 'Avatar'
+    assert details['owner_members'][0]['name_last'] == 'Aang'
+
 def test_channel_details_invalid():
     '''
     Tests channel_details for invalid cases.
@@ -211,7 +224,8 @@ def test_channel_messages_valid():
             }
         ],
         'start': 0,
-        'end': -1
+        'end': -1,
+        'next': -1
     }
 
 def test_channel_messages_valid_complex():
@@ -247,11 +261,115 @@ def test_channel_messages_valid_complex():
 
     # Check return value of the function
     assert channel_messages(user1['token'], public['channel_id'], 0) == {
-        'messages': messages,
+        'messages': messages[:50],
         'start': 0,
-        'end': 50
+        'end': 50,
+        'next': messages[49]['message_id']
+    }
+    assert channel_messages(user1['token'], public['channel_id'], 50) == {
+        'messages': messages[50:],
+        'start': 50,
+        'end': -1,
+        'next': -1
     }
 
+def test_channel_messages_cursor():
+    '''
+    Tests channel_messages for pages found from a message ID cursor.
+    '''
+    # Reset all data and register users
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    message_ids = [message_send(user1['token'], public['channel_id'], str(i))['message_id']
+                   for i in range(120)]
+
+    # Paging back from the newest message reaches every message once
+    pages = [channel_messages(user1['token'], public['channel_id'], 0)]
+    while pages[-1]['next'] != -1:
+        pages.append(channel_messages(user1['token'], public['channel_id'], 0,
+                                      before=pages[-1]['next']))
+    assert [len(page['messages']) for page in pages] == [50, 50, 20]
+    assert [message['message_id'] for page in pages for message in page['messages']] == \
+        message_ids[::-1]
+
+    # Paging forwards from a cursor is unaffected by removed messages
+    message_remove(user1['token'], message_ids[10])
+    page = channel_messages(user1['token'], public['channel_id'], 0, after=message_ids[5])
+    assert [message['message_id'] for message in page['messages']] == \
+        (message_ids[6:10] + message_ids[11:57])[::-1]
+    assert page['next'] == message_ids[56]
+
+    with pytest.raises(InputError):
+        channel_messages(user1['token'], public['channel_id'], 0, message_ids[1], message_ids[0])
+
+def test_channel_messages_limit():
+    '''
+    Tests channel_messages for pages of a given size, which may not exceed PAGE_SIZE.
+    '''
+    # Reset all data and register users
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    message_ids = [message_send(user1['token'], public['channel_id'], str(i))['message_id']
+                   for i in range(12)]
+
+    page = channel_messages(user1['token'], public['channel_id'], 2, limit='5')
+    assert [message['message_id'] for message in page['messages']] == message_ids[9:4:-1]
+    assert page['end'] == 7
+    page = channel_messages(user1['token'], public['channel_id'], 0, before=page['next'],
+                            limit=10)
+    assert [message['message_id'] for message in page['messages']] == message_ids[4::-1]
+    assert page['end'] == -1 and page['next'] == -1
+
+    for limit in (0, -1, PAGE_SIZE + 1):
+        with pytest.raises(InputError):
+            channel_messages(user1['token'], public['channel_id'], 0, limit=limit)
+
+def test_channel_messages_range():
+    '''
+    Tests channel_messages_range returns the messages sent within a time window, which also
+    bounds search.
+    '''
+    # Reset all data and register users
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    user2 = auth_register('katara@gmail.com', 'ILoveWater', 'Katara', 'Waterbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+
+    # Send a message every ten seconds
+    message_ids = [None]
+    for i in range(30):
+        time_created = 1587000000 + 10 * i
+        message_ids.append(new_message_id(public['channel_id'], time_created, message_ids[-1]))
+        save_change('messages', (public['channel_id'], message_ids[-1]),
+                    Message(message_ids[-1], user1['u_id'], f"Message {i}", time_created))
+    message_ids = message_ids[1:]
+    message_remove(user1['token'], message_ids[12])
+
+    result = channel_messages_range(user1['token'], public['channel_id'], 1587000100,
+                                    '1587000155')
+    assert [message['message_id'] for message in result['messages']] == \
+        message_ids[10:12] + message_ids[13:16]
+    result = channel_messages_range(user1['token'], public['channel_id'], time_end=1587000005)
+    assert [message['message'] for message in result['messages']] == ['Message 0']
+    assert len(list(channel_messages_range(user1['token'], public['channel_id'])['messages'])) \
+        == 29
+    assert not list(channel_messages_range(user1['token'], public['channel_id'],
+                                           1587001000)['messages'])
+
+    messages = search(user1['token'], 'Message', time_start=1587000100, time_end=1587000155)
+    assert [message['message_id'] for message in messages['messages']] == \
+        (message_ids[10:12] + message_ids[13:16])[::-1]
+    messages = search(user1['token'], 'Message 2', 2, time_end=1587000250)
+    assert [message['message'] for message in messages['messages']] == \
+        ['Message 25', 'Message 24']
+
+    with pytest.raises(InputError):
+        channel_messages_range(user1['token'], public['channel_id'], 1587000100, 1587000000)
+    with pytest.raises(AccessError):
+        channel_messages_range(user2['token'], public['channel_id'])
+
 def test_channel_messages_invalid():
     '''
     Tests channel_messages for invalid cases.
@@ -348,13 +466,8 @@ def test_channel_join_valid():
     assert channel_join(user2['token'], public['channel_id']) == {}
 
     # Check data structure
-    assert get_channel_members(public['channel_id']) == [
-        {'u_id': 1, 'name_first': 'Aang', 'name_last': 'Airbender', 'profile_img_url': None},
-        {'u_id': 2, 'name_first': 'Katara', 'name_last': 'Waterbender', 'profile_img_url': None}
-        ]
-    assert get_channel_owners(public['channel_id']) == [
-        {'u_id': 1, 'name_first': 'Aang', 'name_last': 'Airbender', 'profile_img_url': None}
-        ]
+    assert get_channel_members(public['channel_id']) == [1, 2]
+    assert get_channel_owners(public['channel_id']) == [1]
 
 def test_channel_join_invalid():
     '''
@@ -408,20 +521,13 @@ def test_channel_addowner_valid():
     assert channel_addowner(user2['token'], public['channel_id'], user3['u_id']) == {}
 
     # Check data structure
-    assert get_channel_owners(public['channel_id']) == [
-        {'u_id': 2, 'name_first': 'Katara', 'name_last': 'Waterbender', 'profile_img_url': None},
-        {'u_id': 3, 'name_first': 'Zuko', 'name_last': 'Firebender', 'profile_img_url': None}
-    ]
+    assert get_channel_owners(public['channel_id']) == [2, 3]
 
     # Check function return value for Slackr owner promoting a member
     assert channel_addowner(user1['token'], public['channel_id'], user4['u_id']) == {}
 
     # Check data structure
-    assert get_channel_owners(public['channel_id']) == [
-        {'u_id': 2, 'name_first': 'Katara', 'name_last': 'Waterbender', 'profile_img_url': None},
-        {'u_id': 3, 'name_first': 'Zuko', 'name_last': 'Firebender', 'profile_img_url': None},
-        {'u_id': 4, 'name_first': 'Toph', 'name_last': 'Earthbender', 'profile_img_url': None}
-    ]
+    assert get_channel_owners(public['channel_id']) == [2, 3, 4]
 
 def test_channel_addowner_invalid():
     '''
@@ -490,18 +596,13 @@ def test_channel_removeowner_valid():
     assert channel_removeowner(user2['token'], public['channel_id'], user4['u_id']) == {}
 
     # Check data structure
-    assert get_channel_owners(public['channel_id']) == [
-        {'u_id': 2, 'name_first': 'Katara', 'name_last': 'Waterbender', 'profile_img_url': None},
-        {'u_id': 3, 'name_first': 'Zuko', 'name_last': 'Firebender', 'profile_img_url': None}
-        ]
+    assert get_channel_owners(public['channel_id']) == [2, 3]
 
     # Check function return value for Slackr owner demoting a member
     assert channel_removeowner(user1['token'], public['channel_id'], user3['u_id']) == {}
 
     # Check data structure
-    assert get_channel_owners(public['channel_id']) == [
-        {'u_id': 2, 'name_first': 'Katara', 'name_last': 'Waterbender', 'profile_img_url': None}
-        ]
+    assert get_channel_owners(public['channel_id']) == [2]
 
     # Check function return value for channel owner demoting themself
     assert channel_removeowner(user2['token'], public['channel_id'], user2['u_id']) == {}
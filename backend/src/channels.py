@@ -4,8 +4,8 @@ By H09A-PADTHAI
 Submitted 19 April 2020
 '''
 from helper import validate_token, validate_channel_name_size, get_user, added_channel,\
-    get_channel_members
-from data import get_data, get_id
+    get_channels, get_user_channels
+from data import get_id, save_change, get_storage
 
 def channels_create(token, name, is_public):
     '''
@@ -24,56 +24,41 @@ def channels_create(token, name, is_public):
     u_id = validate_token(token)
     validate_channel_name_size(name)
 
-    # Create channel dictionary
-    user = get_user('u_id', u_id)
-    channels = get_data()['channels']
-    channel_id = get_id()['channel_id']
-
-    channels[channel_id] = {
-        'name' : name,
-        'all_members': [{
-            'u_id': user['u_id'],
-            'name_first': user['name_first'],
-            'name_last': user['name_last'],
-            'profile_img_url': user['profile_img_url']
-        }],
-        'owner_members' :[{
-            'u_id': user['u_id'],
-            'name_first': user['name_first'],
-            'name_last': user['name_last'],
-            'profile_img_url': user['profile_img_url']
-        }],
-        'is_public': is_public,
-        'standup': {
-            'is_active' : False,
-            'time_finish' : None,
-            'u_id' : None,
-            'messages' : ""
-        },
-        'hangman': {
-            'word': None,
-            'display': [],
-            'guesses': '',
-            'strikes': 0,
-            'message': None
-        },
-    }
-
-    # Update user data structure
-    user['channel_membership'].append({
-        'channel_id': channel_id,
-        'name': name
-    })
-    user['channel_ownership'].append({
-        'channel_id': channel_id,
-        'name': name
-    })
-
-    # Update message data structure
-    get_data()['messages'][int(channel_id)] = []
-
-    # Update channel data structure
-    added_channel()
+    # Hold the storage lock until the channel is stored, so its ID is not taken in the meantime
+    with get_storage().lock:
+        # Create channel dictionary
+        user = get_user('u_id', u_id)
+        channel_id = get_id()['channel_id']
+
+        channel = {
+            'name' : name,
+            'all_members': [u_id],
+            'owner_members' : [u_id],
+            'is_public': is_public,
+            'standup': {
+                'is_active' : False,
+                'time_finish' : None,
+                'u_id' : None,
+                'messages' : ""
+            },
+            'hangman': {
+                'word': None,
+                'display': [],
+                'guesses': '',
+                'strikes': 0,
+                'message': None
+            },
+        }
+
+        # Update user data structure
+        user['channel_membership'].append(channel_id)
+        user['channel_ownership'].append(channel_id)
+
+        save_change('channels', channel_id, channel)
+        save_change('users', u_id, user)
+
+        # Update channel data structure
+        added_channel()
 
     return {
         'channel_id': channel_id,
@@ -93,19 +78,11 @@ def channels_list(token):
     # Check for errors
     u_id = validate_token(token)
 
-    # Create list to store channel dictionaries
-    channel_list = []
-
-    # Append channel details to list if user is a member
-    channels = get_data()['channels']
-    for channel in channels:
-        is_member = next((user for user in channels[channel]['all_members'] \
-            if user['u_id'] == u_id), False)
-        if is_member:
-            channel_list.append({
-                'channel_id': channel,
-                'name': channels[channel]['name']
-            })
+    # Create list of the channels the user is a member of
+    channel_list = [{
+        'channel_id': channel_id,
+        'name': name
+    } for channel_id, name in get_user_channels(u_id)]
 
     return {'channels': channel_list}
 
@@ -125,18 +102,17 @@ def channels_listall(token):
 
     user = get_user('u_id', u_id)
 
-    # Create list to store channel dictionaries
-    channel_list = []
-
-    # Append channel details to list
-    channels = get_data()['channels']
-    for channel in channels:
-        members = get_channel_members(channel)
-        member = next((i for i in members if i['u_id'] == u_id), False)
-        if user['permission_id'] == 1 or channels[channel]['is_public'] or member:
-            channel_list.append({
-                'channel_id': channel,
-                'name': channels[channel]['name']
-            })
+    # Owners of Slackr see every channel, other users see public channels and their own
+    if user['permission_id'] == 1:
+        channels = get_channels()
+        channel_list = [{
+            'channel_id': channel_id,
+            'name': channels[channel_id]['name']
+        } for channel_id in channels]
+    else:
+        channel_list = [{
+            'channel_id': channel_id,
+            'name': name
+        } for channel_id, name in get_user_channels(u_id, public=True)]
 
     return {'channels': channel_list}
@@ -145,19 +145,8 @@ def test_channels_create_valid():
     assert get_data()['channels'] == {
         1: {
             'name': 'TestChannel',
-            'all_members': [{
-                'u_id': 1,
-                'name_first': 'M',
-                'name_last': 'L',
-                'profile_img_url':
-                None
-            }],
-            'owner_members': [{
-                'u_id': 1,
-                'name_first': 'M',
-                'name_last': 'L',
-                'profile_img_url': None
-            }],
+            'all_members': [1],
+            'owner_members': [1],
             'is_public': True,
             'standup': {
                 'is_active': False,
@@ -175,18 +164,8 @@ def test_channels_create_valid():
         },
         2: {
             'name': 'TopSecretChannel',
-            'all_members': [{
-                'u_id': 1,
-                'name_first': 'M',
-                'name_last': 'L',
-                'profile_img_url': None
-            }],
-            'owner_members': [{
-                'u_id': 1,
-                'name_first': 'M',
-                'name_last': 'L',
-                'profile_img_url': None
-            }],
+            'all_members': [1],
+            'owner_members': [1],
             'is_public': False,
             'standup': {
                 'is_active': False,
@@ -19,32 +19,28 @@ USERS
     'password': password,
     'u_id': u_id,
     'handle_str': handle_str,
-    'token': token,
-    'channel_membership': [{
-        'channel_id': channel_id
-        'name': channel name
-    }],
-    'channel_ownership' : [],
+    'tokens': [token],                      # active tokens, oldest first, at most SESSION_LIMIT
+    'channel_membership': [channel_id],     # channel IDs of channels the user is a member of
+    'channel_ownership' : [channel_id],     # channel IDs of channels the user owns
     'permission_id': permission_id,
     'profile_img_url': profile_img_url,
+    'reset_code': reset_code,               # only while a password reset is requested
+    'keywords': [keyword],                  # only once the user has subscribed to a keyword
+    'alerts': [{                            # only once a keyword has been found, oldest first,
+        'message_id': message_id,           #   at most ALERT_LIMIT
+        'channel_id': channel_id,
+        'u_id': u_id,                       # user ID of the sender
+        'keywords': [keyword],              # the user's keywords found in the message
+        'time_created': unix timestamp,
+    }],
 }]
 
 CHANNELS
 {
     channel_id : {
         'name': channelname,
-        'all_members': [{
-            'u_id': u_id
-            'name_first': firstname,
-            'name_last': lastname
-            'profile_img_url': profile_img_url,
-        }],
-        'owner_members': [{
-            'u_id': u_id
-            'name_first': firstname,
-            'name_last': lastname
-            'profile_img_url': profile_img_url,
-        }],
+        'all_members': [u_id],      # user IDs of members, see helper.get_member_profile
+        'owner_members': [u_id],    # user IDs of owners
         'is_public' : is_public,
         'standup': {
             'is_active' : False,
@@ -63,6 +59,13 @@ CHANNELS
 }
 
 MESSAGES
+Each message is stored as a Message record (see records.py), which returns the message dictionary
+below from to_dict with 'is_this_user_reacted' set for the user viewing it. A channel's messages
+are listed oldest first.
+Message IDs encode the channel the message was sent to and the time it was sent, see
+records.new_message_id. The last ID issued in each channel is read from its newest message, and
+is kept in ID under records.last_message_key when the newest message is removed, so the ID of a
+removed message is never issued again.
 {
     channel_id : [{
         'message_id': MESSAGE,
@@ -77,32 +80,184 @@ MESSAGES
         'is_pinned' : False
     }]
 }
+
+PERSISTENCE
+DATA and ID are held by a storage engine (see storage.py) and every change to them is made
+through save_change as a (table, key, value) record. The engine is chosen by the SLACKR_STORAGE
+environment variable:
+    dict        DATA held in memory, persisted by pickle snapshots and a mutation log (default).
+                Message lists are loaded per channel on first access and the least recently
+                used are evicted once more than MESSAGE_CACHE_SIZE messages are held. A
+                channel's trigram index is built by its first search and the least recently
+                searched are discarded once they hold more than TEXT_INDEX_SIZE postings.
+                Removed messages are left as tombstones until more than COMPACTION_RATIO of
+                their channel's list is removed, when the datastore thread compacts it.
+    sqlite      DATA held in a SQLite database (data.sqlite3), loading only the rows a request
+                needs. Data stored by the dict engine is imported the first time it is used.
+The SLACKR_SEARCH_WORKERS environment variable sets the number of processes the dict engine uses
+to search large unloaded histories (SEARCH_WORKERS), by default none. The processes are started
+with the engine, when this module is imported.
 '''
-import pickle
+import os
 from time import sleep
-
-with open("data_file.pickle", "rb") as FILE:
-    DATA = pickle.load(FILE)
-
-with open("id_file.pickle", "rb") as FILE:
-    ID = pickle.load(FILE)
+from storage import DictStorage, SqliteStorage
+from search_cache import SearchCache
 
 SECRET = 'oursecret'
 DATASTORE_INTERVAL = 5
 
+STORAGE_ENGINE = os.environ.get('SLACKR_STORAGE', 'dict')
+
+DATA_FILE = 'data_file.pickle'
+ID_FILE = 'id_file.pickle'
+LOG_FILE = 'data_log.pickle'
+SNAPSHOT_DIR = 'snapshots'
+SQLITE_FILE = 'data.sqlite3'
+
+# Size in bytes the mutation log may reach before it is compacted into a checkpoint
+CHECKPOINT_SIZE = 1024 * 1024
+
+# Whether the dict engine syncs each mutation log record to disk before the change returns,
+# otherwise records are only flushed to the operating system, surviving a crash of the server
+# but not of the machine
+LOG_SYNC = True
+
+# 'fork' serialises snapshots in a child process holding a copy-on-write view of the data,
+# 'inline' serialises them in the calling thread
+SNAPSHOT_MODE = 'fork' if hasattr(os, 'fork') else 'inline'
+
+# Number of messages returned by each page of channel_messages, and of search by default
+PAGE_SIZE = 50
+
+# Most messages a single page of search may return
+SEARCH_LIMIT = 10 * PAGE_SIZE
+
+# Seconds a session may go unused before its token expires, each use extending it again
+TOKEN_TTL = 24 * 60 * 60
+
+# Number of tokens a user may hold at once, logging in again ends the oldest session
+SESSION_LIMIT = 10
+
+# Seconds between sweeps removing expired tokens
+SESSION_SWEEP_INTERVAL = 60
+
+# Number of messages the dict engine keeps in memory before evicting the least recently used
+# channels' message lists to their snapshot files
+MESSAGE_CACHE_SIZE = 100000
+
+# Number of postings, each a message ID held under one of its trigrams, the dict engine keeps in
+# the trigram indexes of searched channels before discarding the least recently searched
+TEXT_INDEX_SIZE = 2000000
+
+# Fraction of a channel's message list the dict engine lets be tombstones of removed messages
+# before the datastore thread compacts the list
+COMPACTION_RATIO = 0.25
+
+# Number of processes the dict engine searches unloaded channels' shards with, 0 to search them
+# in the request thread, and the total size in bytes of those shards a search must reach before
+# it is divided between the processes
+SEARCH_WORKERS = int(os.environ.get('SLACKR_SEARCH_WORKERS', 0))
+PARALLEL_SEARCH_SIZE = 4 * 1024 * 1024
+
+# Number of search results kept for repeated searches, each valid until one of the channels it
+# was found in changes
+SEARCH_CACHE_SIZE = 1024
+
+# Number of keywords a user may subscribe to, the longest a keyword may be, and the number of
+# alerts kept in each user's alert feed
+KEYWORD_LIMIT = 20
+KEYWORD_SIZE = 50
+ALERT_LIMIT = 100
+
+def create_dict_storage():
+    '''
+    Creates the dictionary storage engine from the pickle files.
+    '''
+    return DictStorage(DATA_FILE, ID_FILE, LOG_FILE, SNAPSHOT_DIR, CHECKPOINT_SIZE, SNAPSHOT_MODE,
+                       MESSAGE_CACHE_SIZE, COMPACTION_RATIO, SEARCH_WORKERS, PARALLEL_SEARCH_SIZE,
+                       TEXT_INDEX_SIZE, LOG_SYNC)
+
+def create_storage(engine):
+    '''
+    Creates the storage engine of the given name.
+
+    Parameters:
+        engine (str): 'dict' or 'sqlite'
+
+    Returns:
+        (DictStorage or SqliteStorage): storage engine
+    '''
+    if engine == 'dict':
+        dict_storage = create_dict_storage()
+        dict_storage.start_search_pool()
+        return dict_storage
+    if engine == 'sqlite':
+        sqlite_storage = SqliteStorage(SQLITE_FILE)
+        # The pickle files are only loaded to import them into a new database
+        if sqlite_storage.is_empty():
+            dict_storage = create_dict_storage()
+            sqlite_storage.import_data(dict_storage.get_data(), dict_storage.get_ids())
+        return sqlite_storage
+    raise ValueError(f"Unknown storage engine: {engine}")
+
+def get_storage():
+    '''
+    Returns global variable for the storage engine.
+    '''
+    global STORAGE
+    return STORAGE
+
+def set_storage(storage):
+    '''
+    Replaces the storage engine and returns the previous one.
+    '''
+    global STORAGE
+    previous = STORAGE
+    STORAGE = storage
+    return previous
+
 def get_data():
     '''
-    Creates and returns global variable for data structure.
+    Returns the data structure held by the storage engine.
     '''
-    global DATA
-    return DATA
+    return STORAGE.get_data()
 
 def get_id():
     '''
-    Creates and returns global variable for id's.
+    Returns the id's held by the storage engine.
+    '''
+    return STORAGE.get_ids()
+
+def get_search_cache():
+    '''
+    Returns global variable for the search result cache.
     '''
-    global ID
-    return ID
+    global SEARCH_CACHE
+    return SEARCH_CACHE
+
+def get_keyword_matcher():
+    '''
+    Returns global variables for the keyword matcher, None if it must be compiled again, and the
+    version of the users' keywords it is compiled from.
+    '''
+    global KEYWORD_MATCHER, KEYWORD_VERSION
+    with STORAGE.lock:
+        return KEYWORD_MATCHER, KEYWORD_VERSION
+
+def set_keyword_matcher(matcher, version=None):
+    '''
+    Replaces the keyword matcher compiled from the given version of the users' keywords, unless
+    they have changed since. None discards the matcher and moves on to a new version, so it is
+    compiled again from the users' keywords, and a matcher still being compiled from the old
+    keywords is not kept.
+    '''
+    global KEYWORD_MATCHER, KEYWORD_VERSION
+    with STORAGE.lock:
+        if matcher is None:
+            KEYWORD_MATCHER = None
+            KEYWORD_VERSION += 1
+        elif version == KEYWORD_VERSION:
+            KEYWORD_MATCHER = matcher
 
 def get_secret():
     '''
@@ -111,22 +266,55 @@ def get_secret():
     global SECRET
     return SECRET
 
+def save_change(table, key, value):
+    '''
+    Stores a single change to the data or ID structure.
+
+    Parameters:
+        table (str): the part of the data structure that changed ('users', 'channels',
+            'all_members', 'owner_members', 'standup', 'hangman', 'messages', 'tokens' or
+            'ids')
+        key (int, str or tuple): identifies the changed entry within the table
+        value: the new value of the entry, or None if the entry was removed
+    '''
+    STORAGE.save_change(table, key, value)
+
+def reset_data():
+    '''
+    Removes all data from the storage engine.
+    '''
+    STORAGE.reset()
+
+def checkpoint(full=False):
+    '''
+    Persists the changes stored since the last checkpoint. Returns True on success.
+    '''
+    return STORAGE.checkpoint(full)
+
+def get_snapshot_stats():
+    '''
+    Returns statistics about the storage engine's most recent snapshot.
+    '''
+    return STORAGE.get_stats()
+
 def pickle_data():
     '''
-    Dumps the data and ID structures in pickle format.
+    Checkpoints the storage engine whenever its mutation log grows past CHECKPOINT_SIZE, and
+    compacts the message lists of channels with many removed messages.
     '''
-    try:
-        while True:
-            sleep(DATASTORE_INTERVAL)
-            DATA = get_data()
-            with open('data_file.pickle', 'wb') as FILE:
-                pickle.dump(DATA, FILE)
+    while True:
+        sleep(DATASTORE_INTERVAL)
+        STORAGE.compact()
+        if STORAGE.is_checkpoint_due():
+            STORAGE.checkpoint()
+
+
+STORAGE = create_storage(STORAGE_ENGINE)
+
+SEARCH_CACHE = SearchCache(SEARCH_CACHE_SIZE)
 
-            ID = get_id()
-            with open('id_file.pickle', 'wb') as FILE:
-                pickle.dump(ID, FILE)
-    except EOFError:
-        return None
+KEYWORD_MATCHER = None
+KEYWORD_VERSION = 0
 
 HANGMAN_DATA = {
     '0': '''===========''',
@@ -0,0 +1,673 @@
+'''
+Data Tests
+By H09A-PADTHAI
+Submitted 19 April 2020
+'''
+import os
+import pickle
+import threading
+import pytest
+from data import get_data, get_id, get_storage, checkpoint, get_snapshot_stats, save_change, \
+    SESSION_LIMIT, CHECKPOINT_SIZE
+from auth import auth_register, auth_login, auth_logout
+from channels import channels_create
+from channel import channel_invite, channel_join, channel_leave, channel_addowner, \
+    channel_removeowner, channel_messages
+from message import message_send, message_edit, message_remove, message_react, message_pin
+from user import user_profile_setname, user_profile_setemail, user_profile_sethandle
+from other import workplace_reset, admin_user_remove, search
+from helper import get_user, is_used, validate_token, expire_sessions, get_message, \
+    get_channel_by_message
+from error import AccessError
+from records import Message, last_message_key, get_message_time
+from storage import DictStorage, write_file, read_search_shard, search_shards, SHARD_CACHE
+
+#######################################
+#             MUTATION LOG            #
+#######################################
+
+def test_log_replay():
+    '''
+    Tests that replaying the mutation log over the checkpoint rebuilds the data structure.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    user2 = auth_register('katara@gmail.com', 'ILoveWater', 'Katara', 'Waterbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    channel_invite(user1['token'], public['channel_id'], user2['u_id'])
+    channel_addowner(user1['token'], public['channel_id'], user2['u_id'])
+
+    message1 = message_send(user1['token'], public['channel_id'], 'Hello')
+    message2 = message_send(user2['token'], public['channel_id'], 'Hi')
+    message3 = message_send(user2['token'], public['channel_id'], 'Bye')
+    message_edit(user1['token'], message1['message_id'], 'Hello there')
+    message_react(user2['token'], message1['message_id'], 1)
+    message_pin(user1['token'], message2['message_id'])
+    message_remove(user2['token'], message3['message_id'])
+    user_profile_setname(user2['token'], 'Kya', 'Waterbender')
+
+    # Nothing has been checkpointed since the reset
+    assert get_storage().read_log()
+    assert get_storage().load() == (get_data(), get_id())
+
+
+def test_log_torn_record():
+    '''
+    Tests that a record only partially written to the mutation log is ignored.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    channels_create(user1['token'], 'Public Channel', True)
+
+    expected = (get_data(), get_id())
+    size = os.path.getsize(get_storage().log_file)
+    with open(get_storage().log_file, 'ab') as log:
+        log.write(b'\x80\x04\x95')
+
+    assert get_storage().load() == expected
+    assert os.path.getsize(get_storage().log_file) == size
+
+    # Records written after the torn record was cut off are replayed
+    channels_create(user1['token'], 'Private Channel', False)
+    assert get_storage().load() == (get_data(), get_id())
+
+
+def test_legacy_files(tmp_path):
+    '''
+    Tests that data stored before shards were introduced is written to shards by the first
+    checkpoint, after which its files are renamed so they are not read again.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    channels_create(user1['token'], 'Public Channel', True)
+    data_file, id_file = tmp_path / 'data_file.pickle', tmp_path / 'id_file.pickle'
+    write_file(str(data_file), pickle.dumps({'users': get_data()['users'],
+                                             'channels': get_data()['channels'],
+                                             'messages': {}}))
+    write_file(str(id_file), pickle.dumps(get_id()))
+    paths = (str(data_file), str(id_file), str(tmp_path / 'data_log.pickle'),
+             str(tmp_path / 'snapshots'), CHECKPOINT_SIZE, 'inline', 100, 0.25)
+
+    storage = DictStorage(*paths)
+    assert storage.importing
+    assert storage.checkpoint()
+    assert not data_file.exists() and not id_file.exists()
+    assert (tmp_path / 'data_file.pickle.imported').exists()
+
+    storage = DictStorage(*paths)
+    assert not storage.importing
+    assert (storage.get_users(), storage.get_ids()) == (get_data()['users'], get_id())
+
+
+def test_checkpoint():
+    '''
+    Tests that a checkpoint stores the data structure and empties the mutation log.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    message_send(user1['token'], public['channel_id'], 'Hello')
+
+    checkpoint()
+    assert os.path.getsize(get_storage().log_file) == 0
+    assert not get_storage().read_log()
+    assert get_storage().load() == (get_data(), get_id())
+
+
+def test_checkpoint_dirty_shards():
+    '''
+    Tests that a checkpoint only rewrites the shards that changed since the last checkpoint.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    private = channels_create(user1['token'], 'Private Channel', False)
+    checkpoint()
+    assert not get_storage().dirty
+
+    # Only the message list of the channel the message was sent to is dirty
+    message_send(user1['token'], private['channel_id'], 'Hello')
+    assert get_storage().dirty == {f"messages_{private['channel_id']}"}
+
+    os.remove(get_storage().shard_path('users'))
+    os.remove(get_storage().shard_path(f"messages_{public['channel_id']}"))
+    checkpoint()
+    assert not get_storage().dirty
+    assert not os.path.exists(get_storage().shard_path('users'))
+    assert not os.path.exists(get_storage().shard_path(f"messages_{public['channel_id']}"))
+
+    # Nothing is written when nothing has changed
+    os.remove(get_storage().shard_path('ids'))
+    checkpoint()
+    assert not os.path.exists(get_storage().shard_path('ids'))
+
+
+#######################################
+#              SNAPSHOTS              #
+#######################################
+
+def test_snapshot_modes():
+    '''
+    Tests that snapshots written inline and from a forked process can both be reloaded.
+    '''
+    storage = get_storage()
+    default_mode = storage.snapshot_mode
+    modes = ['inline', 'fork'] if hasattr(os, 'fork') else ['inline']
+    for mode in modes:
+        storage.snapshot_mode = mode
+        workplace_reset()
+        user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+        public = channels_create(user1['token'], 'Public Channel', True)
+        message_send(user1['token'], public['channel_id'], 'Hello')
+
+        assert checkpoint()
+        assert not get_storage().dirty
+        assert not get_storage().read_log()
+        assert get_storage().load() == (get_data(), get_id())
+
+        stats = get_snapshot_stats()
+        assert stats['mode'] == mode
+        assert stats['size'] > 0
+        assert stats['lag'] == 0
+        assert stats['dirty'] == 0
+
+    storage.snapshot_mode = default_mode
+
+
+def test_snapshot_failure(monkeypatch):
+    '''
+    Tests that the shards of a snapshot which fails part way through are unpinned and kept
+    dirty, whatever the error.
+    '''
+    storage = get_storage()
+    default_mode = storage.snapshot_mode
+    storage.snapshot_mode = 'inline'
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    channels_create(user1['token'], 'Public Channel', True)
+    dirty = set(storage.dirty)
+
+    def write_shards(shards):
+        raise ValueError(shards)
+    monkeypatch.setattr(storage, 'write_shards', write_shards)
+    with pytest.raises(ValueError):
+        checkpoint()
+    assert not storage.pinned
+    assert storage.dirty == dirty
+    monkeypatch.undo()
+
+    assert checkpoint()
+    assert not storage.dirty
+    storage.snapshot_mode = default_mode
+
+
+def test_trim_log():
+    '''
+    Tests that records written after a snapshot was captured are kept in the mutation log.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    offset = os.path.getsize(get_storage().log_file)
+    channels_create(user1['token'], 'Public Channel', True)
+
+    get_storage().trim_log(offset)
+    assert [table for table, _, _ in get_storage().read_log()] == ['channels', 'users', 'ids']
+
+
+#######################################
+#            MESSAGE CACHE            #
+#######################################
+
+def test_message_cache_eviction():
+    '''
+    Tests that channels are evicted from the message cache once their shard is up to date, and
+    are loaded again from their shard when accessed.
+    '''
+    storage = get_storage()
+    default_size = storage.message_cache_size
+    storage.message_cache_size = 1
+
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    private = channels_create(user1['token'], 'Private Channel', False)
+    message_send(user1['token'], public['channel_id'], 'Hello')
+    message_send(user1['token'], private['channel_id'], 'Hi')
+
+    # Changed channels stay in memory until they are checkpointed
+    messages = get_data()['messages']
+    assert set(messages.loaded) == {public['channel_id'], private['channel_id']}
+
+    checkpoint()
+    assert list(messages.loaded) == [private['channel_id']]
+    assert messages[public['channel_id']][0]['message'] == 'Hello'
+    assert list(messages.loaded) == [public['channel_id']]
+
+    # Message lists are only loaded on startup once they are accessed
+    data, _ = storage.load()
+    assert not data['messages'].loaded
+    assert data['messages'] == messages
+
+    storage.message_cache_size = default_size
+
+
+def test_text_index_budget():
+    '''
+    Tests that a channel's trigram index is only built once it is searched, and is discarded once
+    the indexes pass their budget or the channel is evicted.
+    '''
+    storage = get_storage()
+    default_sizes = storage.message_cache_size, storage.text_index_size
+    storage.text_index_size = 1
+
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    private = channels_create(user1['token'], 'Private Channel', False)
+    message_send(user1['token'], public['channel_id'], 'Hello')
+    message_send(user1['token'], private['channel_id'], 'Hello there')
+    channel_messages(user1['token'], public['channel_id'], 0)
+    messages = get_data()['messages']
+    assert not messages.text_index
+
+    # Indexes are kept up to date once built, and the least recently searched is discarded once
+    # the indexes are over budget
+    search(user1['token'], 'Hello', channel_id=public['channel_id'])
+    assert list(messages.text_index) == [public['channel_id']]
+    message = message_send(user1['token'], public['channel_id'], 'Hi')
+    message_edit(user1['token'], message['message_id'], 'Hello again')
+    assert messages.text_index[public['channel_id']].size == 12
+    search(user1['token'], 'there', channel_id=private['channel_id'])
+    assert list(messages.text_index) == [private['channel_id']]
+    storage.text_index_size = default_sizes[1]
+    search(user1['token'], 'ello', channel_id=public['channel_id'])
+    assert list(messages.text_index) == [private['channel_id'], public['channel_id']]
+
+    # Evicting a channel discards its index
+    storage.message_cache_size = 1
+    checkpoint()
+    assert list(messages.text_index) == [public['channel_id']]
+    storage.message_cache_size = default_sizes[0]
+
+
+def test_message_index():
+    '''
+    Tests that messages are found by ID after they change, and in channels which have not been
+    loaded since startup.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    user2 = auth_register('katara@gmail.com', 'ILoveWater', 'Katara', 'Waterbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    private = channels_create(user1['token'], 'Private Channel', False)
+    channel_invite(user1['token'], private['channel_id'], user2['u_id'])
+    message1 = message_send(user1['token'], public['channel_id'], 'Hello')
+    message2 = message_send(user2['token'], private['channel_id'], 'Hi')
+    message3 = message_send(user2['token'], private['channel_id'], 'Bye')
+    message_react(user2['token'], message2['message_id'], 1)
+
+    message_edit(user1['token'], message1['message_id'], 'Hello there')
+    message_remove(user2['token'], message3['message_id'])
+    admin_user_remove(user1['token'], user2['u_id'])
+    assert get_message(message1['message_id'])['message'] == 'Hello there'
+    assert get_channel_by_message(message2['message_id']) == private['channel_id']
+    assert not get_message(message2['message_id']).reacts
+    assert not get_message(message3['message_id'])
+
+    # Messages are found in the channel encoded in their ID, or through the index for IDs given
+    # out by the global counter, whose channels are indexed as they are loaded
+    save_change('messages', (public['channel_id'], 1), Message(1, user1['u_id'], 'Hey', 0))
+    checkpoint()
+    data, _ = get_storage().load()
+    assert not data['messages'].loaded
+    assert data['messages'].locate(message2['message_id'])[0] == private['channel_id']
+    assert data['messages'].locate(message3['message_id']) is None
+    assert data['messages'].unindexed == {public['channel_id']}
+    assert data['messages'].locate(1)[0] == public['channel_id']
+    assert data['messages'].locate(2) is None
+    assert not data['messages'].unindexed
+
+
+def test_message_order():
+    '''
+    Tests that messages are appended to their channel oldest first, and that message lists stored
+    newest first are read oldest first.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    message_ids = [message_send(user1['token'], public['channel_id'], str(i))['message_id']
+                   for i in range(3)]
+    message_remove(user1['token'], message_ids[1])
+
+    storage = get_storage()
+    assert [i.message_id for i in storage.get_channel_messages(public['channel_id'])] == \
+        [message_ids[0], message_ids[2]]
+    assert storage.count_channel_messages(public['channel_id']) == 2
+
+    checkpoint()
+    shard = f"messages_{public['channel_id']}"
+    write_file(storage.shard_path(shard),
+               pickle.dumps(storage.get_channel_messages(public['channel_id'])[::-1]))
+    data, _ = storage.load()
+    assert [i.message_id for i in data['messages'][public['channel_id']]] == \
+        [message_ids[0], message_ids[2]]
+
+
+def test_message_tombstones():
+    '''
+    Tests that removed messages are left as tombstones which reads skip, until the channel is
+    compacted once enough of its messages are removed.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    message_ids = [message_send(user1['token'], public['channel_id'], str(i))['message_id']
+                   for i in range(8)]
+    message_remove(user1['token'], message_ids[6])
+    message_remove(user1['token'], message_ids[3])
+
+    storage = get_storage()
+    messages = get_data()['messages']
+    live = [message_ids[i] for i in (0, 1, 2, 4, 5, 7)]
+    assert len(messages.history(public['channel_id'])) == 8
+    assert [i.message_id for i in storage.get_channel_messages(public['channel_id'])] == live
+    assert storage.count_channel_messages(public['channel_id']) == 6
+    assert storage.get_last_message_id(public['channel_id']) == message_ids[7]
+    assert not get_message(message_ids[3])
+
+    # Pages skip tombstones whether found by offset or by cursor
+    page, more = storage.get_channel_page(public['channel_id'], 3, 1)
+    assert [i.message_id for i in page] == [message_ids[i] for i in (5, 4, 2)] and more
+    page, more = storage.get_channel_page(public['channel_id'], 3, before=message_ids[7])
+    assert [i.message_id for i in page] == [message_ids[i] for i in (5, 4, 2)] and more
+    page, more = storage.get_channel_page(public['channel_id'], 3, after=message_ids[2])
+    assert [i.message_id for i in page] == [message_ids[i] for i in (7, 5, 4)] and not more
+
+    # Tombstones are not stored, and are dropped once they pass the compaction ratio
+    assert not messages.compactable
+    message_remove(user1['token'], message_ids[0])
+    assert messages.compactable == {public['channel_id']}
+
+    # A search reading the list as it goes is not shifted when the list is compacted
+    found = storage.search_channel_messages(public['channel_id'], '', 10)
+    assert next(found).message_id == message_ids[7]
+    assert storage.compact() == 1
+    assert [i.message_id for i in found] == [message_ids[i] for i in (5, 4, 2, 1)]
+    assert [i.message_id for i in messages.history(public['channel_id'])] == live[1:]
+    assert not messages.tombstones and not messages.compactable
+    checkpoint()
+    data, _ = storage.load()
+    assert data['messages'] == messages
+
+
+def test_message_id_not_reissued():
+    '''
+    Tests that the ID of a removed message is not issued again once its tombstone is compacted
+    or dropped from its shard, and that messages sent at once are each given their own ID
+    within the second they were sent.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    message_ids = [message_send(user1['token'], public['channel_id'], str(i))['message_id']
+                   for i in range(2)]
+    message_remove(user1['token'], message_ids[1])
+    assert get_storage().compact() == 1
+    message_ids.append(message_send(user1['token'], public['channel_id'], '2')['message_id'])
+    assert message_ids[2] > message_ids[1]
+
+    message_remove(user1['token'], message_ids[2])
+    checkpoint()
+    data, ids = get_storage().load()
+    assert [i.message_id for i in data['messages'][public['channel_id']]] == message_ids[:1]
+    assert ids[last_message_key(public['channel_id'])] == message_ids[2]
+
+    def send_messages(sent):
+        for i in range(25):
+            sent.append(message_send(user1['token'], public['channel_id'], str(i))['message_id'])
+    sent = [[] for _ in range(4)]
+    threads = [threading.Thread(target=send_messages, args=(i,)) for i in sent]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({message_id for i in sent for message_id in i}) == 100
+    assert get_storage().count_channel_messages(public['channel_id']) == 101
+
+    # More messages than a second has IDs for wait for the next second rather than being
+    # stamped ahead of the time they were sent
+    assert all(get_message_time(message.message_id) == message.time_created
+               for message in get_data()['messages'][public['channel_id']])
+
+
+def test_parallel_search():
+    '''
+    Tests that channels which are not loaded are searched from their shards by the search
+    processes, with the same results as searching them in memory.
+    '''
+    storage = get_storage()
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    channel_ids = [channels_create(user1['token'], f"Channel {i}", True)['channel_id']
+                   for i in range(3)]
+    for i in range(30):
+        message_send(user1['token'], channel_ids[i % 3], f"Message {i}" + '!' * (i % 4 == 0))
+    expected = [[i.message_id for i in matches]
+                for matches in storage.search_messages(channel_ids, '!', 10)]
+    assert sum(len(i) for i in expected) == 8
+
+    default_size = storage.message_cache_size
+    storage.message_cache_size = 1
+    checkpoint()
+    messages = get_data()['messages']
+    assert list(messages.loaded) == [channel_ids[-1]]
+
+    storage.search_workers, storage.parallel_search_size = 2, 0
+    storage.start_search_pool()
+    pool = storage.search_pool
+    try:
+        result = [[i.message_id for i in matches]
+                  for matches in storage.search_messages(channel_ids, '!', 10)]
+        assert result == expected
+        assert list(messages.loaded) == [channel_ids[-1]]
+        result = storage.search_messages(channel_ids, 'Message', 2, u_id=user1['u_id'])
+        assert [len(list(matches)) for matches in result] == [2, 2, 2]
+        result = storage.search_messages(channel_ids, 'Message', 2, before=expected[0][-1])
+        assert [i.message_id for i in result[0]] == []
+
+        # A message sent while the shards are searched is found by searching its channel again
+        class SendingPool:
+            '''
+            Search pool sending a message before the first search is submitted.
+            '''
+            sent = False
+
+            def submit(self, *args):
+                '''
+                Sends a message if none has been sent, then submits the search to the search
+                processes.
+                '''
+                if not self.sent:
+                    message_send(user1['token'], channel_ids[0], 'Sent during the search!')
+                    self.sent = True
+                return pool.submit(*args)
+        storage.search_pool = SendingPool()
+        result = storage.search_messages(channel_ids, 'during', 10)
+        assert [len(list(matches)) for matches in result] == [1, 0, 0]
+    finally:
+        pool.shutdown()
+        storage.search_pool = None
+        storage.search_workers, storage.parallel_search_size = 0, 0
+        storage.message_cache_size = default_size
+
+
+def test_search_shard_cache():
+    '''
+    Tests that a search process keeps the message lists it has decoded until their shard is
+    replaced, within its cache size.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    channel_ids = [channels_create(user1['token'], f"Channel {i}", True)['channel_id']
+                   for i in range(2)]
+    for channel_id in channel_ids:
+        message_send(user1['token'], channel_id, 'Hello')
+    checkpoint()
+    paths = [get_storage().shard_path(f"messages_{i}") for i in channel_ids]
+
+    messages = read_search_shard(paths[0], 10)
+    assert read_search_shard(paths[0], 10) is messages
+    message_send(user1['token'], channel_ids[0], 'Hello again')
+    checkpoint()
+    assert [i.message for i in read_search_shard(paths[0], 10)] == ['Hello', 'Hello again']
+
+    # The least recently searched message lists are discarded past the cache size
+    read_search_shard(paths[1], 1)
+    assert list(SHARD_CACHE) == [paths[1]]
+    assert [[i.message for i in matches] for matches in search_shards(paths, 10, 'again', 5)] \
+        == [['Hello again'], []]
+
+
+#######################################
+#             USER INDEXES            #
+#######################################
+
+def test_user_indexes():
+    '''
+    Tests that users are found by ID, email and handle after their fields change and after they
+    are removed.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    user2 = auth_register('katara@gmail.com', 'ILoveWater', 'Katara', 'Waterbender')
+    assert get_user('email', 'katara@gmail.com')['u_id'] == user2['u_id']
+
+    user_profile_setemail(user2['token'], 'kya@gmail.com')
+    user_profile_sethandle(user2['token'], 'kya')
+    assert not get_user('email', 'katara@gmail.com')
+    assert not is_used('email', 'katara@gmail.com')
+    assert get_user('email', 'kya@gmail.com')['u_id'] == user2['u_id']
+    assert get_user('handle_str', 'kya')['u_id'] == user2['u_id']
+
+    admin_user_remove(user1['token'], user2['u_id'])
+    assert not get_user('u_id', user2['u_id'])
+    assert not get_user('handle_str', 'kya')
+    assert get_user('u_id', user1['u_id'])['email'] == 'aang@gmail.com'
+
+    # Indexes are rebuilt from the users list on startup
+    storage = get_storage()
+    storage.data, storage.ids = storage.load()
+    storage.index_users()
+    assert get_user('email', 'aang@gmail.com')['u_id'] == user1['u_id']
+    assert not get_user('email', 'kya@gmail.com')
+
+
+def test_member_sets():
+    '''
+    Tests that the member and owner sets of channels follow every change to their lists.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    user2 = auth_register('katara@gmail.com', 'ILoveWater', 'Katara', 'Waterbender')
+    user3 = auth_register('sokka@gmail.com', 'ILoveMeat', 'Sokka', 'Waterbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    private = channels_create(user1['token'], 'Private Channel', False)
+
+    channel_join(user2['token'], public['channel_id'])
+    channel_invite(user1['token'], private['channel_id'], user3['u_id'])
+    channel_addowner(user1['token'], public['channel_id'], user2['u_id'])
+    channel_addowner(user1['token'], private['channel_id'], user3['u_id'])
+    channel_removeowner(user2['token'], public['channel_id'], user1['u_id'])
+    channel_leave(user1['token'], private['channel_id'])
+    admin_user_remove(user1['token'], user3['u_id'])
+
+    storage = get_storage()
+    assert storage.is_member(user2['u_id'], public['channel_id'])
+    assert storage.is_owner(user2['u_id'], public['channel_id'])
+    assert storage.is_member(user1['u_id'], public['channel_id'])
+    assert not storage.is_owner(user1['u_id'], public['channel_id'])
+    assert not storage.is_member(user1['u_id'], private['channel_id'])
+    assert not storage.is_member(user3['u_id'], private['channel_id'])
+    assert not storage.is_owner(user3['u_id'], private['channel_id'])
+    assert storage.members == {
+        channel_id: {table: set(channel[table]) for table in ('all_members', 'owner_members')}
+        for channel_id, channel in get_data()['channels'].items()
+    }
+
+    # Channels are listed from the indexes of each member's channels and of public channels
+    assert storage.get_user_channels(user1['u_id']) == [(public['channel_id'], 'Public Channel')]
+    assert storage.get_user_channels(user2['u_id'], public=True) == \
+        [(public['channel_id'], 'Public Channel')]
+    assert not storage.get_user_channels(user3['u_id'])
+    assert storage.public_channels == {public['channel_id']}
+
+
+#######################################
+#               SESSIONS              #
+#######################################
+
+def test_sessions():
+    '''
+    Tests that each token has a session, which is verified on first use and removed on logout.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    token = auth_login('aang@gmail.com', 'ILoveAir')['token']
+
+    session = get_storage().get_session(token)
+    assert session.u_id == user1['u_id']
+    assert session.issued_at is None
+    assert validate_token(token) == user1['u_id']
+    assert session.issued_at is not None
+
+    assert auth_logout(token)['is_success']
+    assert get_storage().get_session(token) is None
+    assert get_storage().get_session(user1['token']).u_id == user1['u_id']
+    with pytest.raises(AccessError):
+        validate_token(token)
+
+
+def test_session_expiry():
+    '''
+    Tests that using a session extends it, and that expired tokens are removed when they are
+    used or swept.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    token1 = auth_login('aang@gmail.com', 'ILoveAir')['token']
+    token2 = auth_login('aang@gmail.com', 'ILoveAir')['token']
+
+    # Sessions start expiring once they are used or swept
+    assert expire_sessions() == 0
+    session = get_storage().get_session(token1)
+    expiry = session.expiry
+    validate_token(token1)
+    assert session.expiry >= expiry
+
+    session.expiry = 0
+    with pytest.raises(AccessError):
+        validate_token(token1)
+    assert token1 not in get_user('u_id', user1['u_id'])['tokens']
+
+    get_storage().get_session(token2).expiry = 0
+    assert expire_sessions() == 1
+    assert get_user('u_id', user1['u_id'])['tokens'] == [user1['token']]
+
+    # Expired tokens are removed from storage alone, and replayed from the log
+    assert ('tokens', (user1['u_id'], token2), None) in get_storage().read_log()
+    assert get_storage().load() == (get_data(), get_id())
+
+
+def test_session_limit():
+    '''
+    Tests that logging in once a user holds SESSION_LIMIT tokens ends their oldest session.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    tokens = [auth_login('aang@gmail.com', 'ILoveAir')['token'] for _ in range(SESSION_LIMIT)]
+
+    assert get_user('u_id', user1['u_id'])['tokens'] == tokens
+    with pytest.raises(AccessError):
+        validate_token(user1['token'])
+    assert all(validate_token(token) == user1['u_id'] for token in tokens)
@@ -7,6 +7,7 @@ import random
 from helper import validate_token, validate_channel, validate_member, validate_guess, \
     hangman_send, reset_hangman, get_channel_hangman
 from error import AccessError, InputError
+from data import save_change
 
 def hangman(token, channel_id):
     '''
@@ -40,6 +41,7 @@ def hangman(token, channel_id):
     # Set hidden word
     for _ in range(len(hangman_game['word'])):
         hangman_game['display'].append('_')
+    save_change('hangman', channel_id, hangman_game)
 
     return hangman_send(token, channel_id)
 
@@ -103,5 +105,6 @@ def guess(token, channel_id, new_guess):
     if hangman_game['strikes'] == 9:
         hangman_game['display'] = hangman_game['word']
         hangman_game['message'] = 'GAME OVER!'
+    save_change('hangman', channel_id, hangman_game)
 
     return hangman_send(token, channel_id)
@@ -9,8 +9,12 @@ import re
 from datetime import datetime
 from urllib import request
 import jwt
-from data import get_data, get_id, get_secret, get_hangman_data
+from data import get_id, get_secret, get_hangman_data, save_change, get_storage, \
+    get_keyword_matcher, set_keyword_matcher, TOKEN_TTL, SESSION_LIMIT, SESSION_SWEEP_INTERVAL, \
+    KEYWORD_SIZE, ALERT_LIMIT
 from error import InputError, AccessError
+from records import Message, new_message_id, get_message_time
+from text_index import KeywordMatcher
 
 #######################################
 #           RETRIEVING DATA           #
@@ -27,8 +31,27 @@ def get_user(key, value):
     Returns:
         (dict or bool): dictionary of user's data if user exists in system, otherwise false
     '''
-    users = get_data()['users']
-    return next((user for user in users if user[key] == value), False)
+    return get_storage().get_user(key, value)
+
+
+def get_users():
+    '''
+    Returns a list of all users.
+
+    Returns:
+        (list of dict): list of dictionaries of users' data
+    '''
+    return get_storage().get_users()
+
+
+def count_users():
+    '''
+    Returns the number of users in Slackr.
+
+    Returns:
+        (int): number of users
+    '''
+    return get_storage().count_users()
 
 
 def get_profile(user):
@@ -51,6 +74,25 @@ def get_profile(user):
     }
 
 
+def get_member_profile(u_id):
+    '''
+    Returns a dictionary of the user information shown in a channel's list of members.
+
+    Parameters:
+        u_id (int): user ID
+
+    Returns:
+        (dict): dictionary containing user's user ID, first and last name, and profile image
+    '''
+    user = get_user('u_id', u_id)
+    return {
+        'u_id': user['u_id'],
+        'name_first': user['name_first'],
+        'name_last': user['name_last'],
+        'profile_img_url': user['profile_img_url'],
+    }
+
+
 def get_channel(channel_id):
     '''
     Returns the channel data of the specifed channel.
@@ -61,7 +103,31 @@ def get_channel(channel_id):
     Returns:
         (dict): dictionary containing data of channel
     '''
-    return get_data()['channels'][channel_id]
+    return get_storage().get_channel(channel_id)
+
+
+def get_channels():
+    '''
+    Returns the channel data of all channels.
+
+    Returns:
+        (dict): dictionary of channel IDs to dictionaries containing data of channels
+    '''
+    return get_storage().get_channels()
+
+
+def get_user_channels(u_id, public=False):
+    '''
+    Returns the channels the specified user is a member of.
+
+    Parameters:
+        u_id (int): user ID
+        public (bool): True to also return every public channel
+
+    Returns:
+        (list of tuple): list of channel IDs (int) and names (str) in channel ID order
+    '''
+    return get_storage().get_user_channels(u_id, public)
 
 
 def get_channel_members(channel_id):
@@ -72,8 +138,7 @@ def get_channel_members(channel_id):
         channel_id (int): channel ID
 
     Returns:
-        (list of dict): list of dictionaries containing channel members' user ID (int), first
-            and last names (str)
+        (list of int): list of channel members' user IDs
     '''
     return get_channel(channel_id)['all_members']
 
@@ -86,8 +151,7 @@ def get_channel_owners(channel_id):
         channel_id (int): channel ID
 
     Returns:
-        (list of dict): list of dictionaries containing channel owners' user ID (int), first
-            and last names (str)
+        (list of int): list of channel owners' user IDs
     '''
     return get_channel(channel_id)['owner_members']
 
@@ -120,7 +184,7 @@ def get_channel_messages(channel_id):
         (list of dict): list of dictionaries containing message ID (int), user ID (int),
             time message was sent (int), message text (str), and pins (bool) and reacts (dict)
     '''
-    return get_data()['messages'][channel_id]
+    return get_storage().get_channel_messages(channel_id)
 
 
 def get_message(message_id):
@@ -133,9 +197,78 @@ def get_message(message_id):
     Returns:
         (dict or bool): dictionary of message's data if message exists in system, otherwise false
     '''
-    channel_id = get_channel_by_message(message_id)
-    messages = get_channel_messages(channel_id)
-    return next((i for i in messages if i['message_id'] == message_id), False)
+    return get_storage().get_message(message_id)
+
+
+def get_channel_page(channel_id, limit, start=0, before=None, after=None):
+    '''
+    Returns a page of the messages of the specified channel, newest first.
+
+    Parameters:
+        channel_id (int): channel ID
+        limit (int): the most messages to return
+        start (int): number of the newest messages to skip when no cursor is given
+        before (int or None): return the newest messages with IDs below this message ID
+        after (int or None): return the oldest messages with IDs above this message ID
+
+    Returns:
+        (tuple): list of messages (list of Message) and whether there are more messages beyond
+            the page (bool)
+    '''
+    return get_storage().get_channel_page(channel_id, limit, start, before, after)
+
+
+def get_channel_range(channel_id, time_start=None, time_end=None):
+    '''
+    Returns the messages of the specified channel sent between two times, inclusive, oldest
+    first.
+
+    Parameters:
+        channel_id (int): channel ID
+        time_start (int or None): unix timestamp, None from the first message
+        time_end (int or None): unix timestamp, None to the last message
+
+    Returns:
+        (iterator of Message): the messages sent in the window
+    '''
+    return get_storage().get_channel_range(channel_id, time_start, time_end)
+
+
+def search_messages(channel_ids, query_str, limit, before=None, u_id=None, time_start=None,
+                    time_end=None):
+    '''
+    Returns the messages of each of the specified channels containing the query string and
+    matching the filters, newest first.
+
+    Parameters:
+        channel_ids (list of int): channel IDs
+        query_str (str): query string to search messages
+        limit (int): the most messages to return from each channel
+        before (int or None): only return messages with IDs below this message ID
+        u_id (int or None): only return messages sent by this user
+        time_start (int or None): only return messages sent at or after this unix timestamp
+        time_end (int or None): only return messages sent at or before this unix timestamp
+
+    Returns:
+        (list of iterator of Message): the matching messages of each channel
+    '''
+    # pylint: disable=too-many-arguments
+    return get_storage().search_messages(channel_ids, query_str, limit, before, u_id,
+                                         time_start, time_end)
+
+
+def get_channel_versions(channel_ids):
+    '''
+    Returns the versions of the messages of the specified channels, which change whenever a
+    message in the channel is sent, edited, removed or reacted to.
+
+    Parameters:
+        channel_ids (list of int): channel IDs
+
+    Returns:
+        (tuple of int): the version of each channel
+    '''
+    return get_storage().get_channel_versions(channel_ids)
 
 
 # Returns channel given the message id
@@ -150,12 +283,7 @@ def get_channel_by_message(message_id):
     Returns:
         (dict): dictionary containing data of channel
     '''
-    messages = get_data()['messages']
-    for channel in messages:
-        message = next((i for i in messages[channel] if i['message_id'] == message_id), False)
-        if message:
-            return channel
-    return False
+    return get_storage().get_channel_by_message(message_id)
 
 
 #######################################
@@ -169,6 +297,8 @@ def get_channel_by_message(message_id):
 def validate_token(token):
     '''
     Raises an AccessError if the token is not active, otherwise returns the user's user ID.
+    A token is only decoded the first time its session is used, and each use keeps the session
+    alive for another TOKEN_TTL seconds.
 
     Parameters:
         token (str): user's authorisation key
@@ -176,20 +306,29 @@ def validate_token(token):
     Returns:
         (int): user's user ID
     '''
-    data = get_data()
-    secret = get_secret()
-    for user in data['users']:
-        if token in user['tokens']:
-            try:
-                decoded = jwt.decode(token, secret, algorithms=['HS256'])
-            except:
-                raise AccessError(
-                    description="Token cannot be decoded. Try logging out and back in again"
-                )
-            return decoded['u_id']
+    session = get_storage().get_session(token)
 
     # token not valid
-    raise AccessError(description="Invalid token")
+    if session is None:
+        raise AccessError(description="Invalid token")
+
+    # token expired since it was last used
+    now = time.time()
+    if session.expiry is not None and session.expiry <= now:
+        remove_token(session.u_id, token)
+        raise AccessError(description="Session has expired. Log in again")
+
+    if session.issued_at is None:
+        try:
+            decoded = jwt.decode(token, get_secret(), algorithms=['HS256'])
+        except:
+            raise AccessError(
+                description="Token cannot be decoded. Try logging out and back in again"
+            )
+        session.issued_at = decoded['time']
+
+    session.expiry = now + TOKEN_TTL
+    return session.u_id
 
 
 def validate_member(u_id, channel_id):
@@ -200,9 +339,7 @@ def validate_member(u_id, channel_id):
         u_id (int): user's user ID
         channel_id (int): channel ID
     '''
-    members = get_channel_members(channel_id)
-    member = next((i for i in members if i['u_id'] == u_id), False)
-    if not member:
+    if not get_storage().is_member(u_id, channel_id):
         raise AccessError(description=f"User {u_id} is not a member of channel {channel_id}")
 
 
@@ -305,8 +442,7 @@ def validate_channel(channel_id):
         channel_id (int): channel_id
     '''
     channel_id = int(channel_id)
-    channels = get_data()['channels']
-    is_valid = channels.get(channel_id)
+    is_valid = get_channel(channel_id)
     if is_valid:
         return None
     raise InputError(description="Invalid channel")
@@ -350,6 +486,17 @@ def validate_name_size(name):
         raise InputError(description="Names must be less than 50 characters")
 
 
+def validate_keyword_size(keyword):
+    '''
+    Raises an InputError if given keyword is not between 1 and KEYWORD_SIZE characters.
+
+    Parameters:
+        keyword (str): keyword
+    '''
+    if not is_valid_size(keyword, 1, KEYWORD_SIZE):
+        raise InputError(description=f"Keywords must be 1 to {KEYWORD_SIZE} characters")
+
+
 def validate_handle_size(handle_str):
     '''
     Raises an InputError if given handle is not between 3 and 20 characters.
@@ -405,13 +552,8 @@ def validate_message(message_id):
     Parameters:
         message_id (int): message ID
     '''
-
-    messages = get_data()['messages']
-    is_exist = False
-    for channel in messages:
-        is_exist = next((i for i in messages[channel] if i['message_id'] == message_id), False)
-        if is_exist:
-            return None
+    if get_message(message_id):
+        return None
     raise InputError(description="Message does not exist")
 
 
@@ -512,11 +654,7 @@ def is_owner(u_id, channel_id):
     Returns:
         (bool): True if user is an owner of the channel, otherwise False
     '''
-    owners = get_channel_owners(channel_id)
-    owner = next((i for i in owners if i['u_id'] == u_id), False)
-    if owner:
-        return True
-    return False
+    return get_storage().is_owner(u_id, channel_id)
 
 
 def is_used(key, value):
@@ -530,11 +668,7 @@ def is_used(key, value):
     Returns:
         (bool): True if the detail is being used by a user, otherwise False
     '''
-    users = get_data()['users']
-    for user in users:
-        if user[key] == value:
-            return True
-    return False
+    return get_storage().is_used(key, value)
 
 
 def is_valid_size(string, min_length, max_length):
@@ -566,7 +700,7 @@ def is_pinned(message_id):
         (bool): True if the message is pinned, otherwise False
     '''
     message = get_message(message_id)
-    return message['is_pinned']
+    return message.is_pinned
 
 def is_reacted(u_id, message_id, react_id):
     '''
@@ -581,23 +715,44 @@ def is_reacted(u_id, message_id, react_id):
     Returns:
         (bool): True if the user has reacted to the message, otherwise False
     '''
-    reacts = next(i for i in get_message(message_id)['reacts'] if i['react_id'] == react_id)
-    for i in reacts:
-        reacted = next((i for i in reacts['u_ids'] if i == u_id), False)
-        if reacted:
-            return True
-    return False
+    return get_message(message_id).is_reacted(u_id, react_id)
 
 #######################################
 #        OTHER HELPER FUNCTIONS       #
 #######################################
 
+def generate_message_id(channel_id, timestamp):
+    '''
+    Returns a new message ID which encodes the specified channel, following the last ID issued in
+    the channel. Channels whose ID is too large to encode take the next ID from the global
+    message ID instead. Must be called while holding the storage lock until the message is
+    stored, so no two messages are given the same ID.
+
+    Parameters:
+        channel_id (int): channel ID
+        timestamp (float): unix timestamp the message is sent at
+
+    Returns:
+        (int or None): message ID, None if the channel has used every ID of the current second,
+            so the message must wait for the next second
+    '''
+    message_id = new_message_id(channel_id, timestamp,
+                                get_storage().get_last_message_id(channel_id))
+    if message_id is None:
+        message_id = get_id()['message_id']
+        added_message()
+    elif get_message_time(message_id) == int(timestamp) + 1:
+        return None
+    return message_id
+
+
 def added_message():
     '''
     Increments the global message ID.
     '''
     ID = get_id()
     ID['message_id'] += 1
+    save_change('ids', 'message_id', ID['message_id'])
 
 
 def added_channel():
@@ -606,6 +761,7 @@ def added_channel():
     '''
     ID = get_id()
     ID['channel_id'] += 1
+    save_change('ids', 'channel_id', ID['channel_id'])
 
 
 def added_user():
@@ -614,6 +770,7 @@ def added_user():
     '''
     ID = get_id()
     ID['user_id'] += 1
+    save_change('ids', 'user_id', ID['user_id'])
 
 
 def add_member(u_id, channel_id):
@@ -625,17 +782,13 @@ def add_member(u_id, channel_id):
         channel_id (int): channel ID
     '''
 
-    user = get_user('u_id', u_id)
-    get_channel_members(channel_id).append({
-        'u_id': user['u_id'],
-        'name_first': user['name_first'],
-        'name_last': user['name_last'],
-        'profile_img_url': user['profile_img_url'],
-    })
-    user['channel_membership'].append({
-        'channel_id': channel_id,
-        'name': get_data()['channels'][channel_id]['name']
-    })
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
+        if channel_id not in user['channel_membership']:
+            user['channel_membership'].append(channel_id)
+
+        save_change('all_members', (channel_id, u_id), u_id)
+        save_change('users', u_id, user)
 
 
 def count_channel_messages(channel_id):
@@ -645,8 +798,7 @@ def count_channel_messages(channel_id):
     Parameters:
         channel_id (int): channel ID
     '''
-    messages = get_channel_messages(channel_id)
-    return len(messages)
+    return get_storage().count_channel_messages(channel_id)
 
 
 def generate_hash(password):
@@ -665,7 +817,8 @@ def generate_hash(password):
 
 def generate_token(email, password):
     '''
-    Generates a unique token for the user and adds it to their list of active tokens.
+    Generates a unique token for the user and adds it to their list of active tokens. Once the
+    user holds more than SESSION_LIMIT tokens, the oldest are removed.
 
     Parameters:
         email (str): user's email
@@ -676,22 +829,73 @@ def generate_token(email, password):
             token (str)
     '''
     secret = get_secret()
-    user = get_user('email', email)
-
-    # encode u_id in token as email can be changed
-    u_id = user['u_id']
-    information = {
-        'u_id': u_id,
-        'time': time.time(),
-        'password': password
-    }
-    encoded = jwt.encode(information, secret, algorithm='HS256')
-    token = encoded.decode('utf-8')
-    user['tokens'].append(token)
+    with get_storage().lock:
+        user = get_user('email', email)
+
+        # encode u_id in token as email can be changed
+        u_id = user['u_id']
+        information = {
+            'u_id': u_id,
+            'time': time.time(),
+            'password': password
+        }
+        encoded = jwt.encode(information, secret, algorithm='HS256')
+        token = encoded.decode('utf-8')
+        user['tokens'].append(token)
+        del user['tokens'][:-SESSION_LIMIT]
+        save_change('users', u_id, user)
 
     return token
 
 
+def remove_token(u_id, token):
+    '''
+    Removes a token from the user's list of active tokens, ending its session. Only the token
+    is removed from storage, so a change made to the user at the same time is not overwritten.
+
+    Parameters:
+        u_id (int): user's user ID
+        token (str): user's authorisation key
+
+    Returns:
+        (bool): True if the token was active, otherwise False
+    '''
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
+        if not user or token not in user['tokens']:
+            return False
+
+        save_change('tokens', (u_id, token), None)
+    return True
+
+
+def expire_sessions():
+    '''
+    Removes the tokens of sessions which have expired. Sessions which have not been used since
+    they were loaded expire TOKEN_TTL seconds after the first sweep to see them.
+
+    Returns:
+        (int): number of tokens removed
+    '''
+    now = time.time()
+    removed = 0
+    for token, session in get_storage().get_sessions():
+        if session.expiry is None:
+            session.expiry = now + TOKEN_TTL
+        elif session.expiry <= now and remove_token(session.u_id, token):
+            removed += 1
+    return removed
+
+
+def sweep_sessions():
+    '''
+    Removes expired tokens every SESSION_SWEEP_INTERVAL seconds.
+    '''
+    while True:
+        time.sleep(SESSION_SWEEP_INTERVAL)
+        expire_sessions()
+
+
 def generate_handle(name_first, name_last, u_id):
     '''
     Generates a unique handle for the specified user based on their first and last name, and
@@ -723,26 +927,19 @@ def generate_handle(name_first, name_last, u_id):
     return handle_str
 
 
-def set_react_state(u_id):
+def set_react_state(u_id, messages):
     '''
-    Sends the 'is_this_user_reacted' state of messages given the user id.
+    Returns the dictionaries of the given messages with their 'is_this_user_reacted' state set
+    for the given user id.
 
     Parameters:
         u_id (int): user's user ID
+        messages (list of Message): the messages being returned to the user
 
     Returns:
-        None
+        (list of dict): list of message dictionaries
     '''
-    # Setting state of reacts
-    messages = get_data()['messages']
-    user = get_user('u_id', u_id)
-    for channel in user['channel_membership']:
-        channel_id = channel['channel_id']
-        channel_messages = messages[channel_id]
-        for message in channel_messages:
-            message_id = message['message_id']
-            for react in message['reacts']:
-                react['is_this_user_reacted'] = is_reacted(u_id, message_id, react['react_id'])
+    return [message.to_dict(u_id) for message in messages]
 
 
 def send_message(u_id, channel_id, message):
@@ -757,31 +954,62 @@ def send_message(u_id, channel_id, message):
     Returns:
         message_id (int)
     '''
-    # Get message for new message and the existing messages in the channel
-    message_id = get_id()['message_id']
-    messages = get_channel_messages(channel_id)
-
-    # Create new message dictionary
-    new_entry = {
-        "message_id": message_id,
-        "u_id": u_id,
-        "message" : message,
-        "time_created": int(datetime.now().timestamp()),
-        'reacts': [{
-            'u_ids': [],
-            'is_this_user_reacted': False,
-            'react_id': 1
-        }],
-        "is_pinned": False
-    }
-
-    # Send message to appropriate channel
-    messages.insert(0, new_entry)
-    added_message()
+    # Get ID for new message, storing the message before the next ID can be issued, and waiting
+    # for the next second if the channel has run out of IDs for this one
+    while True:
+        with get_storage().lock:
+            timestamp = datetime.now().timestamp()
+            message_id = generate_message_id(channel_id, timestamp)
+            if message_id is not None:
+                # Create new message record
+                new_entry = Message(message_id, u_id, message, int(timestamp))
+
+                # Send message to appropriate channel
+                save_change('messages', (channel_id, message_id), new_entry)
+                break
+        time.sleep(1 - timestamp % 1)
+    alert_keywords(channel_id, new_entry)
 
     return message_id
 
 
+def alert_keywords(channel_id, message):
+    '''
+    Adds an alert to the feed of each member of the channel, other than the sender, subscribed to
+    a keyword found in the message, unless they were already alerted to it before it was edited.
+    Every subscribed keyword is found in a single pass over the message by the keyword matcher,
+    which is compiled from the users' keywords when they change. The matcher is compiled and the
+    alerts added while holding the storage lock, so neither is lost to a concurrent change.
+
+    Parameters:
+        channel_id (int): channel ID
+        message (Message): the message sent or edited
+    '''
+    with get_storage().lock:
+        matcher, version = get_keyword_matcher()
+        if matcher is None:
+            matcher = KeywordMatcher((keyword, user['u_id']) for user in get_users()
+                                     for keyword in user.get('keywords', ()))
+            set_keyword_matcher(matcher, version)
+
+        for u_id, keywords in matcher.match(message.message).items():
+            if u_id == message.u_id or not get_storage().is_member(u_id, channel_id):
+                continue
+            user = get_user('u_id', u_id)
+            alerts = user.setdefault('alerts', [])
+            if any(alert['message_id'] == message.message_id for alert in alerts):
+                continue
+            alerts.append({
+                'message_id': message.message_id,
+                'channel_id': channel_id,
+                'u_id': message.u_id,
+                'keywords': sorted(keywords),
+                'time_created': message.time_created,
+            })
+            del alerts[:-ALERT_LIMIT]
+            save_change('users', u_id, user)
+
+
 #######################################
 #          HANGMAN FUNCTIONS          #
 #######################################
@@ -836,9 +1064,9 @@ def hangman_send(token, channel_id):
     strikes = str(hangman_game['strikes'])
 
     hangman_message = \
-        f"{hangman_game['message']}\n",\
-        f"{' '.join(hangman_game['display'])}\n",\
-        f"{hangman_data[strikes]}\n",\
+        f"{hangman_game['message']}\n"\
+        f"{' '.join(hangman_game['display'])}\n"\
+        f"{hangman_data[strikes]}\n"\
         f"You have guessed: {' '.join(hangman_game['guesses'])}"
 
     return {'message_id': send_message(u_id, channel_id, hangman_message)}
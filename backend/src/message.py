@@ -8,8 +8,9 @@ from datetime import datetime
 from error import InputError, AccessError
 from helper import validate_token, validate_channel, validate_member, validate_permission, \
     validate_message, validate_message_size, validate_time, validate_react, \
-    get_channel_by_message, get_channel_messages, get_message, is_reacted, is_pinned, send_message
+    get_channel_by_message, get_message, is_reacted, is_pinned, send_message, alert_keywords
 from hangman import hangman, guess
+from data import save_change
 
 def message_send(token, channel_id, message):
     '''
@@ -101,9 +102,9 @@ def message_react(token, message_id, react_id):
         raise InputError(description="Message has already been reacted")
 
     # Adding a react
-    react = next(i for i in get_message(message_id)['reacts'] if i['react_id'] == react_id)
-    react['u_ids'].append(u_id)
-    react['is_this_user_reacted'] = True
+    message = get_message(message_id)
+    message.add_react(u_id, react_id)
+    save_change('messages', (channel_id, message_id), message)
 
     return {}
 
@@ -135,9 +136,9 @@ def message_unreact(token, message_id, react_id):
         raise InputError(description="Message has no existing react")
 
     # Removing a react
-    react = next(i for i in get_message(message_id)['reacts'] if i['react_id'] == react_id)
-    react['u_ids'].remove(u_id)
-    react['is_this_user_reacted'] = False
+    message = get_message(message_id)
+    message.remove_react(u_id, react_id)
+    save_change('messages', (channel_id, message_id), message)
 
     return {}
 
@@ -169,7 +170,8 @@ def message_pin(token, message_id):
 
     # Pin message
     message = get_message(message_id)
-    message['is_pinned'] = True
+    message.is_pinned = True
+    save_change('messages', (channel_id, message_id), message)
 
     return {}
 
@@ -201,7 +203,8 @@ def message_unpin(token, message_id):
 
     # Unpin message
     message = get_message(message_id)
-    message['is_pinned'] = False
+    message.is_pinned = False
+    save_change('messages', (channel_id, message_id), message)
 
     return {}
 
@@ -227,7 +230,7 @@ def message_remove(token, message_id):
     channel_id = get_channel_by_message(message_id)
 
     message_index = get_message(message_id)
-    if message_index['u_id'] != u_id:
+    if message_index.u_id != u_id:
         # User is not owner of message
         try:
             # Check user is owner of channel/slackr
@@ -237,7 +240,7 @@ def message_remove(token, message_id):
             raise AccessError(description="User is not authorised to edit message")
 
     # Remove message from channel
-    get_channel_messages(channel_id).remove(message_index)
+    save_change('messages', (channel_id, message_id), None)
 
     return {}
 
@@ -264,7 +267,7 @@ def message_edit(token, message_id, message):
     channel_id = get_channel_by_message(message_id)
 
     message_index = get_message(message_id)
-    if message_index['u_id'] != u_id:
+    if message_index.u_id != u_id:
         # User is not owner of message
         try:
             # Check user is owner of channel/slackr
@@ -279,6 +282,8 @@ def message_edit(token, message_id, message):
 
     # Edit message
     else:
-        message_index['message'] = message
+        message_index.edit(message)
+        save_change('messages', (channel_id, message_id), message_index)
+        alert_keywords(channel_id, message_index)
 
     return {}
@@ -11,7 +11,7 @@ from auth import auth_register
 from channel import channel_join, channel_invite
 from channels import channels_create
 from data import get_data
-from helper import get_channel_messages, get_message
+from helper import get_channel_messages, get_message, get_channel_by_message
 from other import workplace_reset
 from error import AccessError, InputError
 
@@ -35,27 +35,25 @@ def test_message_send_valid():
     channel_invite(user1['token'], channel['channel_id'], user2['u_id'])
 
     # Check function return value for owner and member sending messages to channel
-    assert message_send(user1['token'], channel['channel_id'], 'Hello') == {
-        'message_id': 1
-    }
-    assert message_send(user2['token'], channel['channel_id'], 'This is a test message') == {
-        'message_id': 2
-    }
+    message1 = message_send(user1['token'], channel['channel_id'], 'Hello')
+    message2 = message_send(user2['token'], channel['channel_id'], 'This is a test message')
+    assert get_channel_by_message(message1['message_id']) == channel['channel_id']
+    assert message1['message_id'] < message2['message_id'] < 2 ** 53
 
     # Check data structure
     assert get_channel_messages(channel['channel_id']) == [
         {
-            'message_id': 2,
-            'u_id': 2,
-            'message': 'This is a test message',
+            'message_id': message1['message_id'],
+            'u_id': 1,
+            'message': 'Hello',
             'time_created': int(datetime.now().timestamp()),
             'reacts': [{'u_ids': [], 'is_this_user_reacted': False, 'react_id': 1}],
             'is_pinned': False
         },
         {
-            'message_id': 1,
-            'u_id': 1,
-            'message': 'Hello',
+            'message_id': message2['message_id'],
+            'u_id': 2,
+            'message': 'This is a test message',
             'time_created': int(datetime.now().timestamp()),
             'reacts': [{'u_ids': [], 'is_this_user_reacted': False, 'react_id': 1}],
             'is_pinned': False
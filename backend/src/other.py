@@ -3,10 +3,13 @@ Other Functions
 By H09A-PADTHAI
 Submitted 19 April 2020
 '''
-import pickle
-from data import get_data, get_id
-from helper import get_user, get_profile, validate_user, validate_token,\
-    validate_slackr_owner, is_reacted, get_channel_messages
+import heapq
+from itertools import islice
+from data import save_change, get_storage, reset_data, get_search_cache, set_keyword_matcher, \
+    PAGE_SIZE, SEARCH_LIMIT
+from helper import get_user, get_users, get_profile, validate_user, validate_token,\
+    validate_slackr_owner, validate_channel, validate_member, get_channel_messages, \
+    search_messages, get_channel_versions
 from error import AccessError, InputError
 
 def users_all(token):
@@ -22,42 +25,76 @@ def users_all(token):
     validate_token(token)
 
     # Create list to store user profiles
-    data = get_data()
     users = []
 
     # Append only relevant user data to the list
-    for user in data['users']:
+    for user in get_users():
         users.append(get_profile(user))
 
     return {'users': users}
 
-def search(token, query_str):
+def search(token, query_str, limit=None, before=None, channel_id=None, u_id=None,
+           time_start=None, time_end=None):
     '''
-    Returns a collection of messages in all the channels the user is a member
-    of that match the query string.
+    Returns a page of the messages in the channels the user is a member of that match the query
+    string and the filters, newest first. Each channel's matches are merged as they are found,
+    so no more than a page of messages is read from any channel. The result is cached until one
+    of the channels searched changes.
 
     Parameters:
         token (str): user's authorisation code
         query_str (str): query string to search messages
+        limit (str or None): the most messages to return, PAGE_SIZE if not given and no more
+            than SEARCH_LIMIT
+        before (str or None): message ID cursor, returns the matches sent before it
+        channel_id (str or None): only search this channel
+        u_id (str or None): only return messages sent by this user
+        time_start (str or None): only return messages sent at or after this unix timestamp
+        time_end (str or None): only return messages sent at or before this unix timestamp
 
     Returns:
-        (dict of str: list): dictionary of list of messages (str) that contain
-            query string
+        (dict of str: list, str: int): dictionary containing the matching messages (list of
+            dict) and the message ID to pass as before for the next page (int), -1 if there
+            are no more matches
     '''
-    u_id = validate_token(token)
-
-    data = get_data()
-    user = get_user('u_id', u_id)
-    search_return = {'messages': []}
-
-    for channel in user['channel_membership']:
-        channel_id = channel['channel_id']
-        messages = data['messages'][channel_id]
-        for message in messages:
-            if query_str in message['message']:
-                search_return['messages'].append(message)
+    # pylint: disable=too-many-arguments
+    # Convert inputs into appropriate type
+    limit = int(limit) if limit is not None else PAGE_SIZE
+    before, channel_id, u_id, time_start, time_end = (
+        int(value) if value is not None else None
+        for value in (before, channel_id, u_id, time_start, time_end)
+    )
 
-    return search_return
+    # Check for errors
+    auth_u_id = validate_token(token)
+    if limit <= 0:
+        raise InputError(description="Limit must be positive")
+    if limit > SEARCH_LIMIT:
+        raise InputError(description=f"Limit must be at most {SEARCH_LIMIT}")
+    if channel_id is not None:
+        validate_channel(channel_id)
+        validate_member(auth_u_id, channel_id)
+        channel_ids = [channel_id]
+    else:
+        channel_ids = get_user('u_id', auth_u_id)['channel_membership']
+
+    # Reuse the result of the same search while none of its channels have changed
+    key = (tuple(channel_ids), query_str, limit, before, u_id, time_start, time_end)
+    versions = get_channel_versions(key[0])
+    messages = get_search_cache().get(key, versions)
+    if messages is None:
+        # Take the newest matches across the channels, one more than the page to find the cursor
+        matches = search_messages(channel_ids, query_str, limit + 1, before, u_id, time_start,
+                                  time_end)
+        messages = list(islice(heapq.merge(*matches, key=lambda message: message.message_id,
+                                           reverse=True), limit + 1))
+        get_search_cache().put(key, versions, messages)
+    cursor = messages[limit - 1].message_id if len(messages) > limit else -1
+
+    return {
+        'messages': [message.to_dict(auth_u_id) for message in messages[:limit]],
+        'next': cursor
+    }
 
 def workplace_reset():
     '''
@@ -66,21 +103,10 @@ def workplace_reset():
     Returns:
         (dict): empty dictionary
     '''
-    # Clear data structure
-    data = get_data()
-    data['users'] = []
-    data['channels'] = {}
-    data['messages'] = {}
-    with open('data_file.pickle', 'wb') as data_file:
-        pickle.dump(data, data_file)
-
-    # Clear ID data structure
-    ids = get_id()
-    ids['message_id'] = 1
-    ids['channel_id'] = 1
-    ids['user_id'] = 1
-    with open('id_file.pickle', 'wb') as id_file:
-        pickle.dump(ids, id_file)
+    # Clear data and ID structures
+    reset_data()
+    get_search_cache().clear()
+    set_keyword_matcher(None)
 
     return {}
 
@@ -112,30 +138,25 @@ def admin_user_remove(token, u_id):
     if auth_user['permission_id'] != 1:
         raise AccessError(description="You are not authorised to remove users")
 
-    # Update reacts data
-    user = get_user('u_id', u_id)
-    for channel in user['channel_membership']:
-        channel_id = channel['channel_id']
-        messages = get_channel_messages(channel_id)
-        for msg in messages:
-            for react in msg['reacts']:
-                if is_reacted(u_id, msg['message_id'], 1):
-                    react['u_ids'].remove(user['u_id'])
-
-    # Update channels data
-    data = get_data()
-    for channel in user['channel_membership']:
-        members = data['channels'][channel['channel_id']]['all_members']
-        member = next(i for i in members if i['u_id'] == u_id)
-        members.remove(member)
-
-    for channel in user['channel_ownership']:
-        owners = data['channels'][channel['channel_id']]['owner_members']
-        owner = next(i for i in owners if i['u_id'] == u_id)
-        owners.remove(owner)
-
-    # Update users data
-    data['users'].remove(user)
+    with get_storage().lock:
+        # Update reacts data
+        user = get_user('u_id', u_id)
+        for channel_id in user['channel_membership']:
+            messages = get_channel_messages(channel_id)
+            for msg in messages:
+                if msg.remove_react(u_id, 1):
+                    save_change('messages', (channel_id, msg.message_id), msg)
+
+        # Update channels data
+        for channel_id in user['channel_membership']:
+            save_change('all_members', (channel_id, u_id), None)
+
+        for channel_id in user['channel_ownership']:
+            save_change('owner_members', (channel_id, u_id), None)
+
+        # Update users data, and stop matching the user's keywords
+        save_change('users', u_id, None)
+    set_keyword_matcher(None)
 
     return {}
 
@@ -169,7 +190,9 @@ def admin_userpermission_change(token, u_id, permission_id):
         raise InputError(description="Owners cannot change their own permissions")
 
     # Change user's permission
-    user = get_user('u_id', u_id)
-    user['permission_id'] = permission_id
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
+        user['permission_id'] = permission_id
+        save_change('users', u_id, user)
 
     return {}
@@ -5,10 +5,10 @@ Submitted 19 April 2020
 '''
 import pytest
 from channels import channels_create
-from channel import channel_invite, channel_addowner
-from message import message_send
+from channel import channel_invite, channel_addowner, channel_join
+from message import message_send, message_react, message_remove
 from auth import auth_register
-from data import get_data
+from data import get_data, get_search_cache, SEARCH_LIMIT
 from other import users_all, admin_userpermission_change, admin_user_remove,\
     workplace_reset, search
 from error import InputError, AccessError
@@ -102,6 +102,85 @@ def test_search_valid():
     messages = search(user1['token'], query)['messages']
     assert messages == []
 
+def test_search_pages():
+    '''
+    Testing search returns the newest matches across channels a page at a time, with filters
+    '''
+    workplace_reset()
+    user1 = auth_register('hpotter@hogwarts.com', 'Chosen1', 'Harry', 'Potter')
+    user2 = auth_register('rweasley@hogwarts.com', 'Scabbers', 'Ron', 'Weasley')
+    channel1 = channels_create(user1['token'], 'TestChannel', True)
+    channel2 = channels_create(user1['token'], 'OtherChannel', True)
+    channel_join(user2['token'], channel2['channel_id'])
+    message_ids = []
+    for i in range(6):
+        sender, channel = (user1, channel1) if i % 2 else (user2, channel2)
+        message_ids.append(message_send(sender['token'], channel['channel_id'],
+                                        f"Hello {i}")['message_id'])
+
+    # Message IDs order messages by the second they were sent in
+    message_ids.sort(reverse=True)
+    result = search(user1['token'], 'Hello', 4)
+    assert [i['message_id'] for i in result['messages']] == message_ids[:4]
+    assert result['next'] == message_ids[3]
+    result = search(user1['token'], 'Hello', '4', result['next'])
+    assert [i['message_id'] for i in result['messages']] == message_ids[4:]
+    assert result['next'] == -1
+
+    result = search(user1['token'], 'Hello', channel_id=channel2['channel_id'])
+    assert [i['message'] for i in result['messages']] == ['Hello 4', 'Hello 2', 'Hello 0']
+    result = search(user1['token'], 'Hello', u_id=user1['u_id'])
+    assert [i['message'] for i in result['messages']] == ['Hello 5', 'Hello 3', 'Hello 1']
+    time_created = result['messages'][0]['time_created']
+    assert len(search(user1['token'], 'Hello', time_start=time_created)['messages']) == 6
+    assert search(user1['token'], 'Hello', time_end=time_created - 1)['messages'] == []
+
+def test_search_cache():
+    '''
+    Testing repeated searches are cached until a channel searched changes
+    '''
+    workplace_reset()
+    user1 = auth_register('hpotter@hogwarts.com', 'Chosen1', 'Harry', 'Potter')
+    channel1 = channels_create(user1['token'], 'TestChannel', True)
+    channel2 = channels_create(user1['token'], 'OtherChannel', True)
+    message1 = message_send(user1['token'], channel1['channel_id'], 'Hello')
+    message_send(user1['token'], channel2['channel_id'], 'Hello there')
+
+    cache = get_search_cache()
+    assert len(search(user1['token'], 'Hello')['messages']) == 2
+    assert len(search(user1['token'], 'Hello', channel_id=channel2['channel_id'])['messages']) == 1
+    key1, key2 = cache.results
+    result1, result2 = cache.results[key1][1], cache.results[key2][1]
+    search(user1['token'], 'Hello')
+    assert cache.results[key1][1] is result1
+
+    # Reacting is seen by the next search, and only invalidates the searches of its channel
+    message_react(user1['token'], message1['message_id'], 1)
+    messages = search(user1['token'], 'Hello')['messages']
+    assert messages[-1]['reacts'][0]['is_this_user_reacted']
+    assert cache.results[key1][1] is not result1
+    search(user1['token'], 'Hello', channel_id=channel2['channel_id'])
+    assert cache.results[key2][1] is result2
+    message_remove(user1['token'], message1['message_id'])
+    assert len(search(user1['token'], 'Hello')['messages']) == 1
+
+def test_search_invalid():
+    '''
+    Testing search errors for an invalid limit or channel
+    '''
+    workplace_reset()
+    user1 = auth_register('hpotter@hogwarts.com', 'Chosen1', 'Harry', 'Potter')
+    user2 = auth_register('rweasley@hogwarts.com', 'Scabbers', 'Ron', 'Weasley')
+    channel1 = channels_create(user1['token'], 'TestChannel', True)
+    with pytest.raises(InputError):
+        search(user1['token'], 'Hello', 0)
+    with pytest.raises(InputError):
+        search(user1['token'], 'Hello', SEARCH_LIMIT + 1)
+    with pytest.raises(InputError):
+        search(user1['token'], 'Hello', channel_id=channel1['channel_id'] + 1)
+    with pytest.raises(AccessError):
+        search(user2['token'], 'Hello', channel_id=channel1['channel_id'])
+
 
 ######################################################
 # Testing Core Function: admin_userpermission_change #
@@ -213,22 +292,10 @@ def test_admin_user_remove_simple():
     is_exist = next((i for i in data['users'] if i['u_id'] == user2['u_id']), False)
     assert not is_exist
 
-    is_member = next(
-        (
-            i for i in data['channels'][public['channel_id']]['all_members']\
-            if i['u_id'] == user2['u_id']
-        ),
-        False
-    )
+    is_member = user2['u_id'] in data['channels'][public['channel_id']]['all_members']
     assert not is_member
 
-    is_owner = next(
-        (
-            i for i in data['channels'][public['channel_id']]['owner_members']\
-            if i['u_id'] == user2['u_id']
-        ),
-        False
-    )
+    is_owner = user2['u_id'] in data['channels'][public['channel_id']]['owner_members']
     assert not is_owner
 
 
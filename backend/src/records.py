@@ -0,0 +1,357 @@
+'''
+Records
+By H09A-PADTHAI
+Submitted 19 April 2020
+'''
+import sys
+
+# Message texts up to this length are interned, so common short messages share a single string
+INTERN_LENGTH = 16
+
+# Message IDs hold, from the highest bit, a flag marking the format, the seconds since
+# MESSAGE_ID_EPOCH, the channel ID and a sequence number within the second. IDs fit in 53 bits so
+# they are exact as JavaScript numbers, and sort by the time they were sent. IDs given out by the
+# global counter before this format are smaller than the flag.
+MESSAGE_ID_EPOCH = 1577836800
+TIME_BITS = 30
+CHANNEL_BITS = 16
+SEQUENCE_BITS = 6
+MESSAGE_ID_FLAG = 1 << (TIME_BITS + CHANNEL_BITS + SEQUENCE_BITS)
+
+class Message:
+    '''
+    A message sent in a channel. Stores the fields of the message dictionary described in data.py
+    in slots rather than a dictionary of its own, only allocates reacts once the message is
+    reacted to, and leaves out is_this_user_reacted, which depends on the user viewing the
+    message. Fields can also be read by key, and to_dict returns the message dictionary.
+    '''
+    __slots__ = ('message_id', 'u_id', 'message', 'time_created', 'is_pinned', 'reacts')
+
+    FIELDS = ('message_id', 'u_id', 'message', 'time_created', 'reacts', 'is_pinned')
+
+    def __init__(self, message_id, u_id, message, time_created, is_pinned=False, reacts=None):
+        '''
+        Parameters:
+            message_id (int): message ID
+            u_id (int): user ID of the sender
+            message (str): message text
+            time_created (int): unix timestamp
+            is_pinned (bool): True if the message is pinned
+            reacts (dict or None): dictionary of react IDs to the user IDs who reacted in the
+                order they reacted, None if nobody has reacted
+        '''
+        self.message_id = message_id
+        self.u_id = u_id
+        self.message = intern_text(message)
+        self.time_created = time_created
+        self.is_pinned = is_pinned
+
+        # Each react's user IDs are held as the keys of a dictionary, an ordered set, so
+        # checking whether a user reacted does not depend on the number of reacts
+        self.reacts = None
+        if reacts:
+            self.reacts = {react_id: dict.fromkeys(u_ids) for react_id, u_ids in reacts.items()}
+
+    @classmethod
+    def from_dict(cls, message):
+        '''
+        Returns the record of a message dictionary.
+        '''
+        reacts = {react['react_id']: react['u_ids']
+                  for react in message['reacts'] if react['u_ids']}
+        return cls(message['message_id'], message['u_id'], message['message'],
+                   message['time_created'], message['is_pinned'], reacts or None)
+
+    def edit(self, message):
+        '''
+        Replaces the text of the message.
+        '''
+        self.message = intern_text(message)
+
+    def is_reacted(self, u_id, react_id):
+        '''
+        Returns True if the user has reacted to the message with the react ID, otherwise False.
+        '''
+        return bool(self.reacts) and u_id in self.reacts.get(react_id, ())
+
+    def add_react(self, u_id, react_id):
+        '''
+        Adds a react by the user to the message.
+        '''
+        if self.reacts is None:
+            self.reacts = {}
+        self.reacts.setdefault(react_id, {})[u_id] = None
+
+    def remove_react(self, u_id, react_id):
+        '''
+        Removes the user's react from the message. Returns True if the user had reacted.
+        '''
+        if not self.is_reacted(u_id, react_id):
+            return False
+
+        del self.reacts[react_id][u_id]
+        if not self.reacts[react_id]:
+            del self.reacts[react_id]
+        if not self.reacts:
+            self.reacts = None
+        return True
+
+    def get_reacts(self, u_id=None):
+        '''
+        Returns the reacts of the message as seen by the given user.
+
+        Parameters:
+            u_id (int or None): user ID of the user viewing the message
+
+        Returns:
+            (list of dict): list of dictionaries containing the user IDs who reacted (list of
+                int), whether the viewing user reacted (bool) and the react ID (int)
+        '''
+        reacts = {1: {}}
+        if self.reacts:
+            reacts.update(self.reacts)
+        return [{
+            'u_ids': list(u_ids),
+            'is_this_user_reacted': u_id in u_ids,
+            'react_id': react_id
+        } for react_id, u_ids in reacts.items()]
+
+    def to_dict(self, u_id=None):
+        '''
+        Returns the message dictionary as seen by the given user.
+
+        Parameters:
+            u_id (int or None): user ID of the user viewing the message
+
+        Returns:
+            (dict): dictionary containing message ID (int), user ID (int), message text (str),
+                time message was sent (int), reacts (list of dict) and pin (bool)
+        '''
+        return {
+            'message_id': self.message_id,
+            'u_id': self.u_id,
+            'message': self.message,
+            'time_created': self.time_created,
+            'reacts': self.get_reacts(u_id),
+            'is_pinned': self.is_pinned,
+        }
+
+    def keys(self):
+        '''
+        Returns the fields of the message dictionary.
+        '''
+        return self.FIELDS
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        if key == 'reacts':
+            return self.get_reacts()
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if isinstance(other, Message):
+            return self.__getstate__() == other.__getstate__()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return (self.message_id, self.u_id, self.message, self.time_created, self.is_pinned,
+                self.reacts)
+
+    def __setstate__(self, state):
+        message_id, u_id, message, time_created, is_pinned, reacts = state
+        self.__init__(message_id, u_id, message, time_created, is_pinned, reacts)
+
+    def __repr__(self):
+        return f"Message({self.to_dict()!r})"
+
+
+class Session:
+    '''
+    An active session, created for each token in a user's list of tokens. The issue time is only
+    known once the token has been decoded, so a session with no issue time has not yet been
+    verified.
+    '''
+    __slots__ = ('u_id', 'issued_at', 'expiry')
+
+    def __init__(self, u_id, issued_at=None, expiry=None):
+        '''
+        Parameters:
+            u_id (int): user ID of the user the token was issued to
+            issued_at (float or None): unix timestamp the token was issued at, None if the token
+                has not been verified
+            expiry (float or None): unix timestamp the session expires at, None if it does not
+                expire
+        '''
+        self.u_id = u_id
+        self.issued_at = issued_at
+        self.expiry = expiry
+
+    def __repr__(self):
+        return f"Session({self.u_id!r}, {self.issued_at!r}, {self.expiry!r})"
+
+
+class Tombstone:
+    '''
+    Takes the place of a removed message in a channel's message list until the list is compacted,
+    so removing a message does not shift the messages after it. Keeps the message's ID and send
+    time so the list can still be searched by either.
+    '''
+    __slots__ = ('message_id', 'time_created')
+
+    def __init__(self, message_id, time_created):
+        '''
+        Parameters:
+            message_id (int): message ID of the removed message
+            time_created (int): unix timestamp the removed message was sent at
+        '''
+        self.message_id = message_id
+        self.time_created = time_created
+
+    def __repr__(self):
+        return f"Tombstone({self.message_id!r}, {self.time_created!r})"
+
+
+def to_message(message):
+    '''
+    Returns the record of a message, which may be a message dictionary stored before records
+    were introduced.
+    '''
+    if isinstance(message, Message):
+        return message
+    return Message.from_dict(message)
+
+
+def new_message_id(channel_id, timestamp, previous=None):
+    '''
+    Returns a new message ID for a channel. IDs within a channel always increase, so a message
+    sent in the same second as the previous one takes the next sequence number, moving on to the
+    following second once the sequence numbers run out, so a sender which must not stamp a
+    message ahead of the time it was sent waits for that second, see get_message_time.
+
+    Parameters:
+        channel_id (int): channel ID
+        timestamp (float): unix timestamp the message is sent at
+        previous (int or None): the last message ID issued in the channel, None if it has none
+
+    Returns:
+        (int or None): message ID, None if the channel ID or time cannot be encoded
+    '''
+    seconds = max(int(timestamp) - MESSAGE_ID_EPOCH, 0)
+    sequence = 0
+    if previous is not None and get_message_channel(previous) is not None:
+        previous_seconds = (previous >> (CHANNEL_BITS + SEQUENCE_BITS)) & ((1 << TIME_BITS) - 1)
+        if previous_seconds >= seconds:
+            seconds = previous_seconds
+            sequence = (previous & ((1 << SEQUENCE_BITS) - 1)) + 1
+            if sequence >> SEQUENCE_BITS:
+                seconds, sequence = seconds + 1, 0
+
+    if channel_id >> CHANNEL_BITS or seconds >> TIME_BITS:
+        return None
+    return MESSAGE_ID_FLAG | seconds << (CHANNEL_BITS + SEQUENCE_BITS) | \
+        channel_id << SEQUENCE_BITS | sequence
+
+
+def last_message_key(channel_id):
+    '''
+    Returns the name in the ID structure of the last message ID issued in a channel.
+    '''
+    return f"message_id_{channel_id}"
+
+
+def get_message_channel(message_id):
+    '''
+    Returns the channel ID encoded in a message ID, otherwise None for IDs given out by the
+    global counter.
+    '''
+    if message_id >> (TIME_BITS + CHANNEL_BITS + SEQUENCE_BITS) != 1:
+        return None
+    return (message_id >> SEQUENCE_BITS) & ((1 << CHANNEL_BITS) - 1)
+
+
+def get_message_time(message_id):
+    '''
+    Returns the unix timestamp of the second encoded in a message ID, otherwise None for IDs
+    given out by the global counter.
+    '''
+    if get_message_channel(message_id) is None:
+        return None
+    seconds = (message_id >> (CHANNEL_BITS + SEQUENCE_BITS)) & ((1 << TIME_BITS) - 1)
+    return MESSAGE_ID_EPOCH + seconds
+
+
+def bisect_messages(messages, message_id):
+    '''
+    Returns the position of a message ID in a list of messages in message ID order, which is the
+    index of the message if it is in the list, otherwise the index it would be inserted at.
+
+    Parameters:
+        messages (list of Message): messages in message ID order
+        message_id (int): message ID
+
+    Returns:
+        (int): index in the list
+    '''
+    low, high = 0, len(messages)
+    while low < high:
+        middle = (low + high) // 2
+        if messages[middle].message_id < message_id:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def bisect_time(messages, timestamp):
+    '''
+    Returns the index of the first message sent at or after a time in a list of messages in the
+    order they were sent, otherwise the length of the list.
+
+    Parameters:
+        messages (list of Message): messages in the order they were sent
+        timestamp (int): unix timestamp
+
+    Returns:
+        (int): index in the list
+    '''
+    low, high = 0, len(messages)
+    while low < high:
+        middle = (low + high) // 2
+        if messages[middle].time_created < timestamp:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def time_window(messages, time_start=None, time_end=None):
+    '''
+    Returns the range of indexes of the messages sent between two times, inclusive, in a list of
+    messages in the order they were sent.
+
+    Parameters:
+        messages (list of Message): messages in the order they were sent
+        time_start (int or None): unix timestamp, None for the first message
+        time_end (int or None): unix timestamp, None for the last message
+
+    Returns:
+        (tuple of int): the index of the first message in the window and the index after the
+            last
+    '''
+    low = bisect_time(messages, time_start) if time_start is not None else 0
+    high = bisect_time(messages, time_end + 1) if time_end is not None else len(messages)
+    return low, max(low, high)
+
+
+def intern_text(message):
+    '''
+    Returns the interned copy of a short message text, otherwise the text itself.
+    '''
+    if len(message) <= INTERN_LENGTH:
+        return sys.intern(message)
+    return message
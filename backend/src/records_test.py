@@ -0,0 +1,108 @@
+'''
+Records Tests
+By H09A-PADTHAI
+Submitted 19 April 2020
+'''
+import pickle
+import tracemalloc
+from records import Message, to_message, new_message_id, get_message_channel, get_message_time
+
+def message_dict(message_id):
+    '''
+    Returns a message dictionary in the form messages were stored before records.
+    '''
+    return {
+        'message_id': message_id,
+        'u_id': message_id % 50,
+        'message': f"Message number {message_id}",
+        'time_created': 1587000000 + message_id,
+        'reacts': [{'u_ids': [], 'is_this_user_reacted': False, 'react_id': 1}],
+        'is_pinned': False,
+    }
+
+
+def traced_size(build):
+    '''
+    Returns the memory in bytes allocated by a function while its result is alive.
+    '''
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def test_message_to_dict():
+    '''
+    Tests that a message record returns the same dictionary as it was created from.
+    '''
+    message = message_dict(1)
+    record = to_message(message)
+    assert record.to_dict() == message
+    assert record == message
+    assert record['reacts'] == message['reacts']
+    assert dict(record) == message
+    assert pickle.loads(pickle.dumps(record)) == record
+
+
+def test_message_reacts():
+    '''
+    Tests that reacts are only allocated while a message has been reacted to, and that the
+    reacted state depends on the user viewing the message.
+    '''
+    record = Message(1, 1, 'Hello', 1587000000)
+    assert record.reacts is None
+
+    record.add_react(2, 1)
+    assert record.is_reacted(2, 1)
+    assert record.to_dict(2)['reacts'] == [
+        {'u_ids': [2], 'is_this_user_reacted': True, 'react_id': 1}
+    ]
+    assert record.to_dict(1)['reacts'] == [
+        {'u_ids': [2], 'is_this_user_reacted': False, 'react_id': 1}
+    ]
+
+    assert record.remove_react(2, 1)
+    assert not record.remove_react(2, 1)
+    assert record.reacts is None
+
+    # Reacts pickled as lists of user IDs are read as ordered sets
+    record = Message.__new__(Message)
+    record.__setstate__((1, 1, 'Hello', 1587000000, False, {1: [3, 2]}))
+    assert record.is_reacted(2, 1)
+    assert record.to_dict(3)['reacts'][0]['u_ids'] == [3, 2]
+
+
+def test_message_memory():
+    '''
+    Tests that message records use less than half the memory of message dictionaries.
+    '''
+    count = 20000
+    dict_size = traced_size(lambda: [message_dict(i) for i in range(count)])
+    record_size = traced_size(lambda: [to_message(message_dict(i)) for i in range(count)])
+    assert record_size < dict_size / 2
+
+
+def test_message_ids():
+    '''
+    Tests that message IDs encode their channel, increase within a channel and sort by time.
+    '''
+    message_id = new_message_id(12, 1587000000)
+    assert get_message_channel(message_id) == 12
+    assert get_message_channel(1) is None
+    assert message_id < 2 ** 53
+
+    # Messages sent in the same second take the following IDs, then move to the next second
+    message_ids = [message_id]
+    for _ in range(100):
+        message_ids.append(new_message_id(12, 1587000000, message_ids[-1]))
+    assert message_ids == sorted(set(message_ids))
+    assert all(get_message_channel(i) == 12 for i in message_ids)
+    assert new_message_id(1, 1587000002) > message_ids[-1]
+    assert get_message_time(message_ids[63]) == 1587000000
+    assert get_message_time(message_ids[64]) == 1587000001
+    assert get_message_time(1) is None
+    assert new_message_id(12, 1587000000, 1) == message_id
+
+    assert new_message_id(2 ** 16, 1587000000) is None
@@ -0,0 +1,63 @@
+'''
+Search Cache
+By H09A-PADTHAI
+Submitted 19 April 2020
+'''
+from collections import OrderedDict
+from threading import Lock
+
+class SearchCache:
+    '''
+    Least recently used cache of search results. Each result is stored with the versions of the
+    channels it was found in, and is only returned while those versions are unchanged, so a
+    change to a channel only invalidates the results it was part of.
+    '''
+    def __init__(self, size):
+        '''
+        Parameters:
+            size (int): number of results that may be held before the least recently used are
+                discarded
+        '''
+        self.size = size
+        self.lock = Lock()
+        self.results = OrderedDict()
+
+    def get(self, key, versions):
+        '''
+        Returns the result stored for a search if the versions of its channels are unchanged,
+        otherwise None.
+
+        Parameters:
+            key (tuple): the channel IDs searched, followed by the query and its parameters
+            versions (tuple of int): current versions of the channels searched
+
+        Returns:
+            the stored result, or None
+        '''
+        with self.lock:
+            entry = self.results.get(key)
+            if entry is None:
+                return None
+            if entry[0] != versions:
+                del self.results[key]
+                return None
+            self.results.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, versions, result):
+        '''
+        Stores the result of a search, discarding the least recently used result once more than
+        the cache size are held.
+        '''
+        with self.lock:
+            self.results[key] = (versions, result)
+            self.results.move_to_end(key)
+            while len(self.results) > self.size:
+                self.results.popitem(last=False)
+
+    def clear(self):
+        '''
+        Discards every stored result.
+        '''
+        with self.lock:
+            self.results.clear()
@@ -6,11 +6,11 @@ Submitted 19 April 2020
 import sys
 import threading
 from json import dumps
-from flask import Flask, request
+from flask import Flask, Response, request
 from flask_cors import CORS
 from flask_mail import Mail, Message
-from data import get_data, pickle_data
-from helper import get_user
+from data import get_data, get_snapshot_stats, pickle_data
+from helper import get_user, sweep_sessions
 from error import InputError
 import auth
 import channel
@@ -63,6 +63,14 @@ def getdata():
     Returns data
     '''
     payload = get_data()
+    return dumps(payload, default=dict)
+
+@APP.route('/datastore/stats', methods=['GET'])
+def datastore_stats():
+    '''
+    Returns the duration, size and lag of the datastore's snapshots
+    '''
+    payload = get_snapshot_stats()
     return dumps(payload)
 
 ###############
@@ -182,14 +190,37 @@ def details():
 def get_channel_messages():
     '''
     Returns channel messages
-    given a token, channel_id and start
+    given a token, channel_id and start, or a before or after cursor, and optionally a limit
     '''
     token = request.args.get('token')
     channel_id = int(request.args.get('channel_id'))
-    start_val = int(request.args.get('start'))
-    payload = channel.channel_messages(token, channel_id, start_val)
+    start_val = int(request.args.get('start', 0))
+    payload = channel.channel_messages(token, channel_id, start_val,
+                                       request.args.get('before'), request.args.get('after'),
+                                       request.args.get('limit'))
     return dumps(payload)
 
+@APP.route('/channel/messages/range', methods=['GET'])
+def get_channel_messages_range():
+    '''
+    Returns the channel messages sent between two times, oldest first
+    given a token, channel_id and optionally time_start and time_end
+    '''
+    payload = channel.channel_messages_range(
+        request.args.get('token'),
+        request.args.get('channel_id'),
+        request.args.get('time_start'),
+        request.args.get('time_end')
+    )
+
+    # Encode the window a message at a time rather than as a single string
+    def stream():
+        yield '{"messages": ['
+        for i, entry in enumerate(payload['messages']):
+            yield (', ' if i else '') + dumps(entry)
+        yield ']}'
+    return Response(stream(), mimetype='application/json')
+
 @APP.route('/channel/leave', methods=['POST'])
 def leave():
     '''
@@ -467,6 +498,52 @@ def upload_photo():
         raise InputError("Invalid Input")
     return dumps(payload)
 
+@APP.route('/user/keywords', methods=['GET'])
+def keywords():
+    '''
+    Returns the keywords a user is subscribed to
+    given a token
+    '''
+    token = request.args.get('token')
+    payload = user.user_keywords(token)
+    return dumps(payload)
+
+@APP.route('/user/keywords/add', methods=['POST'])
+def add_keyword():
+    '''
+    Subscribes a user to a keyword
+    given a token and a keyword
+    '''
+    data = request.get_json('data')
+    payload = user.user_keywords_add(
+        data['token'],
+        data['keyword']
+    )
+    return dumps(payload)
+
+@APP.route('/user/keywords/remove', methods=['POST'])
+def remove_keyword():
+    '''
+    Unsubscribes a user from a keyword
+    given a token and a keyword
+    '''
+    data = request.get_json('data')
+    payload = user.user_keywords_remove(
+        data['token'],
+        data['keyword']
+    )
+    return dumps(payload)
+
+@APP.route('/user/alerts', methods=['GET'])
+def alerts():
+    '''
+    Returns the alerts of messages containing a user's keywords
+    given a token
+    '''
+    token = request.args.get('token')
+    payload = user.user_alerts(token)
+    return dumps(payload)
+
 
 #################
 # Search Routes #
@@ -475,12 +552,14 @@ def upload_photo():
 @APP.route('/search', methods=['GET'])
 def new_search():
     '''
-    Returns a list of messages contains the query string
-    given a token and a query string
+    Returns a page of messages containing the query string
+    given a token and a query string, and optionally a limit, a before cursor and
+    channel_id, u_id, time_start and time_end filters
     '''
     token = request.args.get('token')
     query_str = request.args.get('query_str')
-    payload = other.search(token, query_str)
+    filters = ('limit', 'before', 'channel_id', 'u_id', 'time_start', 'time_end')
+    payload = other.search(token, query_str, *(request.args.get(i) for i in filters))
     return dumps(payload)
 
 ##################
@@ -577,5 +656,6 @@ if __name__ == "__main__":
     try:
         threading.Thread(target=app_run).start()
         threading.Thread(target=pickle_data, daemon=True).start()
+        threading.Thread(target=sweep_sessions, daemon=True).start()
     except KeyboardInterrupt:
         sys.exit()
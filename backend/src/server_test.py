@@ -10,6 +10,7 @@ import json
 import urllib
 import flask
 from other import workplace_reset
+from records import get_message_channel
 import pytest
 
 PORT = 8080 # PORT - CHANGE ME
@@ -275,7 +276,8 @@ def test_channel_messages():
 			}
 		],
 		'start': 0,
-		'end': -1
+		'end': -1,
+		'next': -1
 	}
 
 	# Private Channel
@@ -314,7 +316,8 @@ def test_channel_messages():
 			}
 		],
 		'start': 0,
-		'end': -1
+		'end': -1,
+		'next': -1
 	}
 def test_channel_messages_invalid_channel():
     reset_server()
@@ -911,7 +914,7 @@ def test_send_message():
 	)
 	payload = json.load(urllib.request.urlopen(send))
 	# check result
-	assert payload['message_id'] == 1
+	assert get_message_channel(payload['message_id']) == 1
 
 # Testing a valid server return with message_send_later
 def test_send_message_later():
@@ -958,11 +961,11 @@ def test_message_react():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	react_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1,
+		'message_id': message['message_id'],
 		'react_id' : 1
 	}).encode('utf-8')
 	send_react = urllib.request.Request(
@@ -993,12 +996,12 @@ def test_message_unreact():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	# React message
 	react_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1,
+		'message_id': message['message_id'],
 		'react_id' : 1
 	}).encode('utf-8')
 	send_react = urllib.request.Request(
@@ -1011,7 +1014,7 @@ def test_message_unreact():
 	# Unreact message
 	unreact_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1,
+		'message_id': message['message_id'],
 		'react_id': 1
 	}).encode('utf-8')
 	send_unreact = urllib.request.Request(
@@ -1043,12 +1046,12 @@ def test_message_pin():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	# Pin message
 	pin_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1
+		'message_id': message['message_id']
 	}).encode('utf-8')
 	send_pin = urllib.request.Request(
 		f"{BASE_URL}/message/pin",
@@ -1079,12 +1082,12 @@ def test_message_unpin():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	# Pin message
 	pin_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1
+		'message_id': message['message_id']
 	}).encode('utf-8')
 	send_pin = urllib.request.Request(
 		f"{BASE_URL}/message/pin",
@@ -1096,7 +1099,7 @@ def test_message_unpin():
 	# Unpin message
 	unpin_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1
+		'message_id': message['message_id']
 	}).encode('utf-8')
 	send_unpin = urllib.request.Request(
 		f"{BASE_URL}/message/unpin",
@@ -1127,12 +1130,12 @@ def test_message_remove():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	# Remove the sent message
 	remove_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1
+		'message_id': message['message_id']
 	}).encode('utf-8')
 	send_remove = urllib.request.Request(
 		f"{BASE_URL}/message/remove",
@@ -1162,12 +1165,12 @@ def test_message_edit():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	# Edit the message
 	edit_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1,
+		'message_id': message['message_id'],
 		'message': "Edited Message"
 	}).encode('utf-8')
 	send_edit = urllib.request.Request(
@@ -1309,11 +1312,11 @@ def test_message_react_invalid():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	react_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1,
+		'message_id': message['message_id'],
 		'react_id' : 2
 	}).encode('utf-8')
 	send_react = urllib.request.Request(
@@ -1339,11 +1342,11 @@ def test_message_react_already_reacted():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	react_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1,
+		'message_id': message['message_id'],
 		'react_id' : 1
 	}).encode('utf-8')
 	send_react = urllib.request.Request(
@@ -1409,12 +1412,12 @@ def test_message_unreact_invalid():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	# React message
 	react_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1,
+		'message_id': message['message_id'],
 		'react_id' : 1
 	}).encode('utf-8')
 	send_react = urllib.request.Request(
@@ -1427,7 +1430,7 @@ def test_message_unreact_invalid():
 	# Unreact message
 	unreact_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1,
+		'message_id': message['message_id'],
 		'react_id': 2
 	}).encode('utf-8')
 	send_unreact = urllib.request.Request(
@@ -1456,12 +1459,12 @@ def test_message_unreact_invalid_message():
         data=message_data,
         headers={'Content-Type':'application/json'}
     )
-    payload = json.load(urllib.request.urlopen(send))
+    message = json.load(urllib.request.urlopen(send))
 
     # React message
     react_data = json.dumps({
         'token': owner['token'],
-        'message_id': 1,
+        'message_id': message['message_id'],
         'react_id' : 1
     }).encode('utf-8')
     send_react = urllib.request.Request(
@@ -1503,12 +1506,12 @@ def test_message_unreact_unreacted():
         data=message_data,
         headers={'Content-Type':'application/json'}
     )
-    payload = json.load(urllib.request.urlopen(send))
+    message = json.load(urllib.request.urlopen(send))
 
     # Unreact message
     unreact_data = json.dumps({
         'token': owner['token'],
-        'message_id': 1,
+        'message_id': message['message_id'],
         'react_id': 1
     }).encode('utf-8')
     send_unreact = urllib.request.Request(
@@ -1570,12 +1573,12 @@ def test_message_pin_already_pinned():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	# Pin message
 	pin_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1
+		'message_id': message['message_id']
 	}).encode('utf-8')
 	send_pin = urllib.request.Request(
 		f"{BASE_URL}/message/pin",
@@ -1608,12 +1611,12 @@ def test_message_pin_invalid_member():
         data=message_data,
         headers={'Content-Type':'application/json'}
     )
-    payload = json.load(urllib.request.urlopen(send))
+    message = json.load(urllib.request.urlopen(send))
 
 	# Pin message
     pin_data = json.dumps({
         'token': non_member['token'],
-        'message_id': 1
+        'message_id': message['message_id']
     }).encode('utf-8')
     send_pin = urllib.request.Request(
         f"{BASE_URL}/message/pin",
@@ -1640,12 +1643,12 @@ def test_message_pin_not_owner():
         data=message_data,
         headers={'Content-Type':'application/json'}
     )
-    payload = json.load(urllib.request.urlopen(send))
+    message = json.load(urllib.request.urlopen(send))
 
 	# Pin message
     pin_data = json.dumps({
         'token': member['token'],
-        'message_id': 1
+        'message_id': message['message_id']
     }).encode('utf-8')
     send_pin = urllib.request.Request(
         f"{BASE_URL}/message/pin",
@@ -1672,12 +1675,12 @@ def test_message_unpin_invalid():
         data=message_data,
         headers={'Content-Type':'application/json'}
     )
-    payload = json.load(urllib.request.urlopen(send))
+    message = json.load(urllib.request.urlopen(send))
 
     # Pin message
     pin_data = json.dumps({
         'token': owner['token'],
-        'message_id': 1
+        'message_id': message['message_id']
     }).encode('utf-8')
     send_pin = urllib.request.Request(
         f"{BASE_URL}/message/pin",
@@ -1716,12 +1719,12 @@ def test_message_unpin_already_unpinned():
         data=message_data,
         headers={'Content-Type':'application/json'}
     )
-    payload = json.load(urllib.request.urlopen(send))
+    message = json.load(urllib.request.urlopen(send))
 
     # Pin message
     pin_data = json.dumps({
         'token': owner['token'],
-        'message_id': 1
+        'message_id': message['message_id']
     }).encode('utf-8')
     send_pin = urllib.request.Request(
         f"{BASE_URL}/message/pin",
@@ -1733,7 +1736,7 @@ def test_message_unpin_already_unpinned():
     # Unpin message
     unpin_data = json.dumps({
         'token': owner['token'],
-        'message_id': 1
+        'message_id': message['message_id']
     }).encode('utf-8')
     send_unpin_1 = urllib.request.Request(
         f"{BASE_URL}/message/unpin",
@@ -1767,12 +1770,12 @@ def test_message_unpin_invalid_member():
         data=message_data,
         headers={'Content-Type':'application/json'}
     )
-    payload = json.load(urllib.request.urlopen(send))
+    message = json.load(urllib.request.urlopen(send))
 
     # Pin message
     pin_data = json.dumps({
         'token': owner['token'],
-        'message_id': 1
+        'message_id': message['message_id']
     }).encode('utf-8')
     send_pin = urllib.request.Request(
         f"{BASE_URL}/message/pin",
@@ -1784,7 +1787,7 @@ def test_message_unpin_invalid_member():
     # Unpin message
     unpin_data = json.dumps({
         'token': non_member['token'],
-        'message_id': 1
+        'message_id': message['message_id']
     }).encode('utf-8')
     send_unpin = urllib.request.Request(
         f"{BASE_URL}/message/unpin",
@@ -1811,12 +1814,12 @@ def test_message_unpin_not_owner():
         data=message_data,
         headers={'Content-Type':'application/json'}
     )
-    payload = json.load(urllib.request.urlopen(send))
+    message = json.load(urllib.request.urlopen(send))
 
     # Pin message
     pin_data = json.dumps({
         'token': owner['token'],
-        'message_id': 1
+        'message_id': message['message_id']
     }).encode('utf-8')
     send_pin = urllib.request.Request(
         f"{BASE_URL}/message/pin",
@@ -1856,12 +1859,12 @@ def test_message_remove_invalid():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	# Remove the sent message
 	remove_data = json.dumps({
 		'token': owner['token'],
-		'message_id': 1
+		'message_id': message['message_id']
 	}).encode('utf-8')
 	send_remove_1 = urllib.request.Request(
 		f"{BASE_URL}/message/remove",
@@ -1898,12 +1901,12 @@ def test_message_remove_invalid_access():
 		data=message_data,
 		headers={'Content-Type':'application/json'}
 	)
-	payload = json.load(urllib.request.urlopen(send))
+	message = json.load(urllib.request.urlopen(send))
 
 	# Remove the sent message
 	remove_data = json.dumps({
 		'token': member['token'],
-		'message_id': 1
+		'message_id': message['message_id']
 	}).encode('utf-8')
 	send_remove = urllib.request.Request(
 		f"{BASE_URL}/message/remove",
@@ -1931,12 +1934,12 @@ def test_message_edit_invalid_access():
         data=message_data,
         headers={'Content-Type':'application/json'}
     )
-    payload = json.load(urllib.request.urlopen(send))
+    message = json.load(urllib.request.urlopen(send))
 
 	# Edit the message
     edit_data = json.dumps({
         'token': member['token'],
-        'message_id': 1,
+        'message_id': message['message_id'],
         'message': "Edited Message"
     }).encode('utf-8')
     send_edit = urllib.request.Request(
@@ -7,6 +7,7 @@ from datetime import datetime
 from helper import validate_token, validate_channel, validate_member, validate_message_size, \
     get_standup, get_user, send_message
 from error import InputError
+from data import save_change, get_storage
 
 def standup_start(token, channel_id, length):
     '''
@@ -28,18 +29,20 @@ def standup_start(token, channel_id, length):
     validate_channel(channel_id)
     validate_member(u_id, channel_id)
 
-    # InputError: Standup is already active in the channel
-    standup = get_standup(channel_id)
-    if standup['is_active']:
-        raise InputError(description="Standup is already active in this channel")
+    with get_storage().lock:
+        # InputError: Standup is already active in the channel
+        standup = get_standup(channel_id)
+        if standup['is_active']:
+            raise InputError(description="Standup is already active in this channel")
 
-    # Calculate finish time
-    time_finish = int(datetime.now().timestamp() + length)
+        # Calculate finish time
+        time_finish = int(datetime.now().timestamp() + length)
 
-    # Activate standup
-    standup['u_id'] = u_id
-    standup['is_active'] = True
-    standup['time_finish'] = time_finish
+        # Activate standup
+        standup['u_id'] = u_id
+        standup['is_active'] = True
+        standup['time_finish'] = time_finish
+        save_change('standup', channel_id, standup)
 
     return {'time_finish' : standup['time_finish']}
 
@@ -65,11 +68,12 @@ def standup_active(token, channel_id):
     validate_channel(channel_id)
     validate_member(u_id, channel_id)
 
-    # Get standup data
-    standup = get_standup(channel_id)
+    with get_storage().lock:
+        # Get standup data
+        standup = get_standup(channel_id)
 
-    # If message isnt sent yet, send message at correct time and reinitialise parameters
-    standup_message_send(standup, channel_id)
+        # If message isnt sent yet, send message at correct time and reinitialise parameters
+        standup_message_send(standup, channel_id)
 
     return {
         'is_active' : standup['is_active'],
@@ -97,27 +101,31 @@ def standup_send(token, channel_id, message):
     validate_member(u_id, channel_id)
     validate_message_size(message)
 
-    standup = get_standup(channel_id)
+    # Hold the storage lock until the line is stored, so concurrent lines are not lost
+    with get_storage().lock:
+        standup = get_standup(channel_id)
 
-    # InputError: Standup is not currently active running in this channel
-    if not standup['is_active']:
-        raise InputError(description="No currently active standup in this channel")
+        # InputError: Standup is not currently active running in this channel
+        if not standup['is_active']:
+            raise InputError(description="No currently active standup in this channel")
 
-    # Add new message to list of buffered messages
-    user = get_user('u_id', u_id)
-    new_standup_message = f"{user['handle_str']}: {message}\n"
+        # Add new message to list of buffered messages
+        user = get_user('u_id', u_id)
+        new_standup_message = f"{user['handle_str']}: {message}\n"
 
-    # Create a message to be sent at the end of the standup
-    standup['messages'] += new_standup_message
+        # Create a message to be sent at the end of the standup
+        standup['messages'] += new_standup_message
+        save_change('standup', channel_id, standup)
 
-    # Send message at correct time and reinitialise parameters
-    standup_message_send(standup, channel_id)
+        # Send message at correct time and reinitialise parameters
+        standup_message_send(standup, channel_id)
 
     return {}
 
 def standup_message_send(standup, channel_id):
     '''
-    Sends the standup bundled message into the specified channel at the given time.
+    Sends the standup bundled message into the specified channel at the given time. Must be
+    called while holding the storage lock since the standup was read, so it is only sent once.
 
     Parameters:
         channel_id (int): channel ID
@@ -128,10 +136,10 @@ def standup_message_send(standup, channel_id):
     '''
     current_time = int(datetime.now().timestamp())
     if standup['is_active'] and standup['time_finish'] <= current_time:
-        standup_token = get_user('u_id', standup['u_id'])['tokens'][-1]
-        u_id = validate_token(standup_token)
-        send_message(u_id, channel_id, standup['messages'])
+        # The standup is sent by the user who started it, even if they have since logged out
+        send_message(standup['u_id'], channel_id, standup['messages'])
         standup['is_active'] = False
         standup['time_finish'] = None
         standup['u_id'] = None
         standup['messages'] = ""
+        save_change('standup', channel_id, standup)
@@ -197,7 +197,7 @@ def message_check_thread(token, channel_id, checked_message, time):
 
     # Check messages data structure
     messages = get_data()['messages'][channel_id]
-    message = next(i for i in messages if i['message_id'] == 1)
+    message = messages[0]
     assert message['message'] == checked_message
 
 def test_standup_send_valid():
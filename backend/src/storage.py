@@ -0,0 +1,2319 @@
+'''
+Storage Engines
+By H09A-PADTHAI
+Submitted 19 April 2020
+
+Both engines store the data structure described in data.py and provide the same methods for
+reading it. Every change is made through save_change as a (table, key, value) record:
+    ('users', u_id, user)
+    ('channels', channel_id, channel)
+    ('standup', channel_id, standup)
+    ('hangman', channel_id, hangman)
+    ('all_members', (channel_id, u_id), u_id)
+    ('owner_members', (channel_id, u_id), u_id)
+    ('messages', (channel_id, message_id), message)
+    ('tokens', (u_id, token), None)
+    ('ids', key, value)
+A value of None removes the entry. A token is removed from its user's list of tokens by a tokens
+record alone, without storing the rest of the user again, so a session can be ended without
+overwriting a concurrent change to the user.
+
+DictStorage
+Keeps the whole data structure in memory. Every change is appended to the mutation log
+(data_log.pickle) and marks the shard it belongs to as dirty. The log is kept open and each record
+is flushed before save_change returns, and also synced to disk unless the engine was created
+without log_sync, when a record survives the server crashing but not the machine. A checkpoint rewrites only the
+dirty shards in the snapshots directory:
+    users.pickle                users list
+    channels.pickle             channels dictionary
+    ids.pickle                  ID structure
+    messages_<channel_id>.pickle    message list of a single channel
+Shards are serialised from a consistent view of the data (a forked child process, or a single
+in-memory pickle per shard) and replace their snapshot files atomically, after which the part of
+the log they cover is discarded.
+On startup the users, channels and ids shards are loaded and the log is replayed on top of them.
+data_file.pickle and id_file.pickle are only read to migrate data stored before shards were
+introduced, and are renamed with an .imported suffix once the first checkpoint has written their
+data to shards, so they are not read again.
+Each channel's message list holds its messages oldest first, in message ID order, so sending a
+message appends to it, and the messages sent within a time range are found by binary search. A
+channel's message list is only loaded from its shard the first time the channel is accessed, and
+is kept in a least recently used cache (MessageCache). Once the cache holds more messages than
+its budget, channels whose shard is up to date are evicted back to disk. A message's channel
+is encoded in its ID, and the cache indexes the channel of every message with an older ID in a
+channel it has loaded, so a message is found by its ID without scanning the channels.
+Removing a message leaves a Tombstone in its place, which reads skip, so the rest of the list is
+not shifted. Once a channel's tombstones pass COMPACTION_RATIO of its list, the datastore thread
+compacts the list by dropping them.
+A loaded channel is given a TrigramIndex of its messages' text (see text_index.py) the first
+time it is searched for a query of at least three characters, so search only reads the messages
+which may contain the query, while shorter queries read the channel newest first. Indexes are
+kept until their channel is evicted, or until the indexes hold more postings than their budget,
+when the least recently searched are discarded. Channels which are not loaded and whose
+shard is up to date can instead be searched by a pool of search processes, each reading its
+share of the shards, so a search over a large history uses every core without loading the
+history into the message cache. The pool is started with the engine, before the server starts
+its threads, and each process keeps the message lists it has decoded until their shard is
+replaced. A channel changed while its shard was being searched is searched again in memory.
+Users are indexed by u_id, email and handle_str, and each token in a user's list of tokens has a
+Session, so none of these lookups scan the users list. Each channel's members and owners are
+also held in sets alongside their lists, and the channels of each member and the public channels
+are indexed so a user's channels are listed without scanning every channel.
+
+Both engines
+Give each channel a version, which changes whenever one of its messages is sent, edited, removed
+or reacted to, so results computed from a channel's messages can be reused until it changes.
+
+SqliteStorage
+Keeps the data structure in a local SQLite database with a table for each of users, tokens,
+channels, memberships, messages, reacts and ids. Lookups are indexed queries and only the rows
+a request needs are loaded into memory. Each call returns new dictionaries, so a change to one
+is only stored once it is passed to save_change. The Session of a token is kept in memory once
+it has been looked up, until the token is removed.
+'''
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from collections.abc import MutableMapping
+from time import time
+from records import Message, Session, Tombstone, to_message, get_message_channel, \
+    last_message_key, bisect_messages, time_window
+from text_index import TrigramIndex, TRIGRAM
+
+DEFAULT_IDS = {'message_id': 1, 'channel_id': 1, 'user_id': 1}
+
+# User fields, besides u_id, that users are looked up by through an index
+USER_INDEXES = ('email', 'handle_str')
+
+# Number of rows SqliteStorage reads at a time when returning a channel's messages in a time range
+RANGE_BATCH = 500
+
+#######################################
+#         DICTIONARY STORAGE          #
+#######################################
+
+class DictStorage:
+    '''
+    Storage engine keeping all data in memory, persisted by pickle snapshots and a mutation log.
+    '''
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-arguments
+    def __init__(self, data_file, id_file, log_file, snapshot_dir, checkpoint_size,
+                 snapshot_mode, message_cache_size, compaction_ratio, search_workers=0,
+                 parallel_search_size=0, text_index_size=0, log_sync=True):
+        '''
+        Loads the stored data.
+
+        Parameters:
+            data_file (str): path of the data structure stored before shards were introduced
+            id_file (str): path of the ID structure stored before shards were introduced
+            log_file (str): path of the mutation log
+            snapshot_dir (str): path of the directory of snapshot shards
+            checkpoint_size (int): size in bytes the mutation log may reach before a checkpoint
+                is due
+            snapshot_mode (str): 'fork' to serialise snapshots in a child process holding a
+                copy-on-write view of the data, 'inline' to serialise them in the calling thread
+            message_cache_size (int): number of messages that may be held in memory before
+                channels are evicted from the message cache
+            compaction_ratio (float): fraction of a channel's message list that may be
+                tombstones of removed messages before the list is compacted
+            search_workers (int): number of search processes, 0 to search every channel in the
+                calling thread
+            parallel_search_size (int): total size in bytes the shards of a search's unloaded
+                channels must reach before they are searched by the search processes
+            text_index_size (int): number of postings the trigram indexes of searched channels
+                may hold before the least recently searched are discarded
+            log_sync (bool): True to sync each mutation log record to disk before its change
+                returns, False to only flush it to the operating system
+        '''
+        self.data_file = data_file
+        self.id_file = id_file
+        self.log_file = log_file
+        self.snapshot_dir = snapshot_dir
+        self.checkpoint_size = checkpoint_size
+        self.snapshot_mode = snapshot_mode
+        self.message_cache_size = message_cache_size
+        self.compaction_ratio = compaction_ratio
+        self.search_workers = search_workers
+        self.parallel_search_size = parallel_search_size
+        self.text_index_size = text_index_size
+        self.log_sync = log_sync
+
+        # Mutation log opened for appending, reopened after the log is trimmed
+        self.log = None
+
+        # Pool of search processes, started by start_search_pool
+        self.search_pool = None
+
+        # lock guards the mutation log, the dirty shards and the message cache, snapshot_lock
+        # allows one checkpoint at a time
+        self.lock = threading.RLock()
+        self.snapshot_lock = threading.Lock()
+
+        # Shards changed since the last checkpoint
+        self.dirty = set()
+
+        # Shards being written by a checkpoint, which cannot be evicted
+        self.pinned = set()
+
+        self.stats = {
+            'snapshots': 0,
+            'failures': 0,
+            'duration': None,
+            'size': None,
+            'time_captured': None,
+        }
+        self.started = time()
+
+        self.data, self.ids = self.load()
+
+        # Version of each channel's messages
+        self.versions = ChannelVersions()
+
+        # Users by u_id, u_ids by the value of each indexed field, and the indexed values of
+        # each user, kept in sync with the users list by save_change
+        self.users = {}
+        self.user_index = {field: {} for field in USER_INDEXES}
+        self.indexed = {}
+
+        # Sessions by token, and the tokens each user had when their sessions were last updated
+        self.sessions = {}
+        self.tokens = {}
+        self.index_users()
+
+        # Sets of the members and owners of each channel, the channel IDs of each member and the
+        # IDs of public channels, kept in sync with the channels' lists by save_change
+        self.members = {}
+        self.user_channels = {}
+        self.public_channels = set()
+        self.index_members()
+
+        # Migrate data stored before shards were introduced at the next checkpoint, after which
+        # the files it was read from are retired
+        self.importing = os.path.exists(data_file) or os.path.exists(id_file)
+        if self.importing or not os.path.isdir(snapshot_dir):
+            self.dirty.update(get_shards(self.data))
+
+    ########## READING ##########
+
+    def get_data(self):
+        '''
+        Returns the data structure.
+        '''
+        return self.data
+
+    def get_ids(self):
+        '''
+        Returns the ID structure.
+        '''
+        return self.ids
+
+    def get_users(self):
+        '''
+        Returns the list of all users.
+        '''
+        return self.data['users']
+
+    def count_users(self):
+        '''
+        Returns the number of users.
+        '''
+        return len(self.data['users'])
+
+    def get_user(self, key, value):
+        '''
+        Returns the user whose field matches the given value, otherwise False. Users are found
+        through an index by u_id, email and handle_str, and by scanning every user otherwise.
+        '''
+        if key == 'u_id':
+            return self.users.get(value, False)
+        if key in self.user_index:
+            u_id = self.user_index[key].get(value)
+            return self.users[u_id] if u_id is not None else False
+        return next((user for user in self.data['users'] if user.get(key) == value), False)
+
+    def get_session(self, token):
+        '''
+        Returns the session of the given token, otherwise None.
+        '''
+        return self.sessions.get(token)
+
+    def get_sessions(self):
+        '''
+        Returns a list of (token, session) pairs for every active token.
+        '''
+        with self.lock:
+            return list(self.sessions.items())
+
+    def is_used(self, key, value):
+        '''
+        Returns True if a user's field matches the given value, otherwise False.
+        '''
+        return bool(self.get_user(key, value))
+
+    def get_channels(self):
+        '''
+        Returns the dictionary of all channels.
+        '''
+        return self.data['channels']
+
+    def get_channel(self, channel_id):
+        '''
+        Returns the specified channel, otherwise None.
+        '''
+        return self.data['channels'].get(channel_id)
+
+    def get_user_channels(self, u_id, public=False):
+        '''
+        Returns the channels the user is a member of, in channel ID order.
+
+        Parameters:
+            u_id (int): user ID
+            public (bool): True to include every public channel
+
+        Returns:
+            (list of tuple): list of channel IDs (int) and names (str)
+        '''
+        channel_ids = self.user_channels.get(u_id, set())
+        if public:
+            channel_ids = channel_ids | self.public_channels
+        channels = self.data['channels']
+        return [(channel_id, channels[channel_id]['name']) for channel_id in sorted(channel_ids)]
+
+    def is_member(self, u_id, channel_id):
+        '''
+        Returns True if the user is a member of the specified channel, otherwise False.
+        '''
+        return u_id in self.members.get(channel_id, {}).get('all_members', ())
+
+    def is_owner(self, u_id, channel_id):
+        '''
+        Returns True if the user is an owner of the specified channel, otherwise False.
+        '''
+        return u_id in self.members.get(channel_id, {}).get('owner_members', ())
+
+    def get_channel_messages(self, channel_id):
+        '''
+        Returns the list of messages of the specified channel, oldest first.
+        '''
+        return self.data['messages'].setdefault(channel_id, [])
+
+    def count_channel_messages(self, channel_id):
+        '''
+        Returns the number of messages in the specified channel.
+        '''
+        messages = self.data['messages']
+        if channel_id not in messages:
+            return 0
+        return len(messages.history(channel_id)) - messages.tombstones.get(channel_id, 0)
+
+    def get_channel_page(self, channel_id, limit, start=0, before=None, after=None):
+        '''
+        Returns a page of the messages of the specified channel, newest first, found by binary
+        search when a cursor is given.
+
+        Parameters:
+            channel_id (int): channel ID
+            limit (int): the most messages to return
+            start (int): number of the newest messages to skip when no cursor is given
+            before (int or None): return the newest messages with IDs below this message ID
+            after (int or None): return the oldest messages with IDs above this message ID
+
+        Returns:
+            (tuple): list of messages (list of Message) and whether there are more messages
+                beyond the page (bool)
+        '''
+        cache = self.data['messages']
+        if channel_id not in cache:
+            return [], False
+        with self.lock:
+            messages = cache.history(channel_id)
+            if not cache.tombstones.get(channel_id):
+                return page_messages(messages, limit, start, before, after)
+
+            # Walk the list from the cursor, skipping tombstones
+            if after is not None:
+                indexes = range(bisect_messages(messages, after + 1), len(messages))
+            elif before is not None:
+                indexes = range(bisect_messages(messages, before) - 1, -1, -1)
+            else:
+                indexes = range(len(messages) - 1, -1, -1)
+            live = (messages[i] for i in indexes if not isinstance(messages[i], Tombstone))
+            if after is None and before is None:
+                for _ in zip(range(start), live):
+                    pass
+            page = [message for _, message in zip(range(limit), live)]
+            more = next(live, None) is not None
+            return (page[::-1] if after is not None else page), more
+
+    def search_channel_messages(self, channel_id, query_str, limit, before=None, u_id=None,
+                                time_start=None, time_end=None):
+        '''
+        Returns the messages of the specified channel containing the query string and matching
+        the filters, newest first. The time range and cursor are found by binary search, and
+        candidates within them through the channel's trigram index. Candidates are only checked
+        against the query as the result is read, so reading stops once enough messages are
+        found.
+
+        Parameters:
+            channel_id (int): channel ID
+            query_str (str): query string
+            limit (int): the most messages to return
+            before (int or None): only return messages with IDs below this message ID
+            u_id (int or None): only return messages sent by this user
+            time_start (int or None): only return messages sent at or after this unix timestamp
+            time_end (int or None): only return messages sent at or before this unix timestamp
+
+        Returns:
+            (iterator of Message): the matching messages
+        '''
+        cache = self.data['messages']
+        if channel_id not in cache:
+            return iter(())
+        with self.lock:
+            messages = cache.history(channel_id)
+            by_id = cache.by_id[channel_id]
+            low, high = time_window(messages, time_start, time_end)
+            if before is not None:
+                high = min(high, bisect_messages(messages, before))
+            if low >= high:
+                return iter(())
+
+            # Short queries match too many messages for the index to narrow down
+            candidates = cache.get_text_index(channel_id).search(query_str) \
+                if len(query_str) >= TRIGRAM else None
+            if candidates is None:
+                return filter_messages(walk_newest_first(messages, low, high), query_str, limit,
+                                       u_id)
+            first, last = messages[low].message_id, messages[high - 1].message_id
+            candidates = sorted((message_id for message_id in candidates
+                                 if first <= message_id <= last), reverse=True)
+        newest_first = (by_id.get(message_id) for message_id in candidates)
+        return filter_messages(newest_first, query_str, limit, u_id)
+
+    def search_messages(self, channel_ids, query_str, limit, before=None, u_id=None,
+                        time_start=None, time_end=None):
+        '''
+        Returns the matches of a search in each of the specified channels. Once the shards of
+        the channels which are not loaded reach the parallel search size, they are divided
+        between the search processes and searched at the same time, while the loaded channels
+        are searched through their trigram index. Takes the same parameters as
+        search_channel_messages.
+
+        Returns:
+            (list of iterator of Message): the matching messages of each channel, newest first
+        '''
+        filters = (query_str, limit, before, u_id, time_start, time_end)
+        sizes = {}
+        if self.search_pool is not None:
+            cache = self.data['messages']
+            with self.lock:
+                for channel_id in channel_ids:
+                    shard = get_shard('messages', (channel_id, None))
+                    if channel_id in cache and channel_id not in cache.loaded and \
+                            shard not in self.dirty and os.path.exists(self.shard_path(shard)):
+                        sizes[channel_id] = os.path.getsize(self.shard_path(shard))
+                versions = dict(zip(sizes, self.versions.get(list(sizes))))
+            if sum(sizes.values()) < self.parallel_search_size:
+                sizes = {}
+
+        results = {}
+        if sizes:
+            futures = []
+            for partition in partition_channels(sizes, self.search_workers):
+                paths = [self.shard_path(get_shard('messages', (i, None))) for i in partition]
+                futures.append((partition, self.search_pool.submit(
+                    search_shards, paths, self.message_cache_size, *filters)))
+            for partition, future in futures:
+                results.update(zip(partition, future.result()))
+
+            # Channels changed since their shards were chosen are searched again in memory
+            with self.lock:
+                current = self.versions.get(list(results))
+            for channel_id, version in zip(list(results), current):
+                if version != versions[channel_id]:
+                    del results[channel_id]
+
+        return [iter(results[channel_id]) if channel_id in results
+                else self.search_channel_messages(channel_id, *filters)
+                for channel_id in channel_ids]
+
+    def start_search_pool(self):
+        '''
+        Starts the search processes, if the engine has any. Must be called before the server
+        starts its threads, as a process forked while other threads are running can inherit a
+        lock one of them holds.
+        '''
+        if not self.search_workers or self.search_pool is not None:
+            return
+        context = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+        self.search_pool = ProcessPoolExecutor(self.search_workers, mp_context=context)
+
+        # The processes are started by the first task, so start them now rather than in a search
+        self.search_pool.submit(os.getpid).result()
+
+    def get_channel_versions(self, channel_ids):
+        '''
+        Returns the current versions of the messages of the specified channels.
+        '''
+        with self.lock:
+            return self.versions.get(channel_ids)
+
+    def get_last_message_id(self, channel_id):
+        '''
+        Returns the last message ID issued in the specified channel, otherwise None. It is read
+        from the newest message or tombstone of the channel, unless the newest message was
+        removed and compacted, when its ID is kept in the ID structure so it is not issued again.
+        '''
+        message_ids = [self.ids.get(last_message_key(channel_id))]
+        cache = self.data['messages']
+        if channel_id in cache:
+            messages = cache.history(channel_id)
+            if messages:
+                message_ids.append(messages[-1].message_id)
+        return max((i for i in message_ids if i is not None), default=None)
+
+    def get_channel_range(self, channel_id, time_start=None, time_end=None):
+        '''
+        Returns the messages of the specified channel sent between two times, inclusive, oldest
+        first. The window is found by binary search on the time each message was sent.
+
+        Parameters:
+            channel_id (int): channel ID
+            time_start (int or None): unix timestamp, None from the first message
+            time_end (int or None): unix timestamp, None to the last message
+
+        Returns:
+            (iterator of Message): the messages sent in the window
+        '''
+        cache = self.data['messages']
+        if channel_id not in cache:
+            return iter(())
+        with self.lock:
+            messages = cache.history(channel_id)
+            low, high = time_window(messages, time_start, time_end)
+            window = messages[low:high]
+        return (message for message in window if not isinstance(message, Tombstone))
+
+    def get_channel_by_message(self, message_id):
+        '''
+        Returns the channel ID of the channel containing the specified message, otherwise False.
+        '''
+        located = self.data['messages'].locate(message_id)
+        return located[0] if located else False
+
+    def get_message(self, message_id):
+        '''
+        Returns the specified message, otherwise False.
+        '''
+        located = self.data['messages'].locate(message_id)
+        return located[1] if located else False
+
+    ########## WRITING ##########
+
+    def compact(self):
+        '''
+        Compacts the message lists of channels whose tombstones have passed the compaction
+        ratio. Compacting a channel holds the storage lock, which every request shares, but the
+        lock is released between channels, so a request waits for at most one channel's
+        compaction rather than the whole pass.
+
+        Returns:
+            (int): number of channels compacted
+        '''
+        messages = self.data['messages']
+        channel_ids = list(messages.compactable)
+        for channel_id in channel_ids:
+            messages.compact(channel_id)
+        return len(channel_ids)
+
+    def save_change(self, table, key, value):
+        '''
+        Applies a change to the data structure and appends it to the mutation log.
+
+        Parameters:
+            table (str): the part of the data structure that changed
+            key (int, str or tuple): identifies the changed entry within the table
+            value: the new value of the entry, or None if the entry was removed
+        '''
+        with self.lock:
+            # The ID of the newest message is kept once it is removed, so it is not issued again
+            if table == 'messages' and value is None and \
+                    key[1] == self.get_last_message_id(key[0]):
+                self.save_change('ids', last_message_key(key[0]), key[1])
+
+            if table == 'users':
+                self.apply_user(key, value)
+            elif table == 'tokens':
+                self.apply_token(*key)
+            elif table in ('all_members', 'owner_members'):
+                self.apply_member(table, key, value)
+            else:
+                apply_change(self.data, self.ids, table, key, value)
+                if table == 'channels':
+                    self.index_channel_members(key)
+                elif table == 'messages':
+                    self.versions.update(key[0])
+            self.write_log((table, key, value))
+            self.dirty.add(get_shard(table, key))
+            if table == 'channels':
+                self.dirty.add(get_shard('messages', (key, None)))
+
+    def reset(self):
+        '''
+        Removes all data and replaces the stored checkpoint.
+        '''
+        with self.lock:
+            self.data['users'] = []
+            self.data['channels'] = {}
+            self.data['messages'] = MessageCache(self)
+            self.versions.clear()
+            self.ids.clear()
+            self.ids.update(DEFAULT_IDS)
+            self.index_users()
+            self.index_members()
+        self.checkpoint(full=True)
+
+    def apply_user(self, u_id, user):
+        '''
+        Replaces, adds or removes a user in the users list and the user indexes. A user changed
+        in place only needs its indexes updated, without searching the users list.
+
+        Parameters:
+            u_id (int): user ID
+            user (dict or None): the new user dictionary, or None to remove the user
+        '''
+        current = self.users.get(u_id)
+        if user is None:
+            if current is not None:
+                self.data['users'].remove(current)
+        elif current is None:
+            self.data['users'].append(user)
+        elif current is not user:
+            self.data['users'][self.data['users'].index(current)] = user
+        self.index_user(u_id, user)
+
+    def apply_token(self, u_id, token):
+        '''
+        Removes a token from a user's list of tokens and ends its session, changing the user in
+        place.
+
+        Parameters:
+            u_id (int): user ID
+            token (str): the token to remove
+        '''
+        user = self.users.get(u_id)
+        if user is not None and token in user['tokens']:
+            user['tokens'].remove(token)
+            self.index_user(u_id, user)
+
+    def index_user(self, u_id, user):
+        '''
+        Updates the user indexes and sessions for a user.
+
+        Parameters:
+            u_id (int): user ID
+            user (dict or None): the user dictionary, or None if the user was removed
+        '''
+        for field, value in self.indexed.pop(u_id, {}).items():
+            if self.user_index[field].get(value) == u_id:
+                del self.user_index[field][value]
+
+        tokens = frozenset(user['tokens']) if user is not None else frozenset()
+        previous = self.tokens.pop(u_id, frozenset())
+        remove_sessions(self.sessions, previous - tokens)
+        for token in tokens - previous:
+            self.sessions[token] = Session(u_id)
+
+        if user is None:
+            self.users.pop(u_id, None)
+            return
+
+        self.users[u_id] = user
+        self.tokens[u_id] = tokens
+        self.indexed[u_id] = {field: user[field] for field in USER_INDEXES}
+        for field, value in self.indexed[u_id].items():
+            self.user_index[field][value] = u_id
+
+    def index_users(self):
+        '''
+        Rebuilds the user indexes from the users list.
+        '''
+        self.users = {}
+        self.user_index = {field: {} for field in USER_INDEXES}
+        self.indexed = {}
+        self.sessions = {}
+        self.tokens = {}
+        for user in self.data['users']:
+            self.index_user(user['u_id'], user)
+
+    def apply_member(self, table, key, value):
+        '''
+        Adds or removes a member or owner of a channel, using the channel's set to find out
+        whether the user is already in its list.
+
+        Parameters:
+            table (str): 'all_members' or 'owner_members'
+            key (tuple): channel ID and user ID
+            value (int or None): the user ID, or None to remove the user
+        '''
+        channel_id, u_id = key
+        members = self.members[channel_id][table]
+        if value is None:
+            if u_id in members:
+                members.remove(u_id)
+                self.data['channels'][channel_id][table].remove(u_id)
+                if table == 'all_members':
+                    self.user_channels[u_id].discard(channel_id)
+        elif u_id not in members:
+            members.add(u_id)
+            self.data['channels'][channel_id][table].append(u_id)
+            if table == 'all_members':
+                self.user_channels.setdefault(u_id, set()).add(channel_id)
+
+    def index_channel_members(self, channel_id):
+        '''
+        Rebuilds the member and owner sets of a channel from its lists, and updates the channel
+        indexes of the members who joined or left.
+        '''
+        channel = self.data['channels'][channel_id]
+        previous = self.members.get(channel_id, {}).get('all_members', set())
+        self.members[channel_id] = {
+            table: set(channel[table]) for table in ('all_members', 'owner_members')
+        }
+        for u_id in previous - self.members[channel_id]['all_members']:
+            self.user_channels[u_id].discard(channel_id)
+        for u_id in self.members[channel_id]['all_members'] - previous:
+            self.user_channels.setdefault(u_id, set()).add(channel_id)
+
+        if channel['is_public']:
+            self.public_channels.add(channel_id)
+        else:
+            self.public_channels.discard(channel_id)
+
+    def index_members(self):
+        '''
+        Rebuilds the member and owner sets of every channel and the channel indexes.
+        '''
+        self.members = {}
+        self.user_channels = {}
+        self.public_channels = set()
+        for channel_id in self.data['channels']:
+            self.index_channel_members(channel_id)
+
+    ########## PERSISTENCE ##########
+
+    def shard_path(self, shard):
+        '''
+        Returns the path of the snapshot file of a shard.
+
+        Parameters:
+            shard (str): name of the shard
+
+        Returns:
+            (str): path of the snapshot file
+        '''
+        return os.path.join(self.snapshot_dir, f"{shard}.pickle")
+
+    def read_shard(self, shard, default):
+        '''
+        Returns the contents of a shard's snapshot file.
+
+        Parameters:
+            shard (str): name of the shard
+            default: value returned if the shard has no snapshot file
+
+        Returns:
+            the stored value of the shard
+        '''
+        if not os.path.exists(self.shard_path(shard)):
+            return default
+
+        with open(self.shard_path(shard), 'rb') as FILE:
+            return pickle.load(FILE)
+
+    def dump_shard(self, shard):
+        '''
+        Returns the current value of a shard in pickle format. The value is serialised into
+        memory in a single step, so it cannot be changed by another thread part way through.
+
+        Parameters:
+            shard (str): name of the shard
+
+        Returns:
+            (bytes): pickled value of the shard
+        '''
+        if shard == 'ids':
+            value = self.ids
+        elif shard in ('users', 'channels'):
+            value = self.data[shard]
+        else:
+            channel_id = int(shard[len('messages_'):])
+            value = self.data['messages'][channel_id]
+
+        return pickle.dumps(value)
+
+    def write_shards(self, shards):
+        '''
+        Writes the current values of the given shards to their snapshot files.
+
+        Parameters:
+            shards (set of str): names of the shards
+
+        Returns:
+            (int): total size in bytes of the snapshot files written
+        '''
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        size = 0
+        for shard in shards:
+            contents = self.dump_shard(shard)
+            write_file(self.shard_path(shard), contents)
+            size += len(contents)
+        return size
+
+    def write_log(self, record):
+        '''
+        Appends a record to the mutation log, flushing it and syncing it to disk if log_sync is
+        set. Must be called while holding the lock.
+
+        Parameters:
+            record (tuple): (table, key, value) record
+        '''
+        if self.log is None:
+            self.log = open(self.log_file, 'ab')
+        pickle.dump(record, self.log)
+        self.log.flush()
+        if self.log_sync:
+            os.fsync(self.log.fileno())
+
+    def read_log(self):
+        '''
+        Returns the records of the mutation log in the order they were written. A record that
+        was only partially written before a crash ends the log, and is cut off so the records
+        appended after it can be read.
+
+        Returns:
+            (list of tuple): list of (table, key, value) records
+        '''
+        records = []
+        if not os.path.exists(self.log_file):
+            return records
+
+        end = 0
+        with open(self.log_file, 'rb') as FILE:
+            while True:
+                try:
+                    records.append(pickle.load(FILE))
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                end = FILE.tell()
+        if end < os.path.getsize(self.log_file):
+            os.truncate(self.log_file, end)
+        return records
+
+    def load(self):
+        '''
+        Reassembles the last checkpoint from its shards and replays the mutation log on top
+        of it. Message lists are left on disk until they are accessed, so shards that differ
+        from the returned data are marked as dirty.
+
+        Returns:
+            (tuple of dict): data structure and ID structure
+        '''
+        data = {'users': [], 'channels': {}, 'messages': {}}
+        ids = dict(DEFAULT_IDS)
+
+        # Data stored before shards were introduced
+        if os.path.exists(self.data_file):
+            with open(self.data_file, 'rb') as FILE:
+                data = pickle.load(FILE)
+
+        if os.path.exists(self.id_file):
+            with open(self.id_file, 'rb') as FILE:
+                ids = pickle.load(FILE)
+
+        data['users'] = [upgrade_user(user) for user in self.read_shard('users', data['users'])]
+        data['channels'] = {
+            channel_id: upgrade_channel(channel)
+            for channel_id, channel in self.read_shard('channels', data['channels']).items()
+        }
+        ids = self.read_shard('ids', ids)
+
+        messages = MessageCache(self)
+        for channel_id in data['channels']:
+            shard = get_shard('messages', (channel_id, None))
+            if os.path.exists(self.shard_path(shard)):
+                messages.add_channel(channel_id)
+            else:
+                messages[channel_id] = oldest_first([
+                    to_message(message) for message in data['messages'].get(channel_id, [])
+                ])
+                self.dirty.add(shard)
+        data['messages'] = messages
+
+        for table, key, value in self.read_log():
+            apply_change(data, ids, table, key, value)
+            self.dirty.add(get_shard(table, key))
+
+        return data, ids
+
+    def trim_log(self, offset):
+        '''
+        Discards the start of the mutation log, keeping the records written after the given
+        offset.
+
+        Parameters:
+            offset (int): position in the log of the first record to keep
+        '''
+        with self.lock:
+            if not os.path.exists(self.log_file):
+                return
+            with open(self.log_file, 'rb') as FILE:
+                FILE.seek(offset)
+                remaining = FILE.read()
+
+            # The open log is replaced by the trimmed file
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+            write_file(self.log_file, remaining)
+
+    def retire_legacy_files(self):
+        '''
+        Renames the files of data stored before shards were introduced once a checkpoint has
+        written their data to shards, so they are not read again on startup.
+        '''
+        for path in (self.data_file, self.id_file):
+            if os.path.exists(path):
+                os.replace(path, f"{path}.imported")
+        self.importing = False
+
+    def snapshot_fork(self, shards):
+        '''
+        Writes the given shards from a forked child process, which sees the data as it was at
+        the moment of the fork while the parent keeps serving requests.
+
+        Parameters:
+            shards (set of str): names of the shards
+
+        Returns:
+            (bool): True if every shard was written
+        '''
+        pid = os.fork()
+        if pid == 0:
+            # Child: never return into the server
+            status = 1
+            try:
+                self.write_shards(shards)
+                status = 0
+            finally:
+                os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+        return status == 0
+
+    def snapshot_inline(self, shards):
+        '''
+        Writes the given shards from the calling thread.
+
+        Parameters:
+            shards (set of str): names of the shards
+
+        Returns:
+            (bool): True if every shard was written
+        '''
+        try:
+            self.write_shards(shards)
+        except (OSError, pickle.PicklingError):
+            return False
+        return True
+
+    def checkpoint(self, full=False):
+        '''
+        Writes the dirty shards to their snapshot files and discards the part of the mutation
+        log they cover. Nothing is written if no shard has changed since the last checkpoint.
+        Request threads only wait while the dirty shards are handed over, not while the shards
+        are serialised and written.
+
+        Parameters:
+            full (bool): True to rewrite every shard and discard shards of channels that no
+                longer exist
+
+        Returns:
+            (bool): True if the snapshot was written or there was nothing to write
+        '''
+        with self.snapshot_lock:
+            # Capture the point in the log the snapshot will cover
+            with self.lock:
+                if full:
+                    self.dirty.clear()
+                    self.dirty.update(get_shards(self.data))
+                if not self.dirty:
+                    return True
+                shards = set(self.dirty)
+                self.dirty.clear()
+
+                # Keep the message lists being written in memory until they are written
+                self.pinned = shards
+                messages = self.data['messages']
+                for shard in shards:
+                    channel_id = int(shard[len('messages_'):]) if shard.startswith('messages_') \
+                        else None
+                    if channel_id is not None and channel_id not in messages.loaded and \
+                            channel_id in messages:
+                        messages.history(channel_id)
+                offset = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+                time_captured = time()
+
+            # However the write ends, unpin the lists and keep unwritten shards dirty
+            success = False
+            try:
+                if self.snapshot_mode == 'fork':
+                    success = self.snapshot_fork(shards)
+                else:
+                    success = self.snapshot_inline(shards)
+            finally:
+                with self.lock:
+                    self.pinned = set()
+                    if not success:
+                        self.dirty.update(shards)
+                        self.stats['failures'] += 1
+                    self.data['messages'].evict()
+
+            if not success:
+                return False
+
+            # Records written since the capture are replayed over the snapshot on startup
+            self.trim_log(offset)
+            if self.importing:
+                self.retire_legacy_files()
+
+            if full:
+                names = {f"{shard}.pickle" for shard in get_shards(self.data)}
+                for name in os.listdir(self.snapshot_dir):
+                    if name not in names:
+                        os.remove(os.path.join(self.snapshot_dir, name))
+
+            self.stats['snapshots'] += 1
+            self.stats['duration'] = time() - time_captured
+            self.stats['size'] = sum(os.path.getsize(self.shard_path(shard)) for shard in shards)
+            self.stats['time_captured'] = time_captured
+            return True
+
+    def is_checkpoint_due(self):
+        '''
+        Returns True if the mutation log has grown past the checkpoint size.
+        '''
+        return os.path.exists(self.log_file) and \
+            os.path.getsize(self.log_file) >= self.checkpoint_size
+
+    def get_stats(self):
+        '''
+        Returns statistics about the most recent snapshot.
+
+        Returns:
+            (dict): dictionary containing the snapshot mode (str), number of snapshots written
+                and failed (int), duration of the last snapshot in seconds (float), size in bytes
+                of the shards it wrote (int), lag in seconds between the live data and the
+                stored snapshot (float), number of dirty shards (int) and size in bytes of the
+                mutation log (int)
+        '''
+        with self.lock:
+            dirty = len(self.dirty)
+            log_size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+
+        lag = 0
+        if dirty or log_size:
+            lag = time() - (self.stats['time_captured'] or self.started)
+
+        return {
+            'mode': self.snapshot_mode,
+            'snapshots': self.stats['snapshots'],
+            'failures': self.stats['failures'],
+            'duration': self.stats['duration'],
+            'size': self.stats['size'],
+            'lag': lag,
+            'dirty': dirty,
+            'log_size': log_size,
+        }
+
+
+class MessageCache(MutableMapping):
+    '''
+    Dictionary of channel IDs to message lists, which loads a channel's message list from its
+    shard the first time it is accessed and evicts the least recently used channels once more
+    messages are held than the storage's message cache size. Only channels whose shard is up to
+    date are evicted, so a changed channel stays in memory until the next checkpoint.
+
+    The channel of each message whose ID does not encode it is indexed once its channel has been
+    loaded, and kept after the channel is evicted. Messages must be changed through set_message
+    to keep the index correct.
+
+    A removed message is replaced by a Tombstone in its channel's list until the list is
+    compacted. history returns the list including tombstones, while reading a channel by key
+    returns its messages alone.
+
+    The trigrams of a loaded channel's messages are held in a TrigramIndex built the first time
+    the channel is searched, which set_message keeps up to date. Indexes are discarded from least
+    to most recently searched once they hold more postings than the storage's text index size,
+    and along with their channel when it is evicted.
+    '''
+    def __init__(self, storage):
+        '''
+        Parameters:
+            storage (DictStorage): the storage the message lists belong to
+        '''
+        self.storage = storage
+
+        # All channel IDs, and the message lists in memory from least to most recently used
+        self.channel_ids = {}
+        self.loaded = OrderedDict()
+
+        # Channel IDs by message ID for IDs given out by the global counter, the messages of each
+        # loaded channel by message ID, and the channels which have not been loaded since they
+        # were added
+        self.index = {}
+        self.by_id = {}
+        self.unindexed = set()
+
+        # Trigram indexes of the loaded channels which have been searched, from least to most
+        # recently searched
+        self.text_index = OrderedDict()
+
+        # Number of tombstones in each loaded channel's message list, and the channels with
+        # enough tombstones to be compacted
+        self.tombstones = {}
+        self.compactable = set()
+
+    def add_channel(self, channel_id):
+        '''
+        Adds a channel whose message list is stored in its shard, without loading it.
+        '''
+        self.channel_ids[channel_id] = None
+        self.unindexed.add(channel_id)
+
+    def index_channel(self, channel_id, messages):
+        '''
+        Indexes the messages of a channel's message list as it is loaded.
+        '''
+        for message_id in self.by_id.pop(channel_id, {}):
+            self.index.pop(message_id, None)
+        self.by_id[channel_id] = {message.message_id: message for message in messages}
+        self.index.update((message_id, channel_id) for message_id in self.by_id[channel_id]
+                          if get_message_channel(message_id) is None)
+        self.text_index.pop(channel_id, None)
+        self.unindexed.discard(channel_id)
+
+    def get_text_index(self, channel_id):
+        '''
+        Returns the trigram index of a loaded channel's messages, building it if the channel has
+        not been searched since it was loaded.
+        '''
+        with self.storage.lock:
+            text_index = self.text_index.get(channel_id)
+            if text_index is None:
+                text_index = TrigramIndex(self.by_id[channel_id].values())
+                self.text_index[channel_id] = text_index
+            self.text_index.move_to_end(channel_id)
+            self.evict_text_indexes()
+            return text_index
+
+    def locate(self, message_id):
+        '''
+        Returns the channel ID and record of a message. The channel of an ID given out by the
+        global counter is found through the index, loading any channels which have not been
+        indexed until the message is found.
+
+        Parameters:
+            message_id (int): message ID
+
+        Returns:
+            (tuple or None): channel ID (int) and message (Message), None if the message does
+                not exist
+        '''
+        with self.storage.lock:
+            channel_id = get_message_channel(message_id)
+            if channel_id is None:
+                channel_id = self.index.get(message_id)
+            while channel_id is None and self.unindexed:
+                self.history(next(iter(self.unindexed)))
+                channel_id = self.index.get(message_id)
+            if channel_id is None or channel_id not in self.channel_ids:
+                return None
+            self.history(channel_id)
+            message = self.by_id[channel_id].get(message_id)
+            return (channel_id, message) if message is not None else None
+
+    def set_message(self, channel_id, message_id, message):
+        '''
+        Replaces, adds or removes a message in a channel's message list and the index. A
+        message changed in place only needs its index checked, and a new message is appended,
+        so neither searches the list. A removed message is replaced by a tombstone, marking the
+        channel to be compacted once its tombstones pass the compaction ratio.
+
+        Parameters:
+            channel_id (int): channel ID
+            message_id (int): message ID
+            message (Message or None): the new message record, or None to remove the message
+        '''
+        with self.storage.lock:
+            messages = self.history(channel_id)
+            by_id = self.by_id[channel_id]
+            text_index = self.text_index.get(channel_id)
+            current = by_id.get(message_id)
+            if current is not None and current is message:
+                if text_index is not None:
+                    text_index.update(message_id, message.message)
+            elif current is not None:
+                index = bisect_messages(messages, message_id)
+                if index == len(messages) or messages[index] is not current:
+                    index = next(i for i, entry in enumerate(messages) if entry is current)
+                if message is None:
+                    messages[index] = Tombstone(message_id, current.time_created)
+                    del by_id[message_id]
+                    self.index.pop(message_id, None)
+                    if text_index is not None:
+                        text_index.remove(message_id)
+                    self.tombstones[channel_id] = self.tombstones.get(channel_id, 0) + 1
+                    if self.tombstones[channel_id] > \
+                            len(messages) * self.storage.compaction_ratio:
+                        self.compactable.add(channel_id)
+                else:
+                    messages[index] = message
+                    by_id[message_id] = message
+                    if text_index is not None:
+                        text_index.update(message_id, message.message)
+            elif current is None and message is not None:
+                # new messages have the channel's highest ID, so are sent to the end
+                if messages and messages[-1].message_id > message_id:
+                    messages.insert(bisect_messages(messages, message_id), message)
+                else:
+                    messages.append(message)
+                by_id[message_id] = message
+                if text_index is not None:
+                    text_index.add(message_id, message.message)
+                if get_message_channel(message_id) is None:
+                    self.index[message_id] = channel_id
+
+    def compact(self, channel_id):
+        '''
+        Removes the tombstones from a channel's message list.
+        '''
+        with self.storage.lock:
+            self.compactable.discard(channel_id)
+            if self.tombstones.pop(channel_id, None) and channel_id in self.loaded:
+                # A new list, so searches walking the old one are not shifted
+                self.loaded[channel_id] = [i for i in self.loaded[channel_id]
+                                           if not isinstance(i, Tombstone)]
+
+    def history(self, channel_id):
+        '''
+        Returns a channel's message list including the tombstones of removed messages, loading
+        it from its shard if it is not in memory.
+        '''
+        try:
+            messages = self.loaded[channel_id]
+            self.loaded.move_to_end(channel_id)
+            return messages
+        except KeyError:
+            pass
+
+        with self.storage.lock:
+            if channel_id not in self.channel_ids:
+                raise KeyError(channel_id)
+            if channel_id not in self.loaded:
+                shard = get_shard('messages', (channel_id, None))
+                messages = self.storage.read_shard(shard, [])
+                # Shards written before message records were introduced hold dictionaries
+                if messages and not isinstance(messages[0], Message):
+                    messages = [to_message(message) for message in messages]
+                self.loaded[channel_id] = oldest_first(messages)
+                self.index_channel(channel_id, messages)
+                self.evict()
+            return self.loaded[channel_id]
+
+    def __getitem__(self, channel_id):
+        messages = self.history(channel_id)
+        if self.tombstones.get(channel_id):
+            return [i for i in messages if not isinstance(i, Tombstone)]
+        return messages
+
+    def __setitem__(self, channel_id, messages):
+        with self.storage.lock:
+            self.channel_ids[channel_id] = None
+            self.tombstones.pop(channel_id, None)
+            self.compactable.discard(channel_id)
+            self.loaded[channel_id] = messages
+            self.loaded.move_to_end(channel_id)
+            self.index_channel(channel_id, messages)
+            self.evict()
+
+    def __delitem__(self, channel_id):
+        with self.storage.lock:
+            del self.channel_ids[channel_id]
+            self.loaded.pop(channel_id, None)
+            self.by_id.pop(channel_id, None)
+            self.text_index.pop(channel_id, None)
+            self.tombstones.pop(channel_id, None)
+            self.compactable.discard(channel_id)
+            self.unindexed.discard(channel_id)
+            for message_id in [i for i, j in self.index.items() if j == channel_id]:
+                del self.index[message_id]
+
+    def __contains__(self, channel_id):
+        return channel_id in self.channel_ids
+
+    def __iter__(self):
+        return iter(list(self.channel_ids))
+
+    def __len__(self):
+        return len(self.channel_ids)
+
+    def evict(self):
+        '''
+        Evicts the least recently used channels whose shard is up to date until the cache holds
+        no more messages than its budget. The most recently used channel is never evicted.
+        '''
+        with self.storage.lock:
+            total = sum(len(messages) for messages in self.loaded.values())
+            for channel_id in list(self.loaded)[:-1]:
+                if total <= self.storage.message_cache_size:
+                    break
+                shard = get_shard('messages', (channel_id, None))
+                if shard in self.storage.dirty or shard in self.storage.pinned:
+                    continue
+                total -= len(self.loaded.pop(channel_id))
+                del self.by_id[channel_id]
+                self.text_index.pop(channel_id, None)
+                self.tombstones.pop(channel_id, None)
+                self.compactable.discard(channel_id)
+
+    def evict_text_indexes(self):
+        '''
+        Discards the least recently searched channels' trigram indexes until they hold no more
+        postings than their budget. The most recently searched channel's index is never
+        discarded.
+        '''
+        with self.storage.lock:
+            total = sum(text_index.size for text_index in self.text_index.values())
+            for channel_id in list(self.text_index)[:-1]:
+                if total <= self.storage.text_index_size:
+                    break
+                total -= self.text_index.pop(channel_id).size
+
+
+def apply_change(data, ids, table, key, value):
+    '''
+    Applies a change record to the given data and ID structures.
+
+    Parameters:
+        data (dict): data structure
+        ids (dict): ID structure
+        table (str): the part of the data structure that changed
+        key (int, str or tuple): identifies the changed entry within the table
+        value: the new value of the entry, or None if the entry was removed
+    '''
+    if table == 'ids':
+        ids[key] = value
+    elif table == 'users':
+        replace_entry(data['users'], 'u_id', key, value and upgrade_user(value))
+    elif table == 'tokens':
+        u_id, token = key
+        for user in data['users']:
+            if user['u_id'] == u_id and token in user['tokens']:
+                user['tokens'].remove(token)
+    elif table == 'channels':
+        data['channels'][key] = upgrade_channel(value)
+        if key not in data['messages']:
+            data['messages'][key] = []
+    elif table in ('standup', 'hangman'):
+        data['channels'][key][table] = value
+    elif table in ('all_members', 'owner_members'):
+        channel_id, u_id = key
+        members = data['channels'][channel_id][table]
+        if value is None:
+            if u_id in members:
+                members.remove(u_id)
+        elif u_id not in members:
+            members.append(u_id)
+    elif table == 'messages':
+        channel_id, message_id = key
+        if value is not None:
+            value = to_message(value)
+        data['messages'].set_message(channel_id, message_id, value)
+
+
+def replace_entry(entries, field, key, value):
+    '''
+    Replaces, adds or removes the entry of a list whose field matches the given key.
+
+    Parameters:
+        entries (list of dict): list of entries
+        field (str): the field identifying an entry
+        key (int): the value of the field for the entry
+        value (dict or None): the new entry, or None to remove the entry
+    '''
+    index = next((i for i, entry in enumerate(entries) if entry[field] == key), None)
+    if index is not None:
+        if value is None:
+            del entries[index]
+        else:
+            entries[index] = value
+    elif value is not None:
+        entries.append(value)
+
+
+def oldest_first(messages):
+    '''
+    Returns a message list in message ID order, reversing lists stored newest first before
+    messages were appended.
+
+    Parameters:
+        messages (list of Message): message list read from a shard
+
+    Returns:
+        (list of Message): the message list, oldest first
+    '''
+    if len(messages) > 1 and messages[0].message_id > messages[-1].message_id:
+        messages.reverse()
+    return messages
+
+
+class ChannelVersions:
+    '''
+    Versions of the messages of each channel. Versions are drawn from a counter shared by every
+    storage engine and are never given out twice, so a version identifies the state of a
+    channel's messages even across a reset or a change of engine. A channel takes a version the
+    first time it is read, and a new one each time it is updated.
+    '''
+    COUNTER = count(1)
+
+    def __init__(self):
+        self.versions = {}
+
+    def get(self, channel_ids):
+        '''
+        Returns the versions of the given channels as a tuple.
+        '''
+        versions = self.versions
+        for channel_id in channel_ids:
+            if channel_id not in versions:
+                versions[channel_id] = next(self.COUNTER)
+        return tuple(versions[channel_id] for channel_id in channel_ids)
+
+    def update(self, channel_id):
+        '''
+        Gives a channel a new version.
+        '''
+        self.versions[channel_id] = next(self.COUNTER)
+
+    def clear(self):
+        '''
+        Discards every channel's version.
+        '''
+        self.versions.clear()
+
+
+def partition_channels(sizes, number):
+    '''
+    Divides channels into at most the given number of partitions of similar total size, placing
+    each channel, largest first, in the partition with the smallest total so far.
+
+    Parameters:
+        sizes (dict of int: int): channel IDs to the size of their shards
+        number (int): number of partitions
+
+    Returns:
+        (list of list of int): channel IDs of each non-empty partition
+    '''
+    partitions = [[0, []] for _ in range(number)]
+    for channel_id in sorted(sizes, key=sizes.get, reverse=True):
+        partition = min(partitions, key=lambda entry: entry[0])
+        partition[0] += sizes[channel_id]
+        partition[1].append(channel_id)
+    return [channel_ids for _, channel_ids in partitions if channel_ids]
+
+
+# Message lists decoded by a search process, by the path of their shard, least recently searched
+# first, each with the identity of the file it was read from
+SHARD_CACHE = OrderedDict()
+
+def read_search_shard(path, cache_size):
+    '''
+    Returns the message list stored in a shard, oldest first. Runs in a search process, which
+    keeps the message lists it has decoded until their shard is replaced, discarding the least
+    recently searched once it holds more than cache_size messages.
+
+    Parameters:
+        path (str): path of the shard
+        cache_size (int): number of messages the search process may keep decoded
+
+    Returns:
+        (list of Message): the message list
+    '''
+    with open(path, 'rb') as FILE:
+        stat = os.fstat(FILE.fileno())
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = SHARD_CACHE.get(path)
+        if cached is not None and cached[0] == identity:
+            SHARD_CACHE.move_to_end(path)
+            return cached[1]
+        messages = pickle.load(FILE)
+
+    # Shards written before message records were introduced hold dictionaries
+    if messages and not isinstance(messages[0], Message):
+        messages = [to_message(message) for message in messages]
+    messages = oldest_first(messages)
+
+    SHARD_CACHE[path] = (identity, messages)
+    SHARD_CACHE.move_to_end(path)
+    total = sum(len(entry[1]) for entry in SHARD_CACHE.values())
+    for cached_path in list(SHARD_CACHE)[:-1]:
+        if total <= cache_size:
+            break
+        total -= len(SHARD_CACHE.pop(cached_path)[1])
+    return messages
+
+
+def search_shards(paths, cache_size, query_str, limit, before=None, u_id=None, time_start=None,
+                  time_end=None):
+    '''
+    Searches the message lists stored in the given shards, one shard at a time. Runs in a search
+    process. Takes the cache size of read_search_shard and the same filters as
+    DictStorage.search_channel_messages.
+
+    Returns:
+        (list of list of Message): the matching messages of each shard, newest first
+    '''
+    # pylint: disable=too-many-arguments
+    results = []
+    for path in paths:
+        messages = read_search_shard(path, cache_size)
+        low, high = time_window(messages, time_start, time_end)
+        if before is not None:
+            high = min(high, bisect_messages(messages, before))
+        newest_first = (messages[i] for i in range(high - 1, low - 1, -1))
+        results.append(list(filter_messages(newest_first, query_str, limit, u_id)))
+    return results
+
+
+def filter_messages(messages, query_str, limit, u_id=None):
+    '''
+    Yields up to limit of the given messages which contain the query string and were sent by
+    the given user, if any, skipping any which are None. Messages outside a search's time range
+    are left out by binary search before they are filtered.
+    '''
+    if limit <= 0:
+        return
+    for message in messages:
+        if message is None or query_str not in message.message:
+            continue
+        if u_id is not None and message.u_id != u_id:
+            continue
+        yield message
+        limit -= 1
+        if not limit:
+            return
+
+
+def walk_newest_first(messages, low, high):
+    '''
+    Yields the messages of a message list held oldest first between two indexes, newest
+    first, skipping tombstones. The list is read as the result is read rather than copied, so
+    a search stops reading once it has enough messages. A message inserted below the walk
+    shifts the list, so messages no older than the last one yielded are skipped.
+
+    Parameters:
+        messages (list of Message): message list, oldest first
+        low (int): index of the oldest message to yield
+        high (int): index after the newest message to yield
+    '''
+    last = None
+    for index in range(high - 1, low - 1, -1):
+        message = messages[index]
+        if isinstance(message, Tombstone) or last is not None and message.message_id >= last:
+            continue
+        last = message.message_id
+        yield message
+
+
+def page_messages(messages, limit, start=0, before=None, after=None):
+    '''
+    Returns a page of a message list held oldest first, newest first, found by binary search
+    when a cursor is given. Takes the same parameters and returns the same values as
+    DictStorage.get_channel_page.
+    '''
+    if after is not None:
+        low = bisect_messages(messages, after + 1)
+        high = min(low + limit, len(messages))
+        return messages[low:high][::-1], high < len(messages)
+
+    if before is not None:
+        high = bisect_messages(messages, before)
+    else:
+        high = max(len(messages) - start, 0)
+    low = max(high - limit, 0)
+    return messages[low:high][::-1], low > 0
+
+
+def remove_sessions(sessions, tokens):
+    '''
+    Removes the sessions of the given tokens.
+
+    Parameters:
+        sessions (dict): dictionary of tokens to sessions
+        tokens (iterable of str): tokens that were removed
+    '''
+    for token in tokens:
+        sessions.pop(token, None)
+
+
+def upgrade_user(user):
+    '''
+    Replaces the channel dictionaries in a user's channel lists, stored before channels were
+    referenced by ID, with their channel IDs.
+
+    Parameters:
+        user (dict): user dictionary
+
+    Returns:
+        (dict): the user dictionary
+    '''
+    for field in ('channel_membership', 'channel_ownership'):
+        user[field] = [channel['channel_id'] if isinstance(channel, dict) else channel
+                       for channel in user[field]]
+    return user
+
+
+def upgrade_channel(channel):
+    '''
+    Replaces the member dictionaries in a channel's member lists, stored before members were
+    referenced by ID, with their user IDs.
+
+    Parameters:
+        channel (dict): channel dictionary
+
+    Returns:
+        (dict): the channel dictionary
+    '''
+    for field in ('all_members', 'owner_members'):
+        channel[field] = [member['u_id'] if isinstance(member, dict) else member
+                          for member in channel[field]]
+    return channel
+
+
+def get_shard(table, key):
+    '''
+    Returns the name of the snapshot shard that stores the given table entry.
+
+    Parameters:
+        table (str): the part of the data structure
+        key (int, str or tuple): identifies the entry within the table
+
+    Returns:
+        (str): name of the shard
+    '''
+    if table in ('users', 'ids'):
+        return table
+    if table == 'tokens':
+        return 'users'
+    if table == 'messages':
+        return f"messages_{key[0]}"
+    return 'channels'
+
+
+def get_shards(data):
+    '''
+    Returns the names of all the shards of the given data structure.
+
+    Parameters:
+        data (dict): data structure
+
+    Returns:
+        (set of str): names of the shards
+    '''
+    shards = {'users', 'channels', 'ids'}
+    shards.update(get_shard('messages', (channel_id, None)) for channel_id in data['channels'])
+    return shards
+
+
+def write_file(path, contents):
+    '''
+    Atomically replaces a file with the given contents. The contents are written and synced to
+    a temporary file which is then renamed over the file, so a crash leaves either the old or
+    the new file in place.
+
+    Parameters:
+        path (str): path of the file
+        contents (bytes): new contents of the file
+    '''
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as FILE:
+        FILE.write(contents)
+        FILE.flush()
+        os.fsync(FILE.fileno())
+    os.replace(temp_path, path)
+
+    # Sync the directory so the rename itself survives a crash
+    try:
+        directory = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(directory)
+    except OSError:
+        pass
+    finally:
+        os.close(directory)
+
+
+#######################################
+#           SQLITE STORAGE            #
+#######################################
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    u_id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    handle_str TEXT NOT NULL,
+    name_first TEXT NOT NULL,
+    name_last TEXT NOT NULL,
+    password TEXT NOT NULL,
+    permission_id INTEGER NOT NULL,
+    profile_img_url TEXT,
+    reset_code TEXT,
+    keywords BLOB,
+    alerts BLOB
+);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE INDEX IF NOT EXISTS users_handle_str ON users (handle_str);
+CREATE INDEX IF NOT EXISTS users_reset_code ON users (reset_code);
+
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT PRIMARY KEY,
+    u_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tokens_u_id ON tokens (u_id);
+
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    is_public INTEGER NOT NULL,
+    standup BLOB NOT NULL,
+    hangman BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channels_is_public ON channels (is_public);
+
+CREATE TABLE IF NOT EXISTS memberships (
+    channel_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    u_id INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, role, u_id)
+);
+CREATE INDEX IF NOT EXISTS memberships_u_id ON memberships (u_id, role);
+
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    time_created INTEGER NOT NULL,
+    is_pinned INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel_id ON messages (channel_id, message_id);
+CREATE INDEX IF NOT EXISTS messages_time_created ON messages (channel_id, time_created);
+
+CREATE TABLE IF NOT EXISTS reacts (
+    message_id INTEGER NOT NULL,
+    react_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    PRIMARY KEY (message_id, react_id, u_id)
+);
+CREATE INDEX IF NOT EXISTS reacts_u_id ON reacts (u_id);
+
+CREATE TABLE IF NOT EXISTS ids (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+USER_FIELDS = ('u_id', 'email', 'handle_str', 'name_first', 'name_last', 'password',
+               'permission_id', 'profile_img_url', 'reset_code')
+
+# User fields stored pickled, and only present once they are set
+USER_LISTS = ('keywords', 'alerts')
+
+MESSAGE_FIELDS = ('message_id', 'channel_id', 'u_id', 'message', 'time_created', 'is_pinned')
+
+class SqliteStorage:
+    '''
+    Storage engine keeping all data in a local SQLite database.
+    '''
+    def __init__(self, path):
+        '''
+        Opens the database, creating its tables if they do not exist.
+
+        Parameters:
+            path (str): path of the database file
+        '''
+        self.path = path
+        self.lock = threading.RLock()
+
+        # Sessions of the tokens looked up so far
+        self.sessions = {}
+
+        # Version of each channel's messages
+        self.versions = ChannelVersions()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.executescript(SCHEMA)
+
+            # Databases created before keyword alerts lack their columns
+            columns = {row['name'] for row in self.connection.execute('PRAGMA table_info(users)')}
+            for field in USER_LISTS:
+                if field not in columns:
+                    self.connection.execute(f'ALTER TABLE users ADD COLUMN {field} BLOB')
+
+    def query(self, sql, parameters=()):
+        '''
+        Returns the rows selected by a query.
+        '''
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def is_empty(self):
+        '''
+        Returns True if nothing has been stored in the database.
+        '''
+        return not self.query('SELECT 1 FROM ids LIMIT 1')
+
+    def import_data(self, data, ids):
+        '''
+        Stores the given data and ID structures in the database.
+
+        Parameters:
+            data (dict): data structure
+            ids (dict): ID structure
+        '''
+        with self.lock, self.connection:
+            for key, value in ids.items():
+                self.write('ids', key, value)
+            for user in data['users']:
+                self.write('users', user['u_id'], user)
+            for channel_id, channel in data['channels'].items():
+                self.write('channels', channel_id, channel)
+            for channel_id, messages in data['messages'].items():
+                for message in messages:
+                    self.write('messages', (channel_id, message.message_id), message)
+            self.versions.clear()
+
+    ########## READING ##########
+
+    def get_data(self):
+        '''
+        Returns a copy of the whole data structure. Only used for debugging, as every row is
+        loaded into memory.
+        '''
+        channels = self.get_channels()
+        return {
+            'users': self.get_users(),
+            'channels': channels,
+            'messages': {channel_id: self.get_channel_messages(channel_id)
+                         for channel_id in channels},
+        }
+
+    def get_ids(self):
+        '''
+        Returns a copy of the ID structure.
+        '''
+        ids = dict(DEFAULT_IDS)
+        ids.update((row['name'], row['value']) for row in self.query('SELECT * FROM ids'))
+        return ids
+
+    def get_users(self):
+        '''
+        Returns a list of all users.
+        '''
+        return [self.make_user(row) for row in self.query('SELECT * FROM users ORDER BY u_id')]
+
+    def count_users(self):
+        '''
+        Returns the number of users.
+        '''
+        return self.query('SELECT COUNT(*) FROM users')[0][0]
+
+    def get_user(self, key, value):
+        '''
+        Returns the user whose field matches the given value, otherwise False.
+        '''
+        if key not in USER_FIELDS:
+            raise KeyError(key)
+        rows = self.query(f'SELECT * FROM users WHERE {key} = ? LIMIT 1', (value,))
+        return self.make_user(rows[0]) if rows else False
+
+    def get_session(self, token):
+        '''
+        Returns the session of the given token, otherwise None.
+        '''
+        with self.lock:
+            if token not in self.sessions:
+                rows = self.query('SELECT u_id FROM tokens WHERE token = ?', (token,))
+                if not rows:
+                    return None
+                self.sessions[token] = Session(rows[0]['u_id'])
+            return self.sessions[token]
+
+    def get_sessions(self):
+        '''
+        Returns a list of (token, session) pairs for every active token.
+        '''
+        with self.lock:
+            for row in self.query('SELECT token, u_id FROM tokens'):
+                if row['token'] not in self.sessions:
+                    self.sessions[row['token']] = Session(row['u_id'])
+            return list(self.sessions.items())
+
+    def is_used(self, key, value):
+        '''
+        Returns True if a user's field matches the given value, otherwise False.
+        '''
+        if key not in USER_FIELDS:
+            raise KeyError(key)
+        return bool(self.query(f'SELECT 1 FROM users WHERE {key} = ? LIMIT 1', (value,)))
+
+    def get_channels(self):
+        '''
+        Returns a dictionary of all channels.
+        '''
+        rows = self.query('SELECT * FROM channels ORDER BY channel_id')
+        return {row['channel_id']: self.make_channel(row) for row in rows}
+
+    def get_channel(self, channel_id):
+        '''
+        Returns the specified channel, otherwise None.
+        '''
+        rows = self.query('SELECT * FROM channels WHERE channel_id = ?', (channel_id,))
+        return self.make_channel(rows[0]) if rows else None
+
+    def get_user_channels(self, u_id, public=False):
+        '''
+        Returns the channels the user is a member of, in channel ID order.
+
+        Parameters:
+            u_id (int): user ID
+            public (bool): True to include every public channel
+
+        Returns:
+            (list of tuple): list of channel IDs (int) and names (str)
+        '''
+        sql = '''
+            SELECT channel_id, name FROM channels WHERE channel_id IN (
+                SELECT channel_id FROM memberships WHERE u_id = ? AND role = 'all_members'
+            )
+        '''
+        if public:
+            sql += ' UNION SELECT channel_id, name FROM channels WHERE is_public = 1'
+        rows = self.query(f'{sql} ORDER BY channel_id', (u_id,))
+        return [(row['channel_id'], row['name']) for row in rows]
+
+    def is_member(self, u_id, channel_id):
+        '''
+        Returns True if the user is a member of the specified channel, otherwise False.
+        '''
+        return self.has_role(channel_id, 'all_members', u_id)
+
+    def is_owner(self, u_id, channel_id):
+        '''
+        Returns True if the user is an owner of the specified channel, otherwise False.
+        '''
+        return self.has_role(channel_id, 'owner_members', u_id)
+
+    def has_role(self, channel_id, role, u_id):
+        '''
+        Returns True if the memberships table holds the given membership, otherwise False.
+        '''
+        return bool(self.query(
+            'SELECT 1 FROM memberships WHERE channel_id = ? AND role = ? AND u_id = ?',
+            (channel_id, role, u_id)
+        ))
+
+    def get_channel_messages(self, channel_id):
+        '''
+        Returns a list of the messages of the specified channel, oldest first.
+        '''
+        rows = self.query(
+            'SELECT * FROM messages WHERE channel_id = ? ORDER BY message_id', (channel_id,)
+        )
+        return [self.make_message(row) for row in rows]
+
+    def count_channel_messages(self, channel_id):
+        '''
+        Returns the number of messages in the specified channel.
+        '''
+        rows = self.query('SELECT COUNT(*) AS count FROM messages WHERE channel_id = ?',
+                          (channel_id,))
+        return rows[0]['count']
+
+    def get_channel_page(self, channel_id, limit, start=0, before=None, after=None):
+        '''
+        Returns a page of the messages of the specified channel, newest first, found through the
+        index on channel and message ID when a cursor is given.
+
+        Parameters:
+            channel_id (int): channel ID
+            limit (int): the most messages to return
+            start (int): number of the newest messages to skip when no cursor is given
+            before (int or None): return the newest messages with IDs below this message ID
+            after (int or None): return the oldest messages with IDs above this message ID
+
+        Returns:
+            (tuple): list of messages (list of Message) and whether there are more messages
+                beyond the page (bool)
+        '''
+        if after is not None:
+            rows = self.query(
+                'SELECT * FROM messages WHERE channel_id = ? AND message_id > ? '
+                'ORDER BY message_id LIMIT ?', (channel_id, after, limit + 1)
+            )
+            page = rows[:limit][::-1]
+        elif before is not None:
+            rows = self.query(
+                'SELECT * FROM messages WHERE channel_id = ? AND message_id < ? '
+                'ORDER BY message_id DESC LIMIT ?', (channel_id, before, limit + 1)
+            )
+            page = rows[:limit]
+        else:
+            rows = self.query(
+                'SELECT * FROM messages WHERE channel_id = ? '
+                'ORDER BY message_id DESC LIMIT ? OFFSET ?', (channel_id, limit + 1, start)
+            )
+            page = rows[:limit]
+        return [self.make_message(row) for row in page], len(rows) > limit
+
+    def search_channel_messages(self, channel_id, query_str, limit, before=None, u_id=None,
+                                time_start=None, time_end=None):
+        '''
+        Returns the messages of the specified channel containing the query string and matching
+        the filters, newest first. The query and filters are matched by SQLite within the
+        channel's rows, so only the matching messages are loaded. Takes the same parameters as
+        DictStorage.search_channel_messages.
+        '''
+        # pylint: disable=too-many-arguments
+        sql = 'SELECT * FROM messages WHERE channel_id = ? AND instr(message, ?) > 0'
+        parameters = [channel_id, query_str]
+        for condition, value in (('message_id < ?', before), ('u_id = ?', u_id),
+                                 ('time_created >= ?', time_start),
+                                 ('time_created <= ?', time_end)):
+            if value is not None:
+                sql += f" AND {condition}"
+                parameters.append(value)
+        rows = self.query(sql + ' ORDER BY message_id DESC LIMIT ?', parameters + [limit])
+        return iter([self.make_message(row) for row in rows])
+
+    def search_messages(self, channel_ids, query_str, limit, before=None, u_id=None,
+                        time_start=None, time_end=None):
+        '''
+        Returns the matches of a search in each of the specified channels. Each channel is
+        searched by SQLite, so there are no unloaded message lists to divide between search
+        processes. Takes the same parameters as search_channel_messages.
+
+        Returns:
+            (list of iterator of Message): the matching messages of each channel, newest first
+        '''
+        # pylint: disable=too-many-arguments
+        return [self.search_channel_messages(channel_id, query_str, limit, before, u_id,
+                                             time_start, time_end)
+                for channel_id in channel_ids]
+
+    def get_channel_versions(self, channel_ids):
+        '''
+        Returns the current versions of the messages of the specified channels.
+        '''
+        with self.lock:
+            return self.versions.get(channel_ids)
+
+    def get_last_message_id(self, channel_id):
+        '''
+        Returns the last message ID issued in the specified channel, otherwise None. It is read
+        from the newest message of the channel, unless the newest message was removed, when its
+        ID is kept in the ids table so it is not issued again.
+        '''
+        rows = self.query(
+            'SELECT MAX(message_id) AS message_id FROM ('
+            'SELECT MAX(message_id) AS message_id FROM messages WHERE channel_id = ? '
+            'UNION ALL SELECT value FROM ids WHERE name = ?)',
+            (channel_id, last_message_key(channel_id))
+        )
+        return rows[0]['message_id']
+
+    def get_channel_range(self, channel_id, time_start=None, time_end=None):
+        '''
+        Returns the messages of the specified channel sent between two times, inclusive, oldest
+        first, found through the index on channel and send time. The messages are read
+        RANGE_BATCH rows at a time as the result is read, each batch continuing from the send
+        time and message ID of the last message of the one before.
+        '''
+        last = None
+        while True:
+            sql = 'SELECT * FROM messages WHERE channel_id = ?'
+            parameters = [channel_id]
+            if last is not None:
+                sql += ' AND time_created >= ? AND (time_created > ? OR message_id > ?)'
+                parameters += [last.time_created, last.time_created, last.message_id]
+            elif time_start is not None:
+                sql += ' AND time_created >= ?'
+                parameters.append(time_start)
+            if time_end is not None:
+                sql += ' AND time_created <= ?'
+                parameters.append(time_end)
+            rows = self.query(sql + ' ORDER BY time_created, message_id LIMIT ?',
+                              parameters + [RANGE_BATCH])
+            for row in rows:
+                last = self.make_message(row)
+                yield last
+            if len(rows) < RANGE_BATCH:
+                return
+
+    def get_channel_by_message(self, message_id):
+        '''
+        Returns the channel ID of the channel containing the specified message, otherwise False.
+        '''
+        rows = self.query('SELECT channel_id FROM messages WHERE message_id = ?', (message_id,))
+        return rows[0]['channel_id'] if rows else False
+
+    def get_message(self, message_id):
+        '''
+        Returns the specified message, otherwise False.
+        '''
+        rows = self.query('SELECT * FROM messages WHERE message_id = ?', (message_id,))
+        return self.make_message(rows[0]) if rows else False
+
+    def make_user(self, row):
+        '''
+        Returns the user dictionary of a row of the users table.
+        '''
+        user = {field: row[field] for field in USER_FIELDS}
+        if user['reset_code'] is None:
+            del user['reset_code']
+        for field in USER_LISTS:
+            if row[field] is not None:
+                user[field] = pickle.loads(row[field])
+        user['tokens'] = [
+            token['token'] for token in
+            self.query('SELECT token FROM tokens WHERE u_id = ? ORDER BY rowid', (user['u_id'],))
+        ]
+        for role, field in (('all_members', 'channel_membership'),
+                            ('owner_members', 'channel_ownership')):
+            user[field] = [
+                channel['channel_id'] for channel in self.query(
+                    'SELECT channel_id FROM memberships WHERE u_id = ? AND role = ? '
+                    'ORDER BY channel_id', (user['u_id'], role)
+                )
+            ]
+        return user
+
+    def make_channel(self, row):
+        '''
+        Returns the channel dictionary of a row of the channels table.
+        '''
+        channel = {
+            'name': row['name'],
+            'is_public': bool(row['is_public']),
+            'standup': pickle.loads(row['standup']),
+            'hangman': pickle.loads(row['hangman']),
+        }
+        for role in ('all_members', 'owner_members'):
+            channel[role] = [
+                member['u_id'] for member in self.query(
+                    'SELECT u_id FROM memberships WHERE channel_id = ? AND role = ? '
+                    'ORDER BY rowid', (row['channel_id'], role)
+                )
+            ]
+        return channel
+
+    def make_message(self, row):
+        '''
+        Returns the message record of a row of the messages table.
+        '''
+        reacts = {}
+        for react in self.query(
+                'SELECT react_id, u_id FROM reacts WHERE message_id = ? ORDER BY rowid',
+                (row['message_id'],)
+        ):
+            reacts.setdefault(react['react_id'], {})[react['u_id']] = None
+
+        return Message(row['message_id'], row['u_id'], row['message'], row['time_created'],
+                       bool(row['is_pinned']), reacts or None)
+
+    ########## WRITING ##########
+
+    def save_change(self, table, key, value):
+        '''
+        Stores a change in the database.
+
+        Parameters:
+            table (str): the part of the data structure that changed
+            key (int, str or tuple): identifies the changed entry within the table
+            value: the new value of the entry, or None if the entry was removed
+        '''
+        with self.lock, self.connection:
+            self.write(table, key, value)
+            if table == 'messages':
+                self.versions.update(key[0])
+
+    def write(self, table, key, value):
+        '''
+        Executes the statements storing a change, without committing them.
+        '''
+        # pylint: disable=too-many-branches
+        execute = self.connection.execute
+        if table == 'ids':
+            execute('INSERT OR REPLACE INTO ids VALUES (?, ?)', (key, value))
+        elif table == 'tokens':
+            execute('DELETE FROM tokens WHERE u_id = ? AND token = ?', key)
+            remove_sessions(self.sessions, [key[1]])
+        elif table == 'users':
+            tokens = set(value['tokens']) if value is not None else set()
+            remove_sessions(self.sessions, [
+                row['token'] for row in execute('SELECT token FROM tokens WHERE u_id = ?', (key,))
+                if row['token'] not in tokens
+            ])
+            execute('DELETE FROM users WHERE u_id = ?', (key,))
+            execute('DELETE FROM tokens WHERE u_id = ?', (key,))
+            if value is not None:
+                execute(
+                    f"INSERT INTO users VALUES "
+                    f"({', '.join('?' * (len(USER_FIELDS) + len(USER_LISTS)))})",
+                    tuple(value.get(field) for field in USER_FIELDS) +
+                    tuple(pickle.dumps(value[field]) if field in value else None
+                          for field in USER_LISTS)
+                )
+                execute_many(execute, 'INSERT OR REPLACE INTO tokens VALUES (?, ?)',
+                             [(token, key) for token in value['tokens']])
+        elif table == 'channels':
+            execute(
+                'INSERT OR REPLACE INTO channels VALUES (?, ?, ?, ?, ?)',
+                (key, value['name'], value['is_public'], pickle.dumps(value['standup']),
+                 pickle.dumps(value['hangman']))
+            )
+            value = upgrade_channel(value)
+            execute('DELETE FROM memberships WHERE channel_id = ?', (key,))
+            for role in ('all_members', 'owner_members'):
+                execute_many(execute, 'INSERT INTO memberships VALUES (?, ?, ?)',
+                             [(key, role, u_id) for u_id in value[role]])
+        elif table in ('standup', 'hangman'):
+            execute(f'UPDATE channels SET {table} = ? WHERE channel_id = ?',
+                    (pickle.dumps(value), key))
+        elif table in ('all_members', 'owner_members'):
+            channel_id, u_id = key
+            if value is None:
+                execute('DELETE FROM memberships WHERE channel_id = ? AND role = ? AND u_id = ?',
+                        (channel_id, table, u_id))
+            else:
+                execute('INSERT OR IGNORE INTO memberships VALUES (?, ?, ?)',
+                        (channel_id, table, u_id))
+        elif table == 'messages':
+            channel_id, message_id = key
+            execute('DELETE FROM reacts WHERE message_id = ?', (message_id,))
+            if value is None:
+                # The ID of the newest message is kept once it is removed, so it is not issued
+                # again
+                newest = execute('SELECT MAX(message_id) AS message_id FROM messages '
+                                 'WHERE channel_id = ?', (channel_id,)).fetchone()
+                if newest['message_id'] == message_id:
+                    execute('INSERT OR REPLACE INTO ids VALUES (?, ?)',
+                            (last_message_key(channel_id), message_id))
+                execute('DELETE FROM messages WHERE message_id = ?', (message_id,))
+            else:
+                execute(
+                    'INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)',
+                    (message_id, channel_id, value.u_id, value.message, value.time_created,
+                     value.is_pinned)
+                )
+                execute_many(execute, 'INSERT OR IGNORE INTO reacts VALUES (?, ?, ?)', [
+                    (message_id, react_id, u_id)
+                    for react_id, u_ids in (value.reacts or {}).items() for u_id in u_ids
+                ])
+
+    def reset(self):
+        '''
+        Removes all data.
+        '''
+        with self.lock, self.connection:
+            self.sessions.clear()
+            self.versions.clear()
+            for table in ('users', 'tokens', 'channels', 'memberships', 'messages', 'reacts',
+                          'ids'):
+                self.connection.execute(f'DELETE FROM {table}')
+            for key, value in DEFAULT_IDS.items():
+                self.write('ids', key, value)
+
+    ########## PERSISTENCE ##########
+
+    def compact(self):
+        '''
+        Removed messages are deleted from the messages table through its index, so there are
+        no tombstones to compact.
+
+        Returns:
+            (int): 0
+        '''
+        return 0
+
+    def checkpoint(self, full=False):
+        '''
+        Every change is committed as it is saved, so a checkpoint only moves the database's
+        write-ahead log into the database file.
+
+        Parameters:
+            full (bool): unused
+
+        Returns:
+            (bool): True
+        '''
+        # pylint: disable=unused-argument
+        self.query('PRAGMA wal_checkpoint(PASSIVE)')
+        return True
+
+    def is_checkpoint_due(self):
+        '''
+        Returns False, as SQLite checkpoints its write-ahead log itself.
+        '''
+        return False
+
+    def get_stats(self):
+        '''
+        Returns statistics about the database.
+
+        Returns:
+            (dict): dictionary in the same form as DictStorage.get_stats, with the size of the
+                database file and of its write-ahead log
+        '''
+        wal_file = f"{self.path}-wal"
+        return {
+            'mode': 'sqlite',
+            'snapshots': 0,
+            'failures': 0,
+            'duration': None,
+            'size': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'lag': 0,
+            'dirty': 0,
+            'log_size': os.path.getsize(wal_file) if os.path.exists(wal_file) else 0,
+        }
+
+
+def execute_many(execute, sql, rows):
+    '''
+    Executes a statement once for each of the given rows.
+    '''
+    for row in rows:
+        execute(sql, row)
@@ -0,0 +1,153 @@
+'''
+Storage Tests
+By H09A-PADTHAI
+Submitted 19 April 2020
+'''
+import pytest
+from storage import SqliteStorage
+from data import get_data, get_id, set_storage, save_change
+from records import Message, new_message_id
+from auth import auth_register, auth_logout, auth_passwordreset_request, \
+    auth_passwordreset_reset
+from channels import channels_create, channels_list, channels_listall
+from channel import channel_invite, channel_details, channel_messages, channel_addowner, \
+    channel_removeowner, channel_leave, channel_messages_range
+from message import message_send, message_edit, message_remove, message_react, message_pin
+from standup import standup_start, standup_send
+from user import user_profile_setname
+from other import workplace_reset, admin_user_remove, users_all, search
+from helper import get_user
+from error import AccessError
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    '''
+    Creating a fixture to store data in a new SQLite database for the duration of a test
+    '''
+    storage = SqliteStorage(str(tmp_path / 'data.sqlite3'))
+    previous = set_storage(storage)
+    yield storage
+    set_storage(previous)
+
+
+def populate():
+    '''
+    Registers users and sends messages through every kind of change.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    user2 = auth_register('katara@gmail.com', 'ILoveWater', 'Katara', 'Waterbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    channels_create(user2['token'], 'Private Channel', False)
+    channel_invite(user1['token'], public['channel_id'], user2['u_id'])
+    channel_addowner(user1['token'], public['channel_id'], user2['u_id'])
+
+    message1 = message_send(user1['token'], public['channel_id'], 'Hello')
+    message2 = message_send(user2['token'], public['channel_id'], 'Hi')
+    message3 = message_send(user2['token'], public['channel_id'], 'Bye')
+    message_edit(user1['token'], message1['message_id'], 'Hello there')
+    message_react(user2['token'], message1['message_id'], 1)
+    message_pin(user1['token'], message2['message_id'])
+    message_remove(user2['token'], message3['message_id'])
+    standup_start(user1['token'], public['channel_id'], 200)
+    standup_send(user2['token'], public['channel_id'], 'Standing up')
+    return user1, user2, public
+
+
+def test_sqlite_requests(sqlite_storage):
+    '''
+    Tests that requests read their data from the SQLite engine.
+    '''
+    user1, user2, public = populate()
+    user_profile_setname(user2['token'], 'Kya', 'Waterbender')
+    assert get_user('u_id', user2['u_id'])['name_first'] == 'Kya'
+
+    details = channel_details(user1['token'], public['channel_id'])
+    assert [member['name_first'] for member in details['all_members']] == ['Aang', 'Kya']
+
+    messages = channel_messages(user2['token'], public['channel_id'], 0)['messages']
+    assert [message['message'] for message in messages] == ['Hi', 'Hello there']
+    assert messages[1]['reacts'][0]['is_this_user_reacted']
+    assert messages[0]['is_pinned']
+
+    # The ID of the removed newest message is not issued again
+    last_message_id = sqlite_storage.get_last_message_id(public['channel_id'])
+    assert last_message_id > messages[0]['message_id']
+    assert message_send(user1['token'], public['channel_id'], 'Again')['message_id'] > \
+        last_message_id
+
+    assert [i['message'] for i in search(user1['token'], 'Hello')['messages']] == \
+        ['Hello there']
+    assert len(channels_list(user2['token'])['channels']) == 2
+    assert [i['name'] for i in channels_list(user1['token'])['channels']] == ['Public Channel']
+    assert len(channels_listall(user1['token'])['channels']) == 2
+
+    channel_removeowner(user1['token'], public['channel_id'], user2['u_id'])
+    channel_leave(user2['token'], public['channel_id'])
+    details = channel_details(user1['token'], public['channel_id'])
+    assert [member['u_id'] for member in details['all_members']] == [user1['u_id']]
+    assert sqlite_storage.is_member(user1['u_id'], public['channel_id'])
+    assert not sqlite_storage.is_member(user2['u_id'], public['channel_id'])
+    assert not sqlite_storage.is_owner(user2['u_id'], public['channel_id'])
+
+    assert auth_logout(user2['token'])['is_success']
+    with pytest.raises(AccessError):
+        auth_logout(user2['token'])
+    admin_user_remove(user1['token'], user2['u_id'])
+    assert [i['u_id'] for i in users_all(user1['token'])['users']] == [user1['u_id']]
+
+
+def test_sqlite_password_reset(sqlite_storage):
+    '''
+    Tests that a reset code stored in the SQLite engine can be used once.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    auth_passwordreset_request('aang@gmail.com')
+    reset_code = get_user('u_id', user1['u_id'])['reset_code']
+
+    assert auth_passwordreset_reset(reset_code, 'ILoveFire') == {}
+    assert 'reset_code' not in get_user('u_id', user1['u_id'])
+    assert sqlite_storage.count_users() == 1
+
+
+def test_sqlite_range(sqlite_storage, monkeypatch):
+    '''
+    Tests that the messages in a time range are read in batches which continue where the
+    previous batch ended, including between messages sent in the same second.
+    '''
+    monkeypatch.setattr('storage.RANGE_BATCH', 2)
+    user1, _, public = populate()
+    message_ids = [None]
+    for i in range(7):
+        time_created = 1587000000 + 10 * (i // 2)
+        message_ids.append(new_message_id(public['channel_id'], time_created, message_ids[-1]))
+        save_change('messages', (public['channel_id'], message_ids[-1]),
+                    Message(message_ids[-1], user1['u_id'], f"Message {i}", time_created))
+
+    messages = channel_messages_range(user1['token'], public['channel_id'], 1587000000,
+                                      1587000025)['messages']
+    assert [message['message_id'] for message in messages] == message_ids[1:7]
+    assert [message.message for message in
+            sqlite_storage.get_channel_range(public['channel_id'], 1587000030, 1587000030)] == \
+        ['Message 6']
+
+
+def test_sqlite_import(tmp_path):
+    '''
+    Tests that data stored by the dictionary engine is imported unchanged into the SQLite engine.
+    '''
+    populate()
+    data, ids = get_data(), get_id()
+
+    storage = SqliteStorage(str(tmp_path / 'data.sqlite3'))
+    assert storage.is_empty()
+    storage.import_data(data, ids)
+    assert not storage.is_empty()
+
+    # A user's channels are stored in ID order
+    users = [dict(user, channel_membership=sorted(user['channel_membership']),
+                  channel_ownership=sorted(user['channel_ownership']))
+             for user in data['users']]
+    assert storage.get_data() == dict(data, users=users)
+    assert storage.get_ids() == ids
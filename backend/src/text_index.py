@@ -0,0 +1,177 @@
+'''
+Text Index
+By H09A-PADTHAI
+Submitted 19 April 2020
+
+An inverted index of the trigrams, the substrings of three characters, in a channel's messages,
+used to find the messages that may contain a search query without reading every message. Search
+matches a query anywhere in a message's text, punctuation and partial words included, and a
+message can only contain the query if it contains every trigram of the query:
+    query "ello"            messages containing both "ell" and "llo"
+    query "o, w"            messages containing "o, " and ", w"
+Queries shorter than three characters have no trigrams and would match nearly every message, so
+the index does not narrow them down, and they are searched by reading the channel's messages
+newest first until enough are found. The index returns candidates which may not contain the
+query itself, so each candidate is checked against the query before it is returned.
+
+Keyword alerts are matched by a KeywordMatcher, an Aho-Corasick automaton compiled from every
+subscribed keyword, which finds all the keywords in a message in a single pass over its text.
+'''
+from collections import deque
+
+TRIGRAM = 3
+
+def get_trigrams(text):
+    '''
+    Returns the set of trigrams in a message text.
+    '''
+    return {text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1)}
+
+
+class TrigramIndex:
+    '''
+    Inverted index of the trigrams in a channel's messages to the IDs of the messages containing
+    them. The text each message was indexed with is kept, so a message edited in place can have
+    its old trigrams removed. The number of postings, each a message ID held under one of its
+    trigrams, is counted as the index changes, as it is most of the index's memory.
+    '''
+    def __init__(self, messages=()):
+        '''
+        Parameters:
+            messages (list of Message): messages to index
+        '''
+        self.postings = {}
+        self.texts = {}
+        self.size = 0
+        for message in messages:
+            self.add(message.message_id, message.message)
+
+    def add(self, message_id, text):
+        '''
+        Adds a message to the index.
+        '''
+        self.texts[message_id] = text
+        trigrams = get_trigrams(text)
+        for trigram in trigrams:
+            self.postings.setdefault(trigram, set()).add(message_id)
+        self.size += len(trigrams)
+
+    def remove(self, message_id):
+        '''
+        Removes a message from the index.
+        '''
+        text = self.texts.pop(message_id, None)
+        if text is None:
+            return
+        trigrams = get_trigrams(text)
+        for trigram in trigrams:
+            posting = self.postings[trigram]
+            posting.discard(message_id)
+            if not posting:
+                del self.postings[trigram]
+        self.size -= len(trigrams)
+
+    def update(self, message_id, text):
+        '''
+        Indexes a message again if its text has changed since it was indexed.
+        '''
+        if self.texts.get(message_id) is text:
+            return
+        self.remove(message_id)
+        self.add(message_id, text)
+
+    def search(self, query_str):
+        '''
+        Returns the IDs of the messages which may contain the query string.
+
+        Parameters:
+            query_str (str): query string
+
+        Returns:
+            (set of int or None): message IDs of the candidate messages, None if the query is
+                shorter than a trigram so every message is a candidate
+        '''
+        if len(query_str) < TRIGRAM:
+            return None
+
+        # Intersect from the rarest trigram, so the candidates only shrink
+        postings = sorted((self.postings.get(trigram, set())
+                           for trigram in get_trigrams(query_str)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+        return candidates
+
+
+class KeywordMatcher:
+    '''
+    Aho-Corasick automaton of the keywords users are subscribed to. Each state is a prefix of a
+    keyword, with its transitions by character, the state of its longest suffix that is also a
+    prefix, and the keywords ending at it. Keywords are matched case insensitively anywhere in a
+    text.
+    '''
+    def __init__(self, subscriptions=()):
+        '''
+        Parameters:
+            subscriptions (iterable of tuple): (keyword, u_id) pairs of each user's keywords
+        '''
+        self.subscribers = {}
+        for keyword, u_id in subscriptions:
+            self.subscribers.setdefault(keyword.lower(), set()).add(u_id)
+
+        self.transitions = [{}]
+        self.fallbacks = [0]
+        self.outputs = [()]
+        for keyword in self.subscribers:
+            state = 0
+            for char in keyword:
+                if char not in self.transitions[state]:
+                    self.transitions[state][char] = len(self.transitions)
+                    self.transitions.append({})
+                    self.fallbacks.append(0)
+                    self.outputs.append(())
+                state = self.transitions[state][char]
+            self.outputs[state] += (keyword,)
+
+        # Breadth first, so each state's fallback is complete before its children's
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.transitions[state].items():
+                fallback = self.fallbacks[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fallbacks[fallback]
+                self.fallbacks[child] = self.transitions[fallback].get(char, 0)
+                self.outputs[child] += self.outputs[self.fallbacks[child]]
+                queue.append(child)
+
+    def match(self, text):
+        '''
+        Returns the keywords found in a text, by the users subscribed to them.
+
+        Parameters:
+            text (str): message text
+
+        Returns:
+            (dict of int: set): user IDs to the keywords (set of str) they are subscribed to
+                which were found in the text
+        '''
+        if not self.subscribers:
+            return {}
+
+        found = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in self.transitions[state]:
+                state = self.fallbacks[state]
+            state = self.transitions[state].get(char, 0)
+            if self.outputs[state]:
+                found.update(self.outputs[state])
+
+        matches = {}
+        for keyword in found:
+            for u_id in self.subscribers[keyword]:
+                matches.setdefault(u_id, set()).add(keyword)
+        return matches
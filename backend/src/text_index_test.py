@@ -0,0 +1,61 @@
+'''
+Text Index Tests
+By H09A-PADTHAI
+Submitted 19 April 2020
+'''
+from text_index import TrigramIndex
+from records import Message
+from data import get_storage
+from auth import auth_register
+from channels import channels_create
+from message import message_send, message_edit, message_remove
+from other import workplace_reset, search
+
+TEXTS = ['Hello there', 'hello world', 'A big dog', 'Big dogs bark', 'Well, hello!', 'Hi', '!']
+
+def test_trigram_index_candidates():
+    '''
+    Tests that the candidates of a query include every message containing it, however short,
+    and leave out messages missing any of its trigrams.
+    '''
+    messages = [Message(i, 1, text, 1587000000) for i, text in enumerate(TEXTS)]
+    index = TrigramIndex(messages)
+    queries = ['ell', 'hello', 'lo the', 'g dog', ', hel', 'Big', 'cat', 'o w']
+    for query in queries:
+        assert {i for i, text in enumerate(TEXTS) if query in text} <= index.search(query)
+    assert index.search('lo the') == {0}
+    assert index.search(', hel') == {4}
+    assert index.search('cat') == set()
+    assert index.search('ig') is None
+    assert index.search('') is None
+
+    index.update(0, 'Goodbye')
+    index.remove(4)
+    index.remove(6)
+    assert index.search('ello') == {1}
+    assert index.search('Good') == {0}
+    assert 'Hel' not in index.postings
+    assert index.size == sum(len(posting) for posting in index.postings.values())
+
+
+def test_trigram_index_search():
+    '''
+    Tests that search finds messages through the index as they are sent, edited and removed.
+    '''
+    workplace_reset()
+    user1 = auth_register('aang@gmail.com', 'ILoveAir', 'Aang', 'Airbender')
+    public = channels_create(user1['token'], 'Public Channel', True)
+    message_ids = [message_send(user1['token'], public['channel_id'], text)['message_id']
+                   for text in TEXTS]
+    assert [i['message_id'] for i in search(user1['token'], 'ello')['messages']] == \
+        [message_ids[4], message_ids[1], message_ids[0]]
+
+    message_edit(user1['token'], message_ids[1], 'goodbye world')
+    message_remove(user1['token'], message_ids[4])
+    assert [i['message_id'] for i in search(user1['token'], 'ello')['messages']] == \
+        [message_ids[0]]
+    assert [i['message_id'] for i in search(user1['token'], 'bye w')['messages']] == \
+        [message_ids[1]]
+    assert len(search(user1['token'], ' ')['messages']) == 4
+    assert next(get_storage().search_channel_messages(public['channel_id'], 'dog', 1)).message \
+        == 'Big dogs bark'
@@ -10,9 +10,10 @@ from urllib import request
 from PIL import Image
 from flask import Flask, url_for
 from helper import validate_token, validate_user, validate_name_size, validate_handle_size, \
-    validate_email_form, get_user, get_profile, is_used, check_valid_url, check_coords, \
-    check_image_type, get_channel_members, get_channel_owners
+    validate_email_form, validate_keyword_size, get_user, get_profile, is_used, check_valid_url, \
+    check_coords, check_image_type
 from error import InputError
+from data import save_change, get_storage, set_keyword_matcher, KEYWORD_LIMIT
 
 def user_profile(token, u_id):
     '''
@@ -56,9 +57,11 @@ def user_profile_setname(token, name_first, name_last):
     validate_name_size(name_last)
 
     # Change user's name
-    user = get_user('u_id', u_id)
-    user['name_first'] = name_first
-    user['name_last'] = name_last
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
+        user['name_first'] = name_first
+        user['name_last'] = name_last
+        save_change('users', u_id, user)
 
     return {}
 
@@ -77,13 +80,15 @@ def user_profile_setemail(token, email):
     u_id = validate_token(token)
     validate_email_form(email)
 
-    # InputError: email address is already being used by another user
-    if is_used('email', email):
-        raise InputError(description="Email is being used by another user")
+    with get_storage().lock:
+        # InputError: email address is already being used by another user
+        if is_used('email', email):
+            raise InputError(description="Email is being used by another user")
 
-    # Change user's email
-    user = get_user('u_id', u_id)
-    user['email'] = email
+        # Change user's email
+        user = get_user('u_id', u_id)
+        user['email'] = email
+        save_change('users', u_id, user)
 
     return {}
 
@@ -103,16 +108,106 @@ def user_profile_sethandle(token, handle_str):
     u_id = validate_token(token)
     validate_handle_size(handle_str)
 
-    # InputError: handle is already used by another user
-    if is_used('handle_str', handle_str):
-        raise InputError(description="Handle is being used by another user")
+    with get_storage().lock:
+        # InputError: handle is already used by another user
+        if is_used('handle_str', handle_str):
+            raise InputError(description="Handle is being used by another user")
 
-    # Change user's handle
-    user = get_user('u_id', u_id)
-    user['handle_str'] = handle_str
+        # Change user's handle
+        user = get_user('u_id', u_id)
+        user['handle_str'] = handle_str
+        save_change('users', u_id, user)
 
     return {}
 
+def user_keywords(token):
+    '''
+    Returns the keywords the authorised user is subscribed to.
+
+    Parameters:
+        token (str): user's authorisation key
+
+    Returns:
+        (dict of str: list): dictionary of list of keywords (str)
+    '''
+    u_id = validate_token(token)
+    return {'keywords': get_user('u_id', u_id).get('keywords', [])}
+
+def user_keywords_add(token, keyword):
+    '''
+    Subscribes the authorised user to a keyword, so an alert is added to their alert feed
+    whenever a message containing the keyword, in any case, is sent or edited in one of their
+    channels.
+
+    Parameters:
+        token (str): user's authorisation key
+        keyword (str): keyword to subscribe to
+
+    Returns:
+        (dict): empty dictionary
+    '''
+    # Check for errors
+    u_id = validate_token(token)
+    keyword = keyword.strip().lower()
+    validate_keyword_size(keyword)
+
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
+        keywords = user.get('keywords', [])
+        if keyword in keywords:
+            raise InputError(description="Already subscribed to keyword")
+        if len(keywords) >= KEYWORD_LIMIT:
+            raise InputError(description=f"Cannot subscribe to more than {KEYWORD_LIMIT} keywords")
+
+        # Subscribe user and compile the keyword matcher again
+        user['keywords'] = keywords + [keyword]
+        save_change('users', u_id, user)
+        set_keyword_matcher(None)
+
+    return {}
+
+def user_keywords_remove(token, keyword):
+    '''
+    Unsubscribes the authorised user from a keyword.
+
+    Parameters:
+        token (str): user's authorisation key
+        keyword (str): keyword to unsubscribe from
+
+    Returns:
+        (dict): empty dictionary
+    '''
+    # Check for errors
+    u_id = validate_token(token)
+    keyword = keyword.strip().lower()
+
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
+        if keyword not in user.get('keywords', []):
+            raise InputError(description="Not subscribed to keyword")
+
+        # Unsubscribe user and compile the keyword matcher again
+        user['keywords'] = [i for i in user['keywords'] if i != keyword]
+        save_change('users', u_id, user)
+        set_keyword_matcher(None)
+
+    return {}
+
+def user_alerts(token):
+    '''
+    Returns the authorised user's alert feed of messages containing their keywords.
+
+    Parameters:
+        token (str): user's authorisation key
+
+    Returns:
+        (dict of str: list): dictionary of list of alerts, newest first, each containing the
+            message ID, channel ID and sender's user ID (int), the keywords found (list of str)
+            and the time the message was sent (int)
+    '''
+    u_id = validate_token(token)
+    return {'alerts': get_user('u_id', u_id).get('alerts', [])[::-1]}
+
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-locals
 def user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end):
@@ -132,7 +227,6 @@ def user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end):
     '''
     x_start, y_start, x_end, y_end = int(x_start), int(y_start), int(x_end), int(y_end)
     u_id = validate_token(token)
-    user = get_user('u_id', u_id)
 
     check_valid_url(img_url)
     check_coords(x_start, y_start, x_end, y_end)
@@ -154,20 +248,9 @@ def user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end):
     # Save image locally
     image_location_name = f"./static/{name}"
     cropped_photo.save(os.path.abspath(image_location_name))
-    user['profile_img_url'] = url
-
-    # Save image in channel
-    for channel in user['channel_membership']:
-        channel_id = channel['channel_id']
-        channel_members = get_channel_members(channel_id)
-        member = next(i for i in channel_members if i['u_id'] == u_id)
-        member['profile_img_url'] = url
-
-
-    for channel in user['channel_ownership']:
-        channel_id = channel['channel_id']
-        channel_owners = get_channel_owners(channel_id)
-        owner = next(i for i in channel_owners if i['u_id'] == u_id)
-        owner['profile_img_url'] = url
+    with get_storage().lock:
+        user = get_user('u_id', u_id)
+        user['profile_img_url'] = url
+        save_change('users', u_id, user)
 
     return {}
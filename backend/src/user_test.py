@@ -5,9 +5,15 @@ Submitted 19 April 2020
 '''
 import pytest
 from user import user_profile, user_profile_setname, user_profile_setemail, \
-    user_profile_sethandle, user_profile_uploadphoto
+    user_profile_sethandle, user_profile_uploadphoto, user_keywords, user_keywords_add, \
+    user_keywords_remove, user_alerts
 from auth import auth_register
+from channels import channels_create
+from channel import channel_join
+from message import message_send, message_edit
 from other import workplace_reset
+from data import get_keyword_matcher, set_keyword_matcher, KEYWORD_LIMIT
+from text_index import KeywordMatcher
 from error import AccessError, InputError
 
 INVALID = 1024
@@ -216,6 +222,84 @@ def test_user_profile_sethandle_invalid():
     with pytest.raises(InputError):
         user_profile_sethandle(user1['token'], profile2['handle_str'])
 
+#######################################
+#           KEYWORD ALERTS            #
+#######################################
+
+def test_user_keywords_alerts():
+    '''
+    Tests that members subscribed to a keyword are alerted to messages sent or edited containing
+    it, in any case.
+    '''
+    workplace_reset()
+    user1 = auth_register('adumbledore@hogwarts.com', 'Fawkes', 'Albus', 'Dumbledore')
+    user2 = auth_register('hpotter@hogwarts.com', 'Quidditch', 'Harry', 'Potter')
+    user3 = auth_register('rweasley@hogwarts.com', 'Scabbers', 'Ron', 'Weasley')
+    channel = channels_create(user1['token'], 'Hogwarts', True)
+    channel_join(user2['token'], channel['channel_id'])
+
+    assert user_keywords_add(user2['token'], ' Snitch ') == {}
+    user_keywords_add(user2['token'], 'quid')
+    user_keywords_add(user3['token'], 'snitch')
+    user_keywords_add(user1['token'], 'snitch')
+    assert user_keywords(user2['token']) == {'keywords': ['snitch', 'quid']}
+
+    message1 = message_send(user1['token'], channel['channel_id'], 'Caught the SNITCH at Quidditch')
+    message2 = message_send(user1['token'], channel['channel_id'], 'Hello')
+    message_edit(user1['token'], message2['message_id'], 'Where is the snitch?')
+    alerts = user_alerts(user2['token'])['alerts']
+    assert [i['message_id'] for i in alerts] == [message2['message_id'], message1['message_id']]
+    assert alerts[1]['keywords'] == ['quid', 'snitch']
+    assert alerts[1]['u_id'] == user1['u_id']
+
+    # Editing a message does not alert a user to it again
+    message_edit(user1['token'], message1['message_id'], 'Caught the snitch again')
+    assert len(user_alerts(user2['token'])['alerts']) == 2
+
+    # Non-members and senders are not alerted, and unsubscribed keywords are not matched
+    assert user_alerts(user3['token']) == {'alerts': []}
+    assert user_alerts(user1['token']) == {'alerts': []}
+    assert user_keywords_remove(user2['token'], 'SNITCH') == {}
+    message_send(user1['token'], channel['channel_id'], 'Snitch')
+    assert len(user_alerts(user2['token'])['alerts']) == 2
+
+
+def test_user_keywords_stale_matcher():
+    '''
+    Tests that a keyword matcher compiled before the users' keywords changed is not kept.
+    '''
+    workplace_reset()
+    _, version = get_keyword_matcher()
+    stale = KeywordMatcher([('snitch', 1)])
+    set_keyword_matcher(None)
+    set_keyword_matcher(stale, version)
+    assert get_keyword_matcher() == (None, version + 1)
+    set_keyword_matcher(stale, version + 1)
+    assert get_keyword_matcher() == (stale, version + 1)
+
+
+def test_user_keywords_invalid():
+    '''
+    Tests that keywords must be valid and subscribed to only once.
+    '''
+    workplace_reset()
+    user1 = auth_register('adumbledore@hogwarts.com', 'Fawkes', 'Albus', 'Dumbledore')
+    with pytest.raises(InputError):
+        user_keywords_add(user1['token'], ' ')
+    with pytest.raises(InputError):
+        user_keywords_add(user1['token'], 'a' * 51)
+    with pytest.raises(InputError):
+        user_keywords_remove(user1['token'], 'snitch')
+    for i in range(KEYWORD_LIMIT):
+        user_keywords_add(user1['token'], f"keyword{i}")
+    with pytest.raises(InputError):
+        user_keywords_add(user1['token'], 'keyword0')
+    with pytest.raises(InputError):
+        user_keywords_add(user1['token'], 'snitch')
+    with pytest.raises(AccessError):
+        user_alerts(INVALID)
+
+
 ###################################################
 # Testing Core Function: user_profile_uploadphoto #
 ###################################################